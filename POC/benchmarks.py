@@ -0,0 +1,976 @@
+"""
+Offline benchmarks against the local service stand-ins in fakes.py.
+
+Run from the repository root, e.g.
+    python POC/benchmarks.py ingest --docs 2000
+"""
+import argparse
+import importlib.util
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'src' / 'shared' / 'python'))
+from clients import DEFERRED_SDKS
+from docs_to_embeddings import ingest_scheduler, upload_embeddings
+from fakes import DIMENSION, FakeEmbedder, FakeGemini, FakeIndex, FakeInferenceEndpoint, FakeLLM
+from scheduler import Scheduler, TokenBucket
+from vector_store import IVFVectorStore, LocalVectorStore, QuantizedVectorStore
+
+
+def percentiles(samples):
+    """
+    p50/p95/p99 and mean of a list of latencies, in milliseconds.
+    """
+    ms = np.asarray(samples) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'mean_ms': round(float(ms.mean()), 3),
+    }
+
+
+def random_unit_vectors(n, dimension=DIMENSION, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dimension), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def clustered_unit_vectors(n, clusters=200, noise=0.3, dimension=DIMENSION, seed=0):
+    """
+    Synthetic vectors grouped around random centres, closer to real
+    embedding distributions than uniform noise.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimension), dtype=np.float32)
+    vectors = centres[rng.integers(0, clusters, n)] + noise * rng.standard_normal((n, dimension), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def build_local_store(path, vectors, batch_size=10000, store_class=LocalVectorStore, **kwargs):
+    store = store_class(path, **kwargs)
+    for start in range(0, len(vectors), batch_size):
+        batch = vectors[start:start + batch_size]
+        store.upsert([(f'v{start + i}', v, None) for i, v in enumerate(batch)])
+    store.flush()
+    return store
+
+
+def time_queries(query_fn, queries, top_k):
+    samples = []
+    for q in queries:
+        started = time.perf_counter()
+        query_fn(q, top_k)
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+
+def synthetic_docs(n, length=300):
+    words = ['renard', 'aircraft', 'softball', 'olympics', 'pitcher', 'reconnaissance', 'engine', 'team']
+    return [' '.join(words[(i + j) % len(words)] for j in range(length // 8)) + f' {i}' for i in range(n)]
+
+
+def bench_ingest(args):
+    docs = synthetic_docs(args.docs)
+    configs = {
+        'serial': dict(embed_batch_size=1, upsert_batch_size=1, workers=1),
+        'batched': dict(embed_batch_size=args.embed_batch_size, upsert_batch_size=args.upsert_batch_size, workers=args.workers),
+    }
+    results = {}
+    for name, config in configs.items():
+        embedder = FakeEmbedder(latency=args.latency, jitter=args.latency / 4)
+        index = FakeIndex(latency=args.latency / 2, jitter=args.latency / 8)
+        scheduler = ingest_scheduler(config['embed_batch_size'], config['workers'], embed_quota=0, upsert_quota=0)
+        stats = upload_embeddings(docs, 'bench', index=index, embed=embedder, scheduler=scheduler, **config)
+        results[name] = {
+            'docs_per_sec': stats['docs_per_sec'],
+            'seconds': stats['seconds'],
+            'embed_calls': embedder.calls,
+            'upsert_calls': index.calls,
+        }
+    return results
+
+
+def bench_ratelimit(args):
+    """
+    Ingestion throughput against an embedder enforcing a quota per `period`.
+
+    'matched' configures the bucket with the service's real quota,
+    'over-configured' with twice it, so the scheduler has to back off on
+    429s, and 'retry-only' has no bucket and just honours Retry-After.
+    """
+    docs = synthetic_docs(args.docs)
+    quota_rate = args.quota / args.period
+    configs = {
+        'matched': args.quota,
+        'over-configured': args.quota * 2,
+        'retry-only': None,
+    }
+    results = {}
+    for name, quota in configs.items():
+        embedder = FakeEmbedder(latency=args.latency, quota=args.quota, period=args.period)
+        index = FakeIndex(latency=args.latency / 2)
+        bucket = TokenBucket(quota, period=args.period, burst=args.embed_batch_size) if quota else None
+        scheduler = Scheduler(
+            buckets={'embed': bucket},
+            concurrency={'embed': args.workers, 'upsert': args.workers},
+            max_rate_limited=100,
+            progress_interval=None
+        )
+        stats = upload_embeddings(docs, 'bench', index=index, embed=embedder, scheduler=scheduler,
+                                  embed_batch_size=args.embed_batch_size, workers=args.workers)
+        results[name] = {
+            'docs_per_sec': stats['docs_per_sec'],
+            'quota_utilisation': round(stats['docs_per_sec'] / quota_rate, 3),
+            'seconds': stats['seconds'],
+            'rate_limited': stats['rate_limited'],
+            'failed_batches': len(stats['failures']),
+            'peak_window_texts': embedder.peak_window,
+        }
+    return results
+
+
+def bench_vector_store(args):
+    results = {}
+    queries = random_unit_vectors(args.queries, seed=1)
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as path:
+            started = time.perf_counter()
+            store = build_local_store(path, random_unit_vectors(size))
+            build_seconds = time.perf_counter() - started
+            latency = time_queries(lambda q, k: store.query(q, top_k=k, include_metadata=True), queries, args.top_k)
+            results[size] = {'build_seconds': round(build_seconds, 2), **latency}
+            del store
+    return results
+
+
+def recall_at_k(exact, approximate):
+    hits = [len(set(e) & set(a)) / len(e) for e, a in zip(exact, approximate) if e]
+    return round(float(np.mean(hits)), 4)
+
+
+def bench_ann(args):
+    vectors = clustered_unit_vectors(args.size + args.queries)
+    corpus, queries = vectors[:args.size], vectors[args.size:]
+    results = {}
+    with tempfile.TemporaryDirectory() as path:
+        started = time.perf_counter()
+        store = build_local_store(path, corpus, store_class=IVFVectorStore, nlist=args.nlist, auto_train_min=0)
+        results['build_seconds'] = round(time.perf_counter() - started, 2)
+        results['nlist'] = store.nlist
+
+        exact_ids = [[m['id'] for m in LocalVectorStore.query(store, q, args.top_k).matches] for q in queries]
+        results['exact'] = time_queries(lambda q, k: LocalVectorStore.query(store, q, k), queries, args.top_k)
+        for nprobe in args.nprobe:
+            ann_ids = [[m['id'] for m in store.query(q, args.top_k, nprobe=nprobe).matches] for q in queries]
+            results[f'nprobe={nprobe}'] = {
+                f'recall@{args.top_k}': recall_at_k(exact_ids, ann_ids),
+                **time_queries(lambda q, k: store.query(q, k, nprobe=nprobe), queries, args.top_k)
+            }
+
+        started = time.perf_counter()
+        IVFVectorStore(path, read_only=True)
+        results['load_seconds'] = round(time.perf_counter() - started, 3)
+        del store
+    return results
+
+
+def bench_quantized(args):
+    vectors = clustered_unit_vectors(args.size + args.queries)
+    corpus, queries = vectors[:args.size], vectors[args.size:]
+    results = {}
+    with tempfile.TemporaryDirectory() as path:
+        exact = build_local_store(path, corpus)
+        exact_ids = [[m['id'] for m in exact.query(q, args.top_k).matches] for q in queries]
+        results['float32'] = {
+            'memory_bytes': corpus.nbytes,
+            **time_queries(lambda q, k: exact.query(q, k), queries, args.top_k)
+        }
+        del exact
+
+        for codec in ('float16', 'int8'):
+            for factor in args.rescore_factor:
+                store = QuantizedVectorStore(path, codec=codec, rescore_factor=factor)
+                store.query(queries[0], args.top_k)
+                ids = [[m['id'] for m in store.query(q, args.top_k).matches] for q in queries]
+                results[f'{codec} rescore x{factor}'] = {
+                    f'recall@{args.top_k}': recall_at_k(exact_ids, ids),
+                    'memory_bytes': store.memory_footprint()['codes_bytes'],
+                    **time_queries(lambda q, k: store.query(q, k), queries, args.top_k)
+                }
+                del store
+    return results
+
+
+def bench_answer_cache(args):
+    """
+    SemanticAnswerCache lookup latency for near-duplicate and new questions
+    at each cache size, against a full matrix-vector product over the keys.
+
+    Fails if a lookup's p95 reaches --max-ms or a near-duplicate misses.
+    """
+    from cache import SemanticAnswerCache
+
+    rng = np.random.default_rng(2)
+    results = {}
+    for size in args.sizes:
+        keys = clustered_unit_vectors(size + args.queries)
+        keys, fresh = keys[:size], keys[size:]
+        cache = SemanticAnswerCache(dimension=DIMENSION, max_size=size)
+        for i, key in enumerate(keys):
+            cache.store(key, str(i))
+
+        rows = rng.integers(0, size, args.queries)
+        duplicates = keys[rows] + args.noise * rng.standard_normal((args.queries, DIMENSION), dtype=np.float32)
+        duplicates /= np.linalg.norm(duplicates, axis=1, keepdims=True)
+        answers = [cache.lookup(q) for q in duplicates]
+        hit_rate = sum(answer == str(row) for answer, row in zip(answers, rows)) / args.queries
+
+        results[size] = {
+            'near_duplicate_hit_rate': round(hit_rate, 4),
+            'full_scan': time_queries(lambda q, k: (keys @ q).argmax(), fresh, None),
+            'hit': time_queries(lambda q, k: cache.lookup(q), duplicates, None),
+            'miss': time_queries(lambda q, k: cache.lookup(q), fresh, None),
+        }
+        for case in ('hit', 'miss'):
+            assert results[size][case]['p95_ms'] < args.max_ms, \
+                f"{case} lookup p95 at {size} entries is {results[size][case]['p95_ms']}ms"
+        assert hit_rate == 1.0, f"{hit_rate:.2%} of near-duplicate questions hit at {size} entries"
+    return results
+
+
+def synthetic_pdf(path, pages, seed=0):
+    """
+    Write a PDF with a title, section headers and paragraph text on every page.
+    """
+    import pymupdf
+
+    rng = np.random.default_rng(seed)
+    words = synthetic_docs(1, 2000)[0].split()
+    pdf = pymupdf.open()
+    for number in range(pages):
+        page = pdf.new_page()
+        y = 72
+        if number == 0:
+            page.insert_text((72, y), 'Synthetic Benchmark Document', fontsize=22)
+            y += 40
+        page.insert_text((72, y), f'Section {number}', fontsize=16)
+        y += 30
+        for _ in range(4):
+            text = ' '.join(rng.choice(words, size=60))
+            rect = pymupdf.Rect(72, y, 540, y + 130)
+            page.insert_textbox(rect, text.capitalize() + '.', fontsize=11)
+            y += 140
+    pdf.save(path)
+
+
+def bench_pdf(args):
+    from pdf_to_docs import get_docs, process_pdfs
+
+    results = {}
+    with tempfile.TemporaryDirectory() as path:
+        pdf = str(Path(path) / 'synthetic.pdf')
+        synthetic_pdf(pdf, args.pages)
+
+        serial_out = str(Path(path) / 'serial')
+        started = time.perf_counter()
+        get_docs(pdf, serial_out)
+        serial_seconds = time.perf_counter() - started
+        results['serial'] = {'seconds': round(serial_seconds, 2), 'pages_per_sec': round(args.pages / serial_seconds, 1)}
+        expected = Path(f'{serial_out}.json').read_bytes()
+
+        for workers in args.workers:
+            out = str(Path(path) / f'workers{workers}')
+            started = time.perf_counter()
+            process_pdfs([(pdf, out)], workers=workers, pages_per_task=args.pages_per_task)
+            seconds = time.perf_counter() - started
+            results[f'workers={workers}'] = {
+                'seconds': round(seconds, 2),
+                'pages_per_sec': round(args.pages / seconds, 1),
+                'identical': Path(f'{out}.json').read_bytes() == expected,
+            }
+    return results
+
+
+def synthetic_markdown(sections, paragraphs=6, seed=0, vocabulary=0):
+    rng = np.random.default_rng(seed)
+    words = ('retrieval', 'model', 'embedding', 'vector', 'index', 'latency', 'answer', 'context',
+             '**bold**', '_italic_', '[1]', '[[2]]', '[link](http://example.com)')
+    # Extra made-up words make paragraphs distinct, as in real documents
+    words += tuple(f'term{i}' for i in range(vocabulary))
+    parts = ['# Synthetic Document']
+    for s in range(sections):
+        parts.append(f'## Section {s}')
+        for p in range(paragraphs):
+            if p % 3 == 2:
+                parts.append('\n'.join(f'- **Item {i}** ' + ' '.join(rng.choice(words, 6)) for i in range(4)))
+            else:
+                parts.append(' '.join(rng.choice(words, 80)))
+        if s % 4 == 3:
+            parts.append('-----\n\n' + str(s))
+    return '\n\n'.join(parts)
+
+
+def bench_cleaning(args):
+    import pdf_to_docs
+
+    doc = synthetic_markdown(args.sections)
+    cleaned = pdf_to_docs.clean_page_breaks(doc)
+    index = pdf_to_docs.SectionIndex(cleaned)
+    subs = [sub for _, content in index.items() for sub in content.split('\n\n')]
+
+    stages = {
+        'clean_page_breaks': lambda: pdf_to_docs.clean_page_breaks(doc),
+        'section_index': lambda: pdf_to_docs.SectionIndex(cleaned),
+        'is_paragraph': lambda: [pdf_to_docs.is_paragraph(sub) for sub in subs],
+        'remove_references': lambda: [pdf_to_docs.remove_references(sub) for sub in subs],
+        'remove_links': lambda: [pdf_to_docs.remove_links(sub) for sub in subs],
+        'clean_formatting': lambda: [pdf_to_docs.clean_formatting(sub) for sub in subs],
+        'clean_paragraph': lambda: [pdf_to_docs.clean_paragraph(sub) for sub in subs],
+        'clean_sections': lambda: list(pdf_to_docs.clean_sections(index)),
+    }
+
+    results = {'chars': len(doc), 'sub_sections': len(subs)}
+    for name, stage in stages.items():
+        best = float('inf')
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            stage()
+            best = min(best, time.perf_counter() - started)
+        results[name] = {'ms': round(best * 1000, 2), 'mb_per_sec': round(len(doc) / best / 1e6, 1)}
+    return results
+
+
+def bench_dedup(args):
+    from dedup import dedup_chunks
+    from pdf_to_docs import write_docs
+
+    results = {}
+    with tempfile.TemporaryDirectory() as path:
+        for sections in args.sections:
+            out = str(Path(path) / f'docs{sections}')
+            write_docs(synthetic_markdown(sections, vocabulary=args.vocabulary), out)
+            texts = json.loads(Path(f'{out}.json').read_text())
+            _, report = dedup_chunks(texts, threshold=args.threshold, containment=args.containment)
+            report['us_per_chunk'] = round(report['seconds'] / len(texts) * 1e6, 1)
+            results[f'sections={sections}'] = report
+    return results
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process so far (ru_maxrss is KiB on Linux).
+    """
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def stage(samples, seconds=None, items=None):
+    """
+    Latency percentiles, throughput and peak RSS after a pipeline stage.
+    """
+    result = percentiles(samples)
+    result['count'] = len(samples)
+    if seconds:
+        result['per_sec'] = round((items if items is not None else len(samples)) / seconds, 2)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def timed(fn, samples):
+    """
+    Wrap `fn` so each call's latency is appended to `samples`.
+    """
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - started)
+    return wrapper
+
+
+def load_lambda_inference(index, embedder, llm):
+    """
+    Import the Lambda's inference module with every service client replaced
+    by a local stand-in.
+    """
+    spec = importlib.util.spec_from_file_location('lambda_inference', REPO_ROOT / 'src' / 'Inference' / 'inference.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.clients.register('vector_store', lambda: index)
+    module.clients.register('gemini', lambda: FakeGemini(embedder))
+    for name in module.GENERATION_MODELS:
+        module.clients.register(name, lambda: llm)
+    return module
+
+
+def bench_e2e(args):
+    from docs_to_embeddings import read_docs, upload_embeddings
+    from main import PDFS, QUESTIONS
+    from pdf_to_docs import get_docs
+
+    results = {}
+    with tempfile.TemporaryDirectory() as path:
+        pdfs = [REPO_ROOT / pdf for pdf in (args.pdfs or PDFS) if (REPO_ROOT / pdf).exists()]
+        results['workload'] = {'pdfs': [p.name for p in pdfs], 'questions': len(QUESTIONS), 'iterations': args.iterations}
+        if not pdfs:
+            # The bundled PDFs aren't in every checkout
+            pdfs = [Path(path) / 'synthetic.pdf']
+            synthetic_pdf(str(pdfs[0]), args.pages)
+            results['workload']['pdfs'] = [f'synthetic ({args.pages} pages)']
+
+        samples = []
+        started = time.perf_counter()
+        outputs = []
+        for i, pdf in enumerate(pdfs):
+            out = str(Path(path) / f'docs{i}')
+            timed(get_docs, samples)(str(pdf), out)
+            outputs.append((pdf.stem, read_docs(f'{out}.json')))
+        results['get_docs'] = stage(samples, time.perf_counter() - started)
+
+        embedder = FakeEmbedder(latency=args.embed_latency, jitter=args.jitter)
+        index = FakeIndex(latency=args.vector_latency, jitter=args.jitter)
+        embed_samples, upload_samples = [], []
+        embed = timed(embedder, embed_samples)
+        started = time.perf_counter()
+        for key, docs in outputs:
+            timed(upload_embeddings, upload_samples)(docs, key, index=index, embed=embed, cache=None,
+                                                     scheduler=ingest_scheduler(embed_quota=0, upsert_quota=0))
+        seconds = time.perf_counter() - started
+        results['embed_batch'] = stage(embed_samples)
+        results['upload_embeddings'] = stage(upload_samples, seconds, items=sum(len(docs) for _, docs in outputs))
+
+        llm = FakeLLM(latency=args.llm_latency, jitter=args.jitter, chunk_latency=args.chunk_latency)
+        inference = load_lambda_inference(index, embedder, llm)
+
+        def cold(fn):
+            # Without --warm every call misses the answer and question embedding caches
+            def run(question):
+                if not args.warm:
+                    inference.clients.get('answer_cache').invalidate()
+                    inference.clients.get('embedding_cache').local.clear()
+                return fn(question)
+            return run
+
+        def first_chunk(question):
+            return next(inference.answer_question(question, stream=True))
+
+        def handler(question):
+            return inference.lambda_handler({'body': json.dumps({'question': question})}, None)
+
+        drivers = {
+            'create_context': inference.create_context,
+            'answer_question': inference.answer_question,
+            'answer_question_first_chunk': first_chunk,
+            'lambda_handler': handler,
+        }
+        for name, fn in drivers.items():
+            samples = []
+            run = timed(cold(fn), samples)
+            started = time.perf_counter()
+            for _ in range(args.iterations):
+                for question in QUESTIONS:
+                    run(question)
+            results[name] = stage(samples, time.perf_counter() - started)
+    return results
+
+
+def bench_lexical(args):
+    """
+    Retrieval latency of the vector, lexical and hybrid modes, and how much
+    the lexical fast path saves, over chunks of synthetic documents.
+
+    The chunks are deduplicated as in POC/main.py. Half the questions
+    quote a few consecutive words of one chunk (exact terms, like a
+    designation or a name); the rest are random vocabulary.
+    """
+    from dedup import dedup_chunks
+    from lexical_index import BM25Index
+    from pdf_to_docs import write_docs
+
+    results = {}
+    with tempfile.TemporaryDirectory() as path:
+        out = str(Path(path) / 'docs')
+        write_docs(synthetic_markdown(args.sections, vocabulary=args.vocabulary), out)
+        texts, _ = dedup_chunks(json.loads(Path(f'{out}.json').read_text()))
+        ids = [f'bench_{i}' for i in range(len(texts))]
+
+        started = time.perf_counter()
+        lexical = BM25Index.build(ids, texts)
+        build_seconds = time.perf_counter() - started
+        lexical.save(str(Path(path) / 'lexical.npz'))
+        results['index'] = {
+            'chunks': len(texts),
+            'terms': len(lexical.terms),
+            'postings': int(lexical.offsets[-1]),
+            'build_seconds': round(build_seconds, 3),
+            'file_mb': round((Path(path) / 'lexical.npz').stat().st_size / 1e6, 2),
+        }
+
+        embedder = FakeEmbedder(latency=args.embed_latency)
+        index = FakeIndex(latency=args.vector_latency)
+        upload_embeddings(texts, 'bench', index=index, embed=embedder, cache=None,
+                          scheduler=ingest_scheduler(embed_quota=0, upsert_quota=0))
+        inference = load_lambda_inference(index, embedder, FakeLLM(latency=0.0, chunk_latency=0.0))
+        inference.clients.register('lexical_index', lambda: lexical)
+
+    rng = np.random.default_rng(0)
+    vocabulary = sorted(lexical.terms)
+    questions = []
+    for i in range(args.questions):
+        if i % 2 == 0:
+            row = int(rng.integers(len(texts)))
+            words = texts[row].split()
+            start = int(rng.integers(max(1, len(words) - args.question_words)))
+            questions.append((' '.join(words[start:start + args.question_words]), ids[row]))
+        else:
+            questions.append((' '.join(rng.choice(vocabulary, args.question_words)), None))
+
+    started = time.perf_counter()
+    for question, _ in questions:
+        lexical.query(question)
+    results['lexical_query_ms'] = round((time.perf_counter() - started) / len(questions) * 1000, 3)
+
+    fast = [(q, source) for q, source in questions if inference.lexical_is_confident(lexical.query(q))]
+    results['fast_path'] = {
+        'confidence': inference.LEXICAL_FAST_PATH_CONFIDENCE,
+        'margin': inference.LEXICAL_FAST_PATH_MARGIN,
+        'rate': round(len(fast) / len(questions), 3),
+        # Share of fast-path answers whose top chunk is the quoted one
+        'precision': round(sum(1 for q, source in fast if lexical.query(q, top_k=1).matches[0]['id'] == source)
+                           / len(fast), 3) if fast else None,
+    }
+
+    modes = {
+        'vector': ('vector', 0),
+        'lexical': ('lexical', 0),
+        'hybrid': ('hybrid', 0),
+        'hybrid_fast_path': ('hybrid', inference.LEXICAL_FAST_PATH_CONFIDENCE),
+    }
+    for name, (mode, confidence) in modes.items():
+        inference.RETRIEVAL_MODE = mode
+        inference.LEXICAL_FAST_PATH_CONFIDENCE = confidence
+        samples = []
+        for question, _ in questions:
+            # Every call misses the answer and question embedding caches
+            inference.clients.get('answer_cache').invalidate()
+            inference.clients.get('embedding_cache').local.clear()
+            timed(inference.answer_question, samples)(question)
+        results[name] = stage(samples)
+    # Mean milliseconds saved per question; the median may or may not take the fast path
+    results['fast_path']['mean_saved'] = round(results['hybrid']['mean_ms'] - results['hybrid_fast_path']['mean_ms'], 2)
+    return results
+
+
+def bench_context(args):
+    """
+    Prompt context tokens before and after assembly, for matches ranked by
+    BM25 over the chunks of synthetic documents, with and without dedup.
+
+    Each question quotes a few words of one chunk; `covered` is the share
+    of contexts that still contain the quote and `repeated` the share of
+    the context's word trigrams that repeat an earlier one.
+    """
+    from context_assembly import assemble_context
+    from dedup import dedup_chunks
+    from lexical_index import BM25Index
+    from pdf_to_docs import write_docs
+
+    with tempfile.TemporaryDirectory() as path:
+        out = str(Path(path) / 'docs')
+        write_docs(synthetic_markdown(args.sections, vocabulary=args.vocabulary), out)
+        chunks = json.loads(Path(f'{out}.json').read_text())
+
+    def normalize(text):
+        return ' '.join(text.lower().split())
+
+    def repeated(text):
+        words = re.findall(r'\w+', text.lower())
+        grams = list(zip(words, words[1:], words[2:]))
+        return 1 - len(set(grams)) / len(grams) if grams else 0.0
+
+    results = {}
+    for corpus, texts in (('raw', chunks), ('dedup', dedup_chunks(chunks)[0])):
+        ids = [f'bench_{i}' for i in range(len(texts))]
+        lexical = BM25Index.build(ids, texts)
+        rng = np.random.default_rng(0)
+        totals = {'raw_tokens': 0, 'top5_tokens': 0, 'tokens': 0, 'merged': 0, 'dropped': 0, 'raw_covered': 0, 'covered': 0,
+                  'raw_repeated': 0.0, 'repeated': 0.0}
+        seconds = 0.0
+        for _ in range(args.questions):
+            words = texts[int(rng.integers(len(texts)))].split()
+            start = int(rng.integers(max(1, len(words) - args.question_words)))
+            quote = normalize(' '.join(words[start:start + args.question_words]))
+            matches = lexical.query(quote, top_k=args.candidates).matches
+
+            started = time.perf_counter()
+            assembled = assemble_context(matches, max_tokens=args.budget)
+            seconds += time.perf_counter() - started
+            raw = ' '.join(m['metadata']['text'] for m in matches[:5])
+            for text, prefix in ((raw, 'raw_'), (assembled.text, '')):
+                totals[f'{prefix}covered'] += quote in normalize(text)
+                totals[f'{prefix}repeated'] += repeated(text)
+            totals['raw_tokens'] += assembled.raw_tokens
+            # Assembling only the matches the old context used isolates the overlap collapsing
+            totals['top5_tokens'] += assemble_context(matches[:5], max_tokens=args.budget).tokens
+            totals['tokens'] += assembled.tokens
+            totals['merged'] += assembled.merged
+            totals['dropped'] += assembled.dropped
+        results[corpus] = {
+            'chunks': len(texts),
+            'raw_tokens_mean': round(totals['raw_tokens'] / args.questions, 1),
+            'top5_tokens_mean': round(totals['top5_tokens'] / args.questions, 1),
+            'tokens_mean': round(totals['tokens'] / args.questions, 1),
+            'merged_mean': round(totals['merged'] / args.questions, 2),
+            'dropped_mean': round(totals['dropped'] / args.questions, 2),
+            'raw_covered': round(totals['raw_covered'] / args.questions, 3),
+            'covered': round(totals['covered'] / args.questions, 3),
+            'raw_repeated': round(totals['raw_repeated'] / args.questions, 3),
+            'repeated': round(totals['repeated'] / args.questions, 3),
+            'assemble_ms': round(seconds / args.questions * 1000, 3),
+        }
+    return results
+
+
+def bench_docstore(args):
+    """
+    Vector query payloads and latency with chunk text stored as metadata
+    versus id-only queries resolved from the local docstore.
+    """
+    from docstore import DocStore
+    from pdf_to_docs import write_docs
+
+    with tempfile.TemporaryDirectory() as path:
+        out = str(Path(path) / 'docs')
+        write_docs(synthetic_markdown(args.sections, vocabulary=args.vocabulary), out)
+        texts = json.loads(Path(f'{out}.json').read_text())
+        ids = [f'bench_{i}' for i in range(len(texts))]
+
+        store_path = str(Path(path) / 'docstore')
+        DocStore.write(store_path, zip(ids, texts))
+        started = time.perf_counter()
+        store = DocStore(store_path)
+        open_ms = (time.perf_counter() - started) * 1000
+
+        bandwidth = args.bandwidth_mbps * 1e6 if args.bandwidth_mbps else None
+        embedder = FakeEmbedder(latency=0.0)
+        indexes = {}
+        for name, text_metadata in (('metadata', True), ('docstore', False)):
+            indexes[name] = FakeIndex(latency=args.vector_latency, bytes_per_sec=bandwidth)
+            upload_embeddings(texts, 'bench', ids=ids, index=indexes[name], embed=embedder, cache=None,
+                              scheduler=ingest_scheduler(embed_quota=0, upsert_quota=0), text_metadata=text_metadata)
+
+        results = {
+            'chunks': len(texts),
+            'metadata_storage_mb': round(sum(len(json.dumps({'text': t})) for t in texts) / 1e6, 2),
+            'docstore_mb': round(store.size_bytes() / 1e6, 2),
+            'docstore_open_ms': round(open_ms, 3),
+        }
+        queries = random_unit_vectors(args.queries, seed=1)
+        resolve_samples = []
+
+        def with_metadata(query):
+            return [m['metadata']['text'] for m in indexes['metadata'].query(vector=[query], top_k=args.top_k, include_metadata=True).matches]
+
+        def ids_only(query):
+            matches = indexes['docstore'].query(vector=[query], top_k=args.top_k, include_metadata=False).matches
+            found = timed(store.get_many, resolve_samples)(m['id'] for m in matches)
+            return [found[m['id']] for m in matches]
+
+        for name, fn in (('metadata', with_metadata), ('docstore', ids_only)):
+            samples = []
+            sent = indexes[name].bytes_sent
+            for query in queries.tolist():
+                timed(fn, samples)(query)
+            results[name] = percentiles(samples)
+            results[name]['payload_bytes_mean'] = round((indexes[name].bytes_sent - sent) / len(queries))
+        results['docstore']['resolve_ms_mean'] = round(float(np.mean(resolve_samples)) * 1000, 4)
+        assert with_metadata(queries[0].tolist()) == ids_only(queries[0].tolist())
+        store.close()
+    return results
+
+
+def load_cli():
+    """
+    Import src/main.py, the client CLI, which shares its name with POC/main.py.
+    """
+    spec = importlib.util.spec_from_file_location('cli_main', REPO_ROOT / 'src' / 'main.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_bulk(args):
+    """
+    Questions per second of the CLI's bulk mode against a local inference
+    endpoint stand-in, versus one bare requests.post per question in turn
+    as `--query` sends them.
+    """
+    import io
+    import requests
+
+    cli = load_cli()
+    items = [{'id': i, 'question': f'Benchmark question {i}?'} for i in range(args.questions)]
+    results = {}
+    with FakeInferenceEndpoint(latency=args.latency, jitter=args.jitter) as endpoint:
+        samples = []
+        connections = endpoint.connections
+        started = time.perf_counter()
+        for item in items[:args.serial_questions]:
+            timed(requests.post, samples)(endpoint.url, json={'question': item['question']}, timeout=60)
+        results['serial'] = stage(samples, time.perf_counter() - started)
+        results['serial']['connections'] = endpoint.connections - connections
+
+        for concurrency in args.concurrency:
+            for batch_size in args.batch_size:
+                connections = endpoint.connections
+                summary = cli.bulk_query(items, io.StringIO(), endpoint.url, concurrency, batch_size)
+                assert summary['answered'] == len(items), summary
+                results[f'concurrency={concurrency},batch={batch_size}'] = {
+                    'questions_per_sec': summary['questions_per_sec'],
+                    'request_p50_ms': summary['latency_ms']['p50'],
+                    'request_p95_ms': summary['latency_ms']['p95'],
+                    'requests': summary['requests'],
+                    'connections': endpoint.connections - connections,
+                }
+    return results
+
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| *(\S+)$', re.MULTILINE)
+STARTUP_END = '-- startup imports end --'
+
+
+def import_profile(statement, runs):
+    """
+    Median cumulative import time in milliseconds of every module imported by
+    `statement`, run `runs` times in fresh interpreters with the Lambda's
+    module path, plus the statement's stdout from the last run. Modules
+    imported by interpreter startup are left out.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [
+        str(REPO_ROOT / 'src' / 'Inference'),
+        str(REPO_ROOT / 'src' / 'shared' / 'python'),
+        os.environ.get('PYTHONPATH')
+    ])))
+    samples = {}
+    for _ in range(runs):
+        code = f'import sys; sys.stderr.write("{STARTUP_END}\\n"); {statement}'
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                                 env=env, capture_output=True, text=True, check=True)
+        for _, cumulative, module in IMPORTTIME_LINE.findall(process.stderr.split(STARTUP_END, 1)[1]):
+            samples.setdefault(module, []).append(int(cumulative) / 1000)
+    return {module: float(np.median(times)) for module, times in samples.items()}, process.stdout
+
+
+def bench_coldstart(args):
+    """
+    Import-time profile of the inference handler, per top-level module, and
+    the import cost of the SDKs it defers to first use or a warm-up event.
+
+    Fails if importing the handler pulls in any of DEFERRED_SDKS.
+    """
+    statement = ('import inference, json, sys; '
+                 f'print(json.dumps([m for m in {DEFERRED_SDKS!r} if m in sys.modules]))')
+    profile, stdout = import_profile(statement, args.runs)
+    imported = json.loads(stdout)
+    assert not imported, f"Importing the handler imported {', '.join(imported)}"
+
+    modules = sorted(((m, ms) for m, ms in profile.items() if '.' not in m and ms >= args.min_ms),
+                     key=lambda item: item[1], reverse=True)
+    deferred, _ = import_profile('import ' + ', '.join(DEFERRED_SDKS), args.runs)
+    return {
+        'runs': args.runs,
+        'handler_import_ms': round(profile['inference'], 3),
+        'modules': {f'{m}_ms': round(ms, 3) for m, ms in modules[:args.top]},
+        'deferred': {f'{m}_ms': round(deferred[m], 3) for m in DEFERRED_SDKS if m in deferred},
+    }
+
+
+# Metrics where a larger value is a regression; per_sec is the reverse
+LOWER_IS_BETTER = ('_ms', 'seconds', 'peak_rss_mb')
+
+
+def compare(results, baseline, tolerance, path=''):
+    """
+    Metrics in `results` that are more than `tolerance` (relative) worse
+    than the same metric in `baseline`.
+    """
+    regressions = []
+    for key, value in results.items():
+        name = f'{path}.{key}' if path else key
+        before = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            regressions.extend(compare(value, before or {}, tolerance, name))
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) \
+                or isinstance(before, bool) or not isinstance(before, (int, float)) or not before:
+            continue
+        change = (value - before) / before
+        if key.endswith('per_sec'):
+            change = -change
+        elif not key.endswith(LOWER_IS_BETTER):
+            continue
+        if change > tolerance:
+            regressions.append({'metric': name, 'baseline': before, 'current': value, 'change': round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline pipeline benchmarks')
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    ingest = sub.add_parser('ingest', help='serial vs batched upload_embeddings')
+    ingest.add_argument('--docs', type=int, default=1000)
+    ingest.add_argument('--latency', type=float, default=0.05, help='simulated service latency in seconds')
+    ingest.add_argument('--embed-batch-size', type=int, default=100)
+    ingest.add_argument('--upsert-batch-size', type=int, default=100)
+    ingest.add_argument('--workers', type=int, default=4)
+    ingest.set_defaults(run=bench_ingest)
+
+    ratelimit = sub.add_parser('ratelimit', help='scheduler throughput and 429s against a quota-enforcing embedder')
+    ratelimit.add_argument('--docs', type=int, default=10000)
+    ratelimit.add_argument('--quota', type=int, default=2000, help='texts the fake embedder accepts per period')
+    ratelimit.add_argument('--period', type=float, default=1.0, help='quota window in seconds, scaled down from a minute')
+    ratelimit.add_argument('--latency', type=float, default=0.05)
+    ratelimit.add_argument('--embed-batch-size', type=int, default=100)
+    ratelimit.add_argument('--workers', type=int, default=4)
+    ratelimit.set_defaults(run=bench_ratelimit)
+
+    vector_store = sub.add_parser('vector-store', help='exact local vector store query latency')
+    vector_store.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    vector_store.add_argument('--queries', type=int, default=200)
+    vector_store.add_argument('--top-k', type=int, default=5)
+    vector_store.set_defaults(run=bench_vector_store)
+
+    ann = sub.add_parser('ann', help='IVF recall@k vs latency against exact search')
+    ann.add_argument('--size', type=int, default=200000)
+    ann.add_argument('--nlist', type=int, default=None, help='defaults to 4 * sqrt(size)')
+    ann.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    ann.add_argument('--queries', type=int, default=200)
+    ann.add_argument('--top-k', type=int, default=5)
+    ann.set_defaults(run=bench_ann)
+
+    quantized = sub.add_parser('quantized', help='int8/float16 codes with re-scoring: memory, recall and latency')
+    quantized.add_argument('--size', type=int, default=100000)
+    quantized.add_argument('--rescore-factor', type=int, nargs='+', default=[1, 4])
+    quantized.add_argument('--queries', type=int, default=200)
+    quantized.add_argument('--top-k', type=int, default=5)
+    quantized.set_defaults(run=bench_quantized)
+
+    answer_cache = sub.add_parser('answer-cache', help='semantic answer cache lookup latency against the sub-ms bound')
+    answer_cache.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 20000])
+    answer_cache.add_argument('--queries', type=int, default=500)
+    answer_cache.add_argument('--noise', type=float, default=0.008,
+                              help='per-dimension noise on near-duplicates, 0.008 is about 0.98 cosine')
+    answer_cache.add_argument('--max-ms', type=float, default=1.0, help='p95 lookup latency bound')
+    answer_cache.set_defaults(run=bench_answer_cache)
+
+    pdf = sub.add_parser('pdf', help='serial vs process-pool PDF conversion on a synthetic PDF')
+    pdf.add_argument('--pages', type=int, default=300)
+    pdf.add_argument('--workers', type=int, nargs='+', default=[2, 4])
+    pdf.add_argument('--pages-per-task', type=int, default=25)
+    pdf.set_defaults(run=bench_pdf)
+
+    cleaning = sub.add_parser('cleaning', help='per-stage markdown cleaning throughput')
+    cleaning.add_argument('--sections', type=int, default=500)
+    cleaning.add_argument('--repeat', type=int, default=5)
+    cleaning.set_defaults(run=bench_cleaning)
+
+    dedup = sub.add_parser('dedup', help='near-duplicate chunk elimination on get_docs output')
+    dedup.add_argument('--sections', type=int, nargs='+', default=[100, 1000, 5000])
+    dedup.add_argument('--vocabulary', type=int, default=5000)
+    dedup.add_argument('--threshold', type=float, default=0.8)
+    dedup.add_argument('--containment', type=float, default=0.8)
+    dedup.set_defaults(run=bench_dedup)
+
+    lexical = sub.add_parser('lexical', help='BM25 index size, retrieval mode latency and the lexical fast path')
+    lexical.add_argument('--sections', type=int, default=1000)
+    lexical.add_argument('--vocabulary', type=int, default=20000)
+    lexical.add_argument('--questions', type=int, default=200)
+    lexical.add_argument('--question-words', type=int, default=6)
+    lexical.add_argument('--embed-latency', type=float, default=0.05)
+    lexical.add_argument('--vector-latency', type=float, default=0.02)
+    lexical.set_defaults(run=bench_lexical)
+
+    context = sub.add_parser('context', help='prompt tokens before and after context assembly')
+    context.add_argument('--sections', type=int, default=300)
+    context.add_argument('--vocabulary', type=int, default=5000)
+    context.add_argument('--questions', type=int, default=300)
+    context.add_argument('--question-words', type=int, default=6)
+    context.add_argument('--candidates', type=int, default=20)
+    context.add_argument('--budget', type=int, default=None,
+                         help='context token budget, defaults to what the top five matches joined as-is use')
+    context.set_defaults(run=bench_context)
+
+    docstore = sub.add_parser('docstore', help='query payloads and latency: text metadata vs id-only queries plus docstore')
+    docstore.add_argument('--sections', type=int, default=500)
+    docstore.add_argument('--vocabulary', type=int, default=5000)
+    docstore.add_argument('--queries', type=int, default=200)
+    docstore.add_argument('--top-k', type=int, default=20)
+    docstore.add_argument('--vector-latency', type=float, default=0.02)
+    docstore.add_argument('--bandwidth-mbps', type=float, default=10.0,
+                          help='simulated query response transfer rate in MB/s, 0 for none')
+    docstore.set_defaults(run=bench_docstore)
+
+    coldstart = sub.add_parser('coldstart', help='inference handler import time per module and the SDKs it defers')
+    coldstart.add_argument('--runs', type=int, default=5, help='fresh interpreters to take the median over')
+    coldstart.add_argument('--top', type=int, default=15, help='slowest top-level modules to report')
+    coldstart.add_argument('--min-ms', type=float, default=1.0, help='leave out modules faster than this')
+    coldstart.set_defaults(run=bench_coldstart)
+
+    bulk = sub.add_parser('bulk', help='src/main.py bulk mode throughput against a local inference endpoint')
+    bulk.add_argument('--questions', type=int, default=400)
+    bulk.add_argument('--serial-questions', type=int, default=20, help='questions sent one by one for the baseline')
+    bulk.add_argument('--latency', type=float, default=0.2, help='simulated endpoint latency per request')
+    bulk.add_argument('--jitter', type=float, default=0.0)
+    bulk.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    bulk.add_argument('--batch-size', type=int, nargs='+', default=[1, 10])
+    bulk.set_defaults(run=bench_bulk)
+
+    e2e = sub.add_parser('e2e', help='per-stage latency of the whole pipeline against local stand-ins')
+    e2e.add_argument('--pdfs', nargs='+', default=None, help='defaults to the PDFs in POC/main.py')
+    e2e.add_argument('--pages', type=int, default=50, help='synthetic PDF size when the PDFs are missing')
+    e2e.add_argument('--iterations', type=int, default=5, help='passes over the questions in POC/main.py')
+    e2e.add_argument('--embed-latency', type=float, default=0.05)
+    e2e.add_argument('--vector-latency', type=float, default=0.02)
+    e2e.add_argument('--llm-latency', type=float, default=0.3, help='time to first chunk')
+    e2e.add_argument('--chunk-latency', type=float, default=0.02, help='gap between streamed chunks')
+    e2e.add_argument('--jitter', type=float, default=0.0)
+    e2e.add_argument('--warm', action='store_true', help='keep the answer and embedding caches between calls')
+    e2e.set_defaults(run=bench_e2e)
+
+    for command in sub.choices.values():
+        command.add_argument('--output', help='also write the results JSON to this file')
+        command.add_argument('--baseline', help='results JSON to compare against; exits 1 on regressions')
+        command.add_argument('--tolerance', type=float, default=0.1, help='allowed relative slowdown before flagging')
+
+    args = parser.parse_args()
+    started = time.perf_counter()
+    results = args.run(args)
+    report = {'bench': args.bench, 'seconds': round(time.perf_counter() - started, 3), 'results': results}
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        report['regressions'] = compare(results, baseline.get('results', {}), args.tolerance)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
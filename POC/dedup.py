@@ -0,0 +1,126 @@
+import math
+import re
+import time
+import zlib
+
+import numpy as np
+
+# Word n-grams compared between chunks
+SHINGLE_SIZE = 3
+NUM_PERM = 128
+# Estimated Jaccard similarity at or above which a later chunk is a near-duplicate
+SIMILARITY_THRESHOLD = 0.8
+# Share of a chunk's shingles already in kept chunks at or above which it's dropped
+CONTAINMENT_THRESHOLD = 0.8
+
+# Universal hashing modulo a Mersenne prime; with 32-bit shingle hashes and
+# 31-bit coefficients a * x + b stays below 2**64
+MERSENNE_PRIME = (1 << 61) - 1
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """
+    Hashes of the lowercased word n-grams of `text`, as a sorted unique uint64 array.
+
+    crc32 keeps hashes stable across processes, so the same input always
+    dedups the same way and content-addressed ids don't churn.
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        grams = [' '.join(words)] if words else []
+    else:
+        grams = [' '.join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return np.unique(np.fromiter((zlib.crc32(g.encode()) for g in grams), dtype=np.uint64, count=len(grams)))
+
+
+def permutations(num_perm=NUM_PERM, seed=1):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+    return a, b
+
+
+def minhash(hashes, a, b):
+    """
+    MinHash signature of one shingle set, one minimum per permutation.
+    """
+    if not len(hashes):
+        return np.full(len(a), MERSENNE_PRIME, dtype=np.uint64)
+    return ((np.outer(a, hashes) + b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+
+def lsh_params(threshold, num_perm=NUM_PERM):
+    """
+    Bands and rows per band whose S-curve midpoint (1/b)^(1/r) is closest to `threshold`.
+    """
+    pairs = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    return min(pairs, key=lambda p: abs((1 / p[0]) ** (1 / p[1]) - threshold))
+
+
+def dedup_chunks(
+    texts,
+    threshold=SIMILARITY_THRESHOLD,
+    containment=CONTAINMENT_THRESHOLD,
+    num_perm=NUM_PERM,
+    embed_batch_size=100
+):
+    """
+    Drop near-duplicate and already-covered chunks, keeping the first occurrence.
+
+    Chunks are visited in order, so the section paragraphs that lead the
+    `get_docs` output are kept over the character windows cut from them.
+    A chunk is dropped when its MinHash-estimated Jaccard similarity to a
+    kept chunk found through LSH reaches `threshold`, or when at least
+    `containment` of its shingles already occur in kept chunks (which is
+    how a short window inside a long paragraph shows up). Pass
+    containment=None to only drop near-duplicates. Work is linear in the
+    number of chunks apart from LSH bucket collisions.
+
+    Returns the kept texts and a report of what was dropped and how many
+    embedding requests that saves.
+    """
+    started = time.perf_counter()
+    a, b = permutations(num_perm)
+    bands, rows = lsh_params(threshold, num_perm)
+    buckets = [{} for _ in range(bands)]
+    signatures = []
+    covered = set()
+
+    kept = []
+    near_duplicates = 0
+    contained = 0
+    for text in texts:
+        hashes = shingles(text)
+        signature = minhash(hashes, a, b)
+        keys = [signature[band * rows:(band + 1) * rows].tobytes() for band in range(bands)]
+
+        candidates = {i for band, key in enumerate(keys) for i in buckets[band].get(key, ())}
+        if any(np.count_nonzero(signatures[i] == signature) / num_perm >= threshold for i in candidates):
+            near_duplicates += 1
+            continue
+
+        values = hashes.tolist()
+        if containment is not None and values:
+            if sum(1 for h in values if h in covered) / len(values) >= containment:
+                contained += 1
+                continue
+
+        position = len(signatures)
+        signatures.append(signature)
+        for band, key in enumerate(keys):
+            buckets[band].setdefault(key, []).append(position)
+        covered.update(values)
+        kept.append(text)
+
+    total = len(kept) + near_duplicates + contained
+    report = {
+        'chunks': total,
+        'kept': len(kept),
+        'near_duplicates': near_duplicates,
+        'contained': contained,
+        'dropped': near_duplicates + contained,
+        'embed_requests_saved': math.ceil(total / embed_batch_size) - math.ceil(len(kept) / embed_batch_size),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+    return kept, report
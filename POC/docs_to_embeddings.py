@@ -1,56 +1,387 @@
+import asyncio
+import hashlib
 import json
 import google.generativeai as genai
+import random
+import sys
 import time 
 
 from pinecone import Pinecone, ServerlessSpec
 from pathlib import Path
 import os
 
+# Vector store backends are shared with the Lambda layer
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'src' / 'shared' / 'python'))
+from cache import DiskCache, embedding_key
+from vector_store import vector_store_from_env
+from scheduler import Scheduler, TokenBucket
+
 PINECONE_DEV_KEY = os.environ.get("PINECONE_DEV_KEY")
 GEMINI_DEV_KEY = os.environ.get("GEMINI_DEV_KEY")
 
+INDEX_NAME = 'semantic-search-gemini'
+EMBEDDING_MODEL = "models/text-embedding-004"
+TASK_TYPE = "retrieval_document"
+
+# Content-addressed embedding cache shared by ingestion runs, set to '' to disable
+EMBEDDING_CACHE = os.environ.get("INGEST_EMBEDDING_CACHE", ".local/embedding_cache.sqlite")
+EMBEDDING_CACHE_MAX_BYTES = int(os.environ.get("INGEST_EMBEDDING_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+# batchEmbedContents accepts at most 100 contents per request
+EMBED_BATCH_SIZE = 100
+UPSERT_BATCH_SIZE = 100
+DELETE_BATCH_SIZE = 1000
+WORKERS = 4
+MAX_ATTEMPTS = 5
+
+# Provider quotas per minute; embeddings are counted per text, upserts per
+# request, and 0 means unlimited
+EMBED_QUOTA_PER_MIN = int(os.environ.get("EMBED_QUOTA_PER_MIN", 15000))
+UPSERT_QUOTA_PER_MIN = int(os.environ.get("UPSERT_QUOTA_PER_MIN", 0))
+
+# Store chunk text as vector metadata; turn off once inference resolves
+# texts from the docstore
+TEXT_METADATA = os.environ.get("INGEST_TEXT_METADATA", "true").lower() == "true"
+
 def read_docs(filename):
     with open(filename, 'r') as f:
         return json.load(f)
 
 
-def upload_embeddings(docs, key):
-    genai.configure(api_key=GEMINI_DEV_KEY)
+def content_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def chunk_id(key, text):
+    """
+    Content-addressed vector id, stable across runs while the text is unchanged.
+    """
+    return f'{key}#{content_hash(text)[:16]}'
+
+
+def load_manifest(filename):
+    """
+    Load the ingestion manifest, or an empty one if it doesn't exist yet.
+
+    The manifest maps each vector id to the document it came from, the
+    content hash of its text and the embedding model used.
+    """
+    path = Path(filename)
+    if not path.exists():
+        return {'chunks': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, filename):
+    path = Path(filename)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    tmp.replace(path)
+
+
+def batched(items, size):
+    """
+    Split a list into consecutive batches of at most `size` items.
+    """
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def with_retries(fn, attempts=MAX_ATTEMPTS, base_delay=1.0, max_delay=30.0):
+    """
+    Call `fn`, retrying with jittered exponential backoff on failure.
+    """
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == attempts - 1:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+            print(f"Attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def connect_pinecone_index():
+    """
+    Connect to the Pinecone index, creating it first if needed.
+    """
     pc = Pinecone(api_key=PINECONE_DEV_KEY)
     spec = ServerlessSpec(cloud="aws", region='us-east-1')
-    index_name = 'semantic-search-gemini'
 
     # check if index already exists 
-    if index_name not in pc.list_indexes().names():
+    if INDEX_NAME not in pc.list_indexes().names():
         # if does not exist, create index
         pc.create_index(
-            index_name,
+            INDEX_NAME,
             dimension=768,  
             metric='dotproduct', # cosine?
             spec=spec
         )
         # wait for index to be initialized
-        while not pc.describe_index(index_name).status['ready']:
+        while not pc.describe_index(INDEX_NAME).status['ready']:
             time.sleep(1)
 
     # connect to index
-    index = pc.Index(index_name)
+    index = pc.Index(INDEX_NAME)
     time.sleep(1)
+    return index
+
 
-    for i, doc in enumerate(docs):
-        res  = genai.embed_content(
-            model="models/text-embedding-004",
-            content=docs[i],
-            task_type="retrieval_document",
-            )
+def connect_index():
+    """
+    Open the vector store selected by VECTOR_STORE ('pinecone' or 'local').
+    """
+    return vector_store_from_env(connect_pinecone_index)
 
-        index.upsert([(f'{key}_{i}', res['embedding'], {'text':doc})]
+
+def embed_batch(texts):
+    """
+    Embed a batch of documents in a single request.
+    """
+    res = genai.embed_content(
+        model=EMBEDDING_MODEL,
+        content=texts,
+        task_type=TASK_TYPE,
         )
+    return res['embedding']
+
+
+def open_embedding_cache(path=EMBEDDING_CACHE, max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+    """
+    Open the on-disk embedding cache used by ingestion, or None if disabled.
+    """
+    return DiskCache(path, max_bytes=max_bytes) if path else None
+
+
+def cache_key(text):
+    """
+    Cache key of a chunk: sha256 of its exact text, the model and the task type.
+    """
+    return embedding_key(text, EMBEDDING_MODEL, TASK_TYPE, normalize=False)
+
+
+def ingest_scheduler(
+    embed_batch_size=EMBED_BATCH_SIZE,
+    workers=WORKERS,
+    embed_quota=EMBED_QUOTA_PER_MIN,
+    upsert_quota=UPSERT_QUOTA_PER_MIN
+):
+    """
+    Scheduler holding the embedding and upsert quotas of an ingestion run.
+
+    Share one between `upload_embeddings` calls so consecutive documents
+    draw from the same per-minute budget.
+    """
+    return Scheduler(
+        buckets={
+            'embed': TokenBucket(embed_quota, burst=embed_batch_size) if embed_quota else None,
+            'upsert': TokenBucket(upsert_quota) if upsert_quota else None,
+        },
+        concurrency={'embed': workers, 'upsert': workers},
+        max_attempts=MAX_ATTEMPTS
+    )
+
+
+def upload_embeddings(
+    docs,
+    key,
+    ids=None,
+    index=None,
+    embed=None,
+    embed_batch_size=EMBED_BATCH_SIZE,
+    upsert_batch_size=UPSERT_BATCH_SIZE,
+    workers=WORKERS,
+    cache=None,
+    scheduler=None,
+    text_metadata=TEXT_METADATA
+):
+    """
+    Embed documents in batches and upsert them into the vector index.
+
+    Batches are scheduled on an event loop under per-service token buckets
+    and concurrency limits, so upserts of finished batches overlap with
+    embedding of later ones while staying inside the provider quotas. A
+    rate-limited call slows its service down and is retried after the
+    Retry-After delay; other failures are retried with backoff per batch,
+    so one failure doesn't restart the run. Documents already in the
+    embedding cache are looked up in bulk and upserted without an
+    embedding request; new embeddings are written back.
+
+    Args:
+        docs (List[str]): Documents to embed
+        key (str): Prefix for vector ids, stored as '{key}_{i}'
+        ids (List[str]): Explicit vector ids, one per document, instead of '{key}_{i}'
+        index (VectorStore): Vector store to upsert into, defaults to the configured backend
+        embed (Callable[[List[str]], List[List[float]]]): Batch embedding
+            function, defaults to Gemini batch embedding
+        embed_batch_size (int): Documents per embedding request
+        upsert_batch_size (int): Vectors per upsert request
+        workers (int): Maximum concurrent requests per service
+        cache (DiskCache): Embedding cache, defaults to the ingestion cache
+            when embedding with Gemini and to none with a custom `embed`
+        scheduler (Scheduler): Quota scheduler, defaults to `ingest_scheduler`
+            with the configured quotas
+        text_metadata (bool): Upsert each document's text as {'text': doc}
+            metadata; without it vectors carry no metadata and the text is
+            only in the docstore
+
+    Returns:
+        dict: Counts, failures, elapsed time and docs/sec for the run
+    """
+    if embed is None:
+        genai.configure(api_key=GEMINI_DEV_KEY)
+        embed = embed_batch
+        if cache is None:
+            cache = open_embedding_cache()
+    if index is None:
+        index = connect_index()
+    if scheduler is None:
+        scheduler = ingest_scheduler(embed_batch_size, workers)
+
+    started = time.perf_counter()
+    rate_limited = scheduler.rate_limited
+    failures = []
+    if ids is None:
+        ids = [f'{key}_{i}' for i in range(len(docs))]
+
+    def metadata(doc):
+        return {'text': doc} if text_metadata else {}
+
+    cached = {}
+    if cache is not None:
+        keys = [cache_key(doc) for doc in docs]
+        try:
+            cached = cache.get_many(keys)
+        except Exception as e:
+            print(f"Embedding cache lookup failed ({e}), embedding every document")
+        hits = [(vector_id, cached[k], metadata(doc)) for vector_id, doc, k in zip(ids, docs, keys) if k in cached]
+        pending = [(vector_id, doc) for vector_id, doc, k in zip(ids, docs, keys) if k not in cached]
+    else:
+        hits = []
+        pending = list(zip(ids, docs))
+    batches = batched(pending, embed_batch_size)
+
+    def write_cache(batch, embeddings):
+        try:
+            cache.put_many([(cache_key(doc), embedding) for (_, doc), embedding in zip(batch, embeddings)])
+        except Exception as e:
+            print(f"Embedding cache write failed ({e})")
+
+    async def upsert(vectors):
+        try:
+            await scheduler.call('upsert', index.upsert, vectors)
+        except Exception as e:
+            failures.append({'stage': 'upsert', 'ids': [v[0] for v in vectors], 'error': str(e)})
+            return 0
+        return len(vectors)
+
+    async def embed_and_upsert(batch):
+        try:
+            embeddings = await scheduler.call('embed', embed, [doc for _, doc in batch], cost=len(batch))
+        except Exception as e:
+            failures.append({'stage': 'embed', 'ids': [vector_id for vector_id, _ in batch], 'error': str(e)})
+            return 0
+        if cache is not None:
+            await asyncio.to_thread(write_cache, batch, embeddings)
+        vectors = [(vector_id, embedding, metadata(doc)) for (vector_id, doc), embedding in zip(batch, embeddings)]
+        return sum(await asyncio.gather(*(upsert(group) for group in batched(vectors, upsert_batch_size))))
+
+    async def run():
+        jobs = [upsert(group) for group in batched(hits, upsert_batch_size)]
+        jobs += [embed_and_upsert(batch) for batch in batches]
+        return await scheduler.gather(jobs, label=key)
+
+    upserted = sum(asyncio.run(run()))
+    index.flush()
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        'docs': len(docs),
+        'upserted': upserted,
+        'embed_requests': len(batches),
+        'cache_hits': len(hits),
+        'rate_limited': scheduler.rate_limited - rate_limited,
+        'failures': failures,
+        'seconds': round(elapsed, 3),
+        'docs_per_sec': round(len(docs) / elapsed, 1) if elapsed else None
+    }
+    print(f"{key}: upserted {upserted}/{len(docs)} docs in {elapsed:.2f}s ({stats['docs_per_sec']} docs/sec, {len(hits)} cached)")
+    if failures:
+        print(f"{key}: {len(failures)} batches failed after {MAX_ATTEMPTS} attempts")
+    return stats
+
+
+def failed_ids(stats):
+    """
+    Vector ids that an `upload_embeddings` run couldn't embed or upsert.
+    """
+    return {vector_id for failure in stats['failures'] for vector_id in failure['ids']}
+
+
+def sync_embeddings(docs, key, manifest, index=None, embed=None, **kwargs):
+    """
+    Incrementally bring the index in line with a document's current chunks.
+
+    Only chunks that are new, changed or embedded with a different model are
+    embedded and upserted; vectors for chunks that disappeared are deleted;
+    everything else is left untouched. The manifest is updated in place.
+
+    Args:
+        docs (List[str]): Current chunks of the document
+        key (str): Document key, used as the vector id prefix
+        manifest (dict): Manifest from `load_manifest`
+        index (VectorStore): Vector store, defaults to the configured backend
+        embed (Callable[[List[str]], List[List[float]]]): Batch embedding function
+        **kwargs: Batching options passed to `upload_embeddings`
+
+    Returns:
+        dict: Counts of added, deleted and unchanged chunks plus upload stats
+    """
+    chunks = manifest['chunks']
+    wanted = {chunk_id(key, doc): doc for doc in docs}
+    existing = {cid for cid, entry in chunks.items() if entry['document'] == key}
+
+    changed = [
+        cid for cid in wanted
+        if cid not in chunks or chunks[cid]['model'] != EMBEDDING_MODEL
+    ]
+    stale = sorted(existing - wanted.keys())
+    stats = {'added': 0, 'deleted': 0, 'unchanged': len(wanted) - len(changed), 'upload': None}
+
+    if not changed and not stale:
+        print(f"{key}: {stats['unchanged']} chunks unchanged")
+        return stats
+
+    if index is None:
+        index = connect_index()
+
+    if changed:
+        upload = upload_embeddings([wanted[cid] for cid in changed], key, ids=changed, index=index, embed=embed, **kwargs)
+        failed = failed_ids(upload)
+        for cid in changed:
+            if cid not in failed:
+                chunks[cid] = {'document': key, 'hash': content_hash(wanted[cid]), 'model': EMBEDDING_MODEL}
+        stats['added'] = len(changed) - len(failed)
+        stats['upload'] = upload
+
+    for group in batched(stale, DELETE_BATCH_SIZE):
+        with_retries(lambda: index.delete(ids=group))
+        for cid in group:
+            chunks.pop(cid, None)
+        stats['deleted'] += len(group)
+    index.flush()
+
+    print(f"{key}: {stats['added']} chunks added, {stats['deleted']} deleted, {stats['unchanged']} unchanged")
+    return stats
 
 if __name__ == '__main__':
+    scheduler = ingest_scheduler()
     for filename in ['.local/output/docs1.json','.local/output/docs2.json']:
         p = Path(filename)
-        upload_embeddings(read_docs(p), p.stem)
+        upload_embeddings(read_docs(p), p.stem, scheduler=scheduler)
 
 # print(index.describe_index_stats())
 # pc.delete_index(index_name)
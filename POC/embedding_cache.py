@@ -0,0 +1,51 @@
+"""
+Inspect, export and import the ingestion embedding cache.
+
+An exported cache can be imported by another checkout or CI job, or set as
+EMBEDDING_CACHE_SEED for the Lambda. Paths starting with s3:// are uploaded
+or downloaded with boto3, e.g.
+    python POC/embedding_cache.py export s3://my-bucket/embedding-cache.sqlite
+"""
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'src' / 'shared' / 'python'))
+from cache import download_s3_file, upload_s3_file
+from docs_to_embeddings import open_embedding_cache, EMBEDDING_CACHE
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the ingestion embedding cache')
+    parser.add_argument('--cache', default=EMBEDDING_CACHE, help='cache file')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats', help='entries and stored bytes')
+    export = sub.add_parser('export', help='write a snapshot to a file or s3:// URI')
+    export.add_argument('destination')
+    load = sub.add_parser('import', help='merge a snapshot from a file or s3:// URI')
+    load.add_argument('source')
+    args = parser.parse_args()
+
+    cache = open_embedding_cache(args.cache)
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.command == 'export':
+            if args.destination.startswith('s3://'):
+                snapshot = str(Path(tmp) / 'snapshot.sqlite')
+                cache.export_to(snapshot)
+                upload_s3_file(snapshot, args.destination)
+            else:
+                cache.export_to(args.destination)
+            print(f"Exported {cache.usage()['entries']} embeddings to {args.destination}")
+        elif args.command == 'import':
+            source = args.source
+            if source.startswith('s3://'):
+                source = str(Path(tmp) / 'snapshot.sqlite')
+                download_s3_file(args.source, source)
+            print(f"Imported {cache.import_from(source)} embeddings from {args.source}")
+    print(json.dumps(cache.usage()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+"""
+Local stand-ins for the embedding, vector, generation and storage services,
+used to benchmark the pipeline without network access or API keys.
+"""
+import hashlib
+import json
+import math
+import random
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+
+DIMENSION = 768
+
+
+class QuotaExceeded(Exception):
+    """
+    429 raised by a fake service over its quota, with the provider's Retry-After.
+    """
+
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__(f"Quota exceeded, retry after {retry_after:.2f}s")
+        self.retry_after = retry_after
+
+
+class FakeService:
+    """
+    Base stand-in that sleeps for a configurable latency (plus jitter) and
+    fails a configurable fraction of calls. With `quota` set, calls whose
+    cost would take the last `period` seconds over the quota are rejected
+    with QuotaExceeded, like a provider's per-minute limit. A call given a
+    `timeout` shorter than its latency gives up with TimeoutError once the
+    timeout has passed.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, failure_rate=0.0, seed=0, quota=None, period=60.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.quota = quota
+        self.period = period
+        self.calls = 0
+        self.rejected = 0
+        self.peak_window = 0
+        self._window = deque()
+        self._window_cost = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _admit(self, cost):
+        now = time.monotonic()
+        while self._window and self._window[0][0] <= now - self.period:
+            self._window_cost -= self._window.popleft()[1]
+        if self._window_cost + cost > self.quota:
+            self.rejected += 1
+            raise QuotaExceeded(self._window[0][0] + self.period - now if self._window else self.period)
+        self._window.append((now, cost))
+        self._window_cost += cost
+        self.peak_window = max(self.peak_window, self._window_cost)
+
+    def _call(self, cost=1, timeout=None):
+        with self._lock:
+            if self.quota is not None:
+                self._admit(cost)
+            self.calls += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            fail = self._random.random() < self.failure_rate
+        if timeout is not None and delay > timeout:
+            time.sleep(max(0.0, timeout))
+            raise TimeoutError(f"{type(self).__name__} timed out after {timeout:.2f}s")
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError(f"{type(self).__name__} injected failure")
+
+
+def fake_embedding(text, dimension=DIMENSION):
+    """
+    Deterministic unit vector derived from the text.
+    """
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dimension)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class FakeEmbedder(FakeService):
+    """
+    Batch embedding stand-in: one call embeds a list of texts.
+    """
+
+    def __init__(self, dimension=DIMENSION, **kwargs):
+        super().__init__(**kwargs)
+        self.dimension = dimension
+        self.texts = 0
+
+    def __call__(self, texts):
+        self._call(len(texts))
+        with self._lock:
+            self.texts += len(texts)
+        return [fake_embedding(t, self.dimension) for t in texts]
+
+
+class FakeIndex(FakeService):
+    """
+    Vector index stand-in with Pinecone's upsert/query/delete shape.
+
+    With `bytes_per_sec` set, a query also waits for its JSON response to
+    transfer at that rate; `bytes_sent` totals the response sizes.
+    """
+
+    def __init__(self, bytes_per_sec=None, **kwargs):
+        super().__init__(**kwargs)
+        self.bytes_per_sec = bytes_per_sec
+        self.bytes_sent = 0
+        self.vectors = {}
+        self._matrix = None
+
+    def upsert(self, vectors):
+        self._call()
+        with self._lock:
+            for vector_id, values, metadata in vectors:
+                self.vectors[vector_id] = (values, metadata)
+            self._matrix = None
+
+    def delete(self, ids):
+        self._call()
+        with self._lock:
+            for vector_id in ids:
+                self.vectors.pop(vector_id, None)
+            self._matrix = None
+
+    def query(self, vector, top_k=5, include_metadata=False):
+        self._call()
+        query = vector[0] if vector and isinstance(vector[0], list) else vector
+        with self._lock:
+            ids = list(self.vectors)
+            if not ids:
+                return SimpleNamespace(matches=[])
+            if self._matrix is None or len(self._matrix) != len(ids):
+                self._matrix = np.asarray([self.vectors[i][0] for i in ids], dtype=np.float32).reshape(len(ids), -1)
+            metadata = [self.vectors[i][1] for i in ids]
+            matrix = self._matrix
+        scores = matrix @ np.asarray(query, dtype=np.float32)
+        order = np.argsort(-scores)[:top_k]
+        matches = [
+            {'id': ids[i], 'score': float(scores[i]), 'metadata': metadata[i] if include_metadata else None}
+            for i in order
+        ]
+        size = len(json.dumps({'matches': matches}))
+        with self._lock:
+            self.bytes_sent += size
+        if self.bytes_per_sec:
+            time.sleep(size / self.bytes_per_sec)
+        return SimpleNamespace(matches=matches)
+
+    def describe_index_stats(self):
+        return SimpleNamespace(total_vector_count=len(self.vectors))
+
+    def flush(self):
+        pass
+
+
+class FakeGemini:
+    """
+    Stand-in for the configured google.generativeai module's embed_content.
+    """
+
+    def __init__(self, embedder=None):
+        self.embedder = embedder if embedder is not None else FakeEmbedder()
+
+    def embed_content(self, model, content, task_type=None):
+        if isinstance(content, list):
+            return {'embedding': self.embedder(content)}
+        return {'embedding': self.embedder([content])[0]}
+
+
+class FakeLLM(FakeService):
+    """
+    GenerativeModel stand-in. `latency` is the time to the first chunk and
+    `chunk_latency` the gap between streamed chunks. The answer quotes the
+    start of the context so it depends on what retrieval returned.
+    """
+
+    def __init__(self, chunks=8, chunk_latency=0.01, **kwargs):
+        super().__init__(**kwargs)
+        self.chunks = chunks
+        self.chunk_latency = chunk_latency
+
+    def _answer(self, prompt):
+        context = prompt.split('Context: ', 1)[-1][:400]
+        words = context.split() or ['answer']
+        size = max(1, math.ceil(len(words) / self.chunks))
+        return [' '.join(words[i:i + size]) + ' ' for i in range(0, len(words), size)]
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        self._call(timeout=(request_options or {}).get('timeout'))
+        parts = self._answer(prompt)
+        if stream:
+            return self._stream(parts)
+        time.sleep(self.chunk_latency * (len(parts) - 1))
+        return SimpleNamespace(text=''.join(parts))
+
+    def _stream(self, parts):
+        for i, part in enumerate(parts):
+            if i:
+                time.sleep(self.chunk_latency)
+            yield SimpleNamespace(text=part)
+
+
+class FakeS3(FakeService):
+    """
+    S3 stand-in serving s3://bucket/key objects from `root`/bucket/key.
+    `patch()` puts it behind cache's download_s3_file and read_s3_text,
+    which the docstore and lexical index read S3 through. `downloads`
+    counts downloaded objects.
+    """
+
+    def __init__(self, root, **kwargs):
+        super().__init__(**kwargs)
+        self.root = Path(root)
+        self.downloads = 0
+
+    def path(self, uri):
+        return self.root / uri[len('s3://'):]
+
+    def download_file(self, uri, path):
+        self._call()
+        with self._lock:
+            self.downloads += 1
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_bytes(self.path(uri).read_bytes())
+
+    def read_text(self, uri):
+        self._call()
+        return self.path(uri).read_text() if self.path(uri).exists() else None
+
+    def patch(self):
+        import cache
+        return mock.patch.multiple(cache, download_s3_file=self.download_file, read_s3_text=self.read_text)
+
+
+class FakeInferenceEndpoint(FakeService):
+    """
+    Local HTTP stand-in for the inference API, answering {"question": ...}
+    and {"questions": [...]} bodies like the Lambda behind API Gateway.
+
+    Each request takes `latency` (a batch once, as the Lambda answers its
+    questions concurrently). Injected failures get a 500 and requests over
+    `quota` a 429 with Retry-After in whole seconds, as HTTP requires. `connections` counts accepted TCP
+    connections, so clients can be checked for keep-alive reuse. Use it as
+    a context manager; `url` is the endpoint to post to.
+    """
+
+    def __init__(self, port=0, **kwargs):
+        super().__init__(**kwargs)
+        self.connections = 0
+        self.requests = 0
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are separate writes; with Nagle on, keep-alive
+            # responses would wait out the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with endpoint._lock:
+                    endpoint.connections += 1
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with endpoint._lock:
+                    endpoint.requests += 1
+                try:
+                    endpoint._call()
+                except QuotaExceeded as e:
+                    return self._send(429, {'error': str(e)}, {'Retry-After': str(math.ceil(e.retry_after))})
+                except RuntimeError as e:
+                    return self._send(500, {'error': f'Internal server error: {e}'})
+
+                if 'questions' in body:
+                    results = [{'question': q, 'answer': endpoint.answer(q)} for q in body['questions']]
+                    return self._send(200, {'results': results})
+                if not body.get('question'):
+                    return self._send(400, {'error': 'Question is required'})
+                self._send(200, {'question': body['question'], 'answer': endpoint.answer(body['question'])})
+
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            def handle_error(self, request, client_address):
+                # Clients that time out hang up before the answer is written
+                if not isinstance(sys.exc_info()[1], ConnectionError):
+                    super().handle_error(request, client_address)
+
+        self.server = Server(('127.0.0.1', port), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/inference'
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @staticmethod
+    def answer(question):
+        return f"Stand-in answer to: {question}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        return False
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve the inference endpoint stand-in, e.g. for src/main.py --questions')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    with FakeInferenceEndpoint(args.port, latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate) as endpoint:
+        print(f"Serving {endpoint.url}")
+        try:
+            endpoint._thread.join()
+        except KeyboardInterrupt:
+            pass
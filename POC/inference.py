@@ -1,6 +1,13 @@
 from pinecone import Pinecone, ServerlessSpec
+from pathlib import Path
 import google.generativeai as genai
 import os
+import sys
+
+# Vector store backends are shared with the Lambda layer
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'src' / 'shared' / 'python'))
+from vector_store import vector_store_from_env
+from context_assembly import assemble_context
 
 PINECONE_DEV_KEY = os.environ.get("PINECONE_DEV_KEY")
 GEMINI_DEV_KEY = os.environ.get("GEMINI_DEV_KEY")
@@ -10,8 +17,9 @@ def create_context(question):
     """
     Create a context for a question by finding the most similar context from the pinecone index
     """
-    pc = Pinecone(api_key=PINECONE_DEV_KEY)
-    index = pc.Index('semantic-search-gemini')
+    index = vector_store_from_env(
+        lambda: Pinecone(api_key=PINECONE_DEV_KEY).Index('semantic-search-gemini'),
+        read_only=True)
     
     max_len=1800
     # Get the embeddings for the question
@@ -19,15 +27,12 @@ def create_context(question):
         model="models/text-embedding-004",
         content=question)
     
-    # Get the distances from the embeddings
-    res = index.query(vector=[q_embeddings['embedding']], top_k=5, include_metadata=True)
-    results = []
-    cur_len = 0
-    for m in res.matches:
-        text = m['metadata']['text']
-        results.append(text)
+    # Over-fetch, then merge overlapping windows and pack to max_len tokens
+    res = index.query(vector=[q_embeddings['embedding']], top_k=20, include_metadata=True)
+    context = assemble_context(res.matches, max_tokens=max_len)
+    print(f"Context: {context.tokens} tokens from {context.candidates} matches, {context.raw_tokens} for the top 5 as-is")
  
-    return r"\n\n###\n\n".join(results)
+    return context.text
 
 def answer_question(
     question="What is the R.31 reconnaissance aircraft?",
@@ -1,36 +1,122 @@
+import argparse
 import os
+import shutil
 import time
 from pathlib import Path
-from pdf_to_docs import get_docs
-from docs_to_embeddings import read_docs, upload_embeddings
+from pdf_to_docs import process_pdfs
+from docs_to_embeddings import read_docs, upload_embeddings, load_manifest, save_manifest, sync_embeddings, chunk_id, ingest_scheduler, failed_ids
+from dedup import dedup_chunks, SIMILARITY_THRESHOLD, CONTAINMENT_THRESHOLD
 from inference import answer_question
+from scheduler import Scheduler, TokenBucket
+from cache import upload_s3_file
+from lexical_index import BM25Index
+from docstore import DocStore, upload_docstore
 from pinecone import Pinecone
 PINECONE_DEV_KEY = os.environ.get("PINECONE_DEV_KEY")
 
+PDFS = ["docs/pdfs/Renard R.31 (1) (1).pdf","docs/pdfs/Australia Women's Softball Team (1) (1).pdf"]
+MANIFEST = ".local/output/manifest.json"
+# BM25 index over the same chunks, read by inference from LEXICAL_INDEX_PATH
+LEXICAL_INDEX = os.environ.get("LEXICAL_INDEX_PATH", ".local/lexical_index.npz")
+# Chunk texts by vector id, read by inference from DOCSTORE_PATH
+DOCSTORE = os.environ.get("DOCSTORE_PATH", ".local/docstore")
+# Gemini free-tier generation quota, requests per minute
+GENERATION_QUOTA_PER_MIN = int(os.environ.get("GENERATION_QUOTA_PER_MIN", 15))
+QUESTIONS = [
+    'Which two companies created the R.31 reconnaissance aircraft?',
+    'What guns were mounted on the Renard R.31?',
+    'Who was the first softball player to represent any country at four World Series of Softball?',
+    'Who were the pitchers on the Australian softball team\'s roster at the 2020 Summer Olympics?',
+]
+
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild the vector index and run sample questions')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only embed new or changed chunks and delete removed ones, using the manifest')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes for PDF conversion, across files and page ranges')
+    parser.add_argument('--no-dedup', action='store_true',
+                        help='embed every chunk, including near-duplicates and windows covered by other chunks')
+    parser.add_argument('--similarity', type=float, default=SIMILARITY_THRESHOLD,
+                        help='estimated Jaccard similarity at which a chunk counts as a near-duplicate')
+    parser.add_argument('--containment', type=float, default=CONTAINMENT_THRESHOLD,
+                        help='share of a chunk already covered by kept chunks at which it is dropped')
+    args = parser.parse_args()
+
+    # Without a manifest there's no record of what the index holds, so rebuild it
+    incremental = args.incremental and Path(MANIFEST).exists()
+    if not incremental and os.environ.get('VECTOR_STORE') == 'local':
+        shutil.rmtree(os.environ.get('LOCAL_VECTOR_STORE_PATH', '.local/vector_store'), ignore_errors=True)
+    elif not incremental:
+        pc = Pinecone(api_key=PINECONE_DEV_KEY)
+        index_name = 'semantic-search-gemini'
+        print(pc.list_indexes().names())
+        index = pc.Index(index_name)
+        # print(index.describe_index_stats())
+        pc.delete_index(index_name)
+        time.sleep(5)
 
-    pc = Pinecone(api_key=PINECONE_DEV_KEY)
-    index_name = 'semantic-search-gemini'
-    print(pc.list_indexes().names())
-    index = pc.Index(index_name)
-    # print(index.describe_index_stats())
-    pc.delete_index(index_name)
-    time.sleep(5)
+    # A full rebuild makes any previous manifest stale
+    if not args.incremental:
+        Path(MANIFEST).unlink(missing_ok=True)
 
-    for i,filename in enumerate(["docs/pdfs/Renard R.31 (1) (1).pdf","docs/pdfs/Australia Women's Softball Team (1) (1).pdf"]):
+    manifest = load_manifest(MANIFEST) if incremental else {'chunks': {}}
+    process_pdfs([(Path(filename), f".local/output/docs{i}") for i, filename in enumerate(PDFS)], workers=args.workers)
+
+    # One scheduler for the whole run, so every document draws from the same quotas
+    ingest = ingest_scheduler()
+    keys = set()
+    chunks = []
+    for i,filename in enumerate(PDFS):
         
         p = Path(filename)
-        get_docs(p, f".local/output/docs{i}")     
-        upload_embeddings(read_docs(f".local/output/docs{i}.json"), p.stem)
+        docs = read_docs(f".local/output/docs{i}.json")
+        if not args.no_dedup:
+            docs, report = dedup_chunks(docs, threshold=args.similarity, containment=args.containment)
+            print(f"{p.stem}: {report}")
+
+        # Only chunks that made it into the vector index go into the docstore
+        # and the lexical index; the manifest holds exactly those
+        if args.incremental:
+            sync_embeddings(docs, p.stem, manifest, scheduler=ingest)
+            indexed = [(chunk_id(p.stem, doc), doc) for doc in docs]
+            indexed = [(cid, doc) for cid, doc in indexed if cid in manifest['chunks']]
+        else:
+            failed = failed_ids(upload_embeddings(docs, p.stem, scheduler=ingest))
+            indexed = [(f'{p.stem}_{j}', doc) for j, doc in enumerate(docs) if f'{p.stem}_{j}' not in failed]
+        if len(indexed) < len(docs):
+            print(f"{p.stem}: leaving {len(docs) - len(indexed)} chunks that failed to index out of the docstore and lexical index")
+        chunks.extend(indexed)
+        keys.add(p.stem)
+
+    # The lexical index is small enough to rebuild from every chunk each run
+    lexical = BM25Index.build([cid for cid, _ in chunks], [doc for _, doc in chunks])
+    if LEXICAL_INDEX.startswith('s3://'):
+        lexical.save('.local/lexical_index.npz')
+        upload_s3_file('.local/lexical_index.npz', LEXICAL_INDEX)
+    else:
+        lexical.save(LEXICAL_INDEX)
+    print(f"Lexical index: {len(lexical)} chunks, {len(lexical.terms)} terms, saved to {LEXICAL_INDEX}")
+
+    if DOCSTORE.startswith('s3://'):
+        count = DocStore.write('.local/docstore', chunks)
+        upload_docstore('.local/docstore', DOCSTORE)
+    else:
+        count = DocStore.write(DOCSTORE, chunks)
+    print(f"Docstore: {count} chunk texts saved to {DOCSTORE}")
+
+    if args.incremental:
+        # Remove vectors of documents that are no longer in the corpus
+        for key in {entry['document'] for entry in manifest['chunks'].values()} - keys:
+            sync_embeddings([], key, manifest, scheduler=ingest)
+        save_manifest(manifest, MANIFEST)
     
-    print(answer_question('Which two companies created the R.31 reconnaissance aircraft?'))
-    print()
-    print()
-    print(answer_question('What guns were mounted on the Renard R.31?'))
-    print()
-    print()
-    print(answer_question('Who was the first softball player to represent any country at four World Series of Softball?'))
-    print()
-    print()
-    print(answer_question('Who were the pitchers on the Australian softball team\'s roster at the 2020 Summer Olympics?'))
+    scheduler = Scheduler(
+        buckets={'generate': TokenBucket(GENERATION_QUOTA_PER_MIN) if GENERATION_QUOTA_PER_MIN else None},
+        concurrency={'generate': 2}
+    )
+    for answer in scheduler.map('generate', answer_question, QUESTIONS, label='questions'):
+        print(answer)
+        print()
+        print()
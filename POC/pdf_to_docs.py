@@ -1,66 +1,199 @@
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple, Optional, TextIO, Union
+from contextlib import ExitStack
+from array import array
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import pymupdf
 import pymupdf4llm
 import json
 from langchain_text_splitters import MarkdownHeaderTextSplitter
 import re
 import pathlib
+import tempfile
 
 # Maximum size for text chunks during processing
 CHUNK_SIZE = 3000
 
-def split_by_headers(markdown_text: str) -> Tuple[str, Dict[str, str]]:
+# Pages converted per worker task when a PDF is split across processes
+PAGES_PER_TASK = 25
+
+# Markdown headers (# through ######); whitespace after the hashes can't
+# cross a line break, so this matches exactly what a per-line match would
+HEADER_PATTERN = re.compile(r'^(#{1,6})[^\S\n]+(.+?)$', re.MULTILINE)
+
+PREAMBLE = 'preamble'
+
+def iter_headers(markdown_text: str) -> Iterator['re.Match']:
     """
-    Split markdown text into sections based on header levels.
+    Yield header matches in order, only trying lines that start with '#'.
     
     Args:
-        markdown_text (str): Raw markdown text to be processed
+        markdown_text (str): Markdown to scan
         
-    Returns:
-        Tuple[str, Dict[str, str]]: Title of the document and dictionary mapping headers to their content
+    Yields:
+        re.Match: Header match, level in group 1 and title in group 2
     """
-    # Regex pattern for markdown headers (supports # through ######)
-    header_pattern = r'^#{1,6}\s+(.+?)$'
-    title_pattern = r'^#\s+(.+?)$'
-    
-    # Split the text into lines
-    lines = markdown_text.split('\n')
-    
-    title = ''
-    sections = {}
-    current_header = None
-    current_content = []
+    position = 0 if markdown_text.startswith('#') else markdown_text.find('\n#') + 1
+    while position or markdown_text.startswith('#'):
+        match = HEADER_PATTERN.match(markdown_text, position)
+        if match is not None:
+            yield match
+        position = markdown_text.find('\n#', position) + 1
+        if not position:
+            return
+
+class Section(NamedTuple):
+    level: int
+    title: str
+    start: int
+    end: int
+    parent: int
+
+class SectionIndex:
+    """
+    Offsets of every header section in a markdown buffer.
     
-    for line in lines:
-        # Extract document title if not already found
-        if not title:
-            title_match = re.match(header_pattern, line, re.MULTILINE)
-            if title_match:
-                title = title_match.group(1)
+    Sections are stored in parallel arrays as (level, title, start, end),
+    where start:end is the body between the header line and the next header,
+    plus the position of the parent section (the nearest earlier header of a
+    lower level, or -1). Text before the first header is a level 0 preamble
+    section. Repeated headers keep their own entries; lookup by title returns
+    the first. Section text is only sliced out of the buffer when asked for.
+    """
+
+    def __init__(self, markdown_text: str):
+        self.markdown = markdown_text
+        self.levels = array('b')
+        self.starts = array('q')
+        self.ends = array('q')
+        self.parents = array('q')
+        self.titles: List[str] = []
+        self._by_title: Dict[str, List[int]] = {}
+
+        length = len(markdown_text)
+        matches = iter_headers(markdown_text)
+        first = next(matches, None)
+
+        # Any line before the first header makes a preamble, minus leading blank lines
+        if first is None or first.start() > 0:
+            end = first.start() - 1 if first is not None else length
+            start = 0
+            while start < end and markdown_text[start] == '\n':
+                start += 1
+            self._add(0, PREAMBLE, start, end, -1)
+
+        stack: List[int] = []
+        match = first
+        while match is not None:
+            following = next(matches, None)
+            level = len(match.group(1))
+            start = min(match.end() + 1, length)
+            end = following.start() - 1 if following is not None else length
+            while stack and self.levels[stack[-1]] >= level:
+                stack.pop()
+            stack.append(self._add(level, match.group(2), start, max(start, end), stack[-1] if stack else -1))
+            match = following
 
-        # Check if line is a header
-        header_match = re.match(header_pattern, line, re.MULTILINE)
+    def _add(self, level: int, title: str, start: int, end: int, parent: int) -> int:
+        position = len(self.titles)
+        self.levels.append(level)
+        self.titles.append(title)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.parents.append(parent)
+        self._by_title.setdefault(title, []).append(position)
+        return position
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def __getitem__(self, position: int) -> Section:
+        return Section(self.levels[position], self.titles[position],
+                       self.starts[position], self.ends[position], self.parents[position])
+
+    @property
+    def title(self) -> str:
+        """Title of the first header, or '' if the document has none."""
+        for position, level in enumerate(self.levels):
+            if level:
+                return self.titles[position]
+        return ''
+
+    def find(self, title: str) -> Optional[int]:
+        """
+        Position of the first section with the given header.
         
-        if header_match:
-            # If we have a previous section, save it
-            if current_header is not None:
-                sections[current_header] = '\n'.join(current_content).strip()
+        Args:
+            title (str): Header text
             
-            # Start new section
-            current_header = header_match.group(1)
-            current_content = []
-        else:
-            # Add line to current section
-            if current_header is not None:
-                current_content.append(line)
-            else:
-                # Handle content before first header
-                sections['preamble'] = line if not sections.get('preamble') else sections['preamble'] + '\n' + line
+        Returns:
+            Optional[int]: Section position, or None if not found
+        """
+        positions = self._by_title.get(title)
+        return positions[0] if positions else None
+
+    def find_all(self, title: str) -> List[int]:
+        """
+        Positions of every section with the given header, in document order.
+        
+        Args:
+            title (str): Header text
+            
+        Returns:
+            List[int]: Section positions
+        """
+        return list(self._by_title.get(title, ()))
+
+    def children(self, position: int) -> List[int]:
+        """
+        Positions of the sections directly under a section.
+        
+        Args:
+            position (int): Parent section position
+            
+        Returns:
+            List[int]: Child section positions, in document order
+        """
+        return [child for child in range(position + 1, len(self)) if self.parents[child] == position]
+
+    def text(self, position: int) -> str:
+        """
+        Body of a section, stripped (the preamble keeps trailing whitespace).
+        
+        Args:
+            position (int): Section position
+            
+        Returns:
+            str: Section content
+        """
+        body = self.markdown[self.starts[position]:self.ends[position]]
+        return body if self.levels[position] == 0 else body.strip()
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        """
+        Lazily yield (header, content) for every section in document order.
+        
+        Yields:
+            Tuple[str, str]: Header and section content
+        """
+        for position in range(len(self)):
+            yield self.titles[position], self.text(position)
+
+def split_by_headers(markdown_text: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Split markdown text into sections based on header levels.
     
-    # Save the last section
-    if current_header is not None:
-        sections[current_header] = '\n'.join(current_content).strip()
+    Repeated headers overwrite each other here; use SectionIndex to keep them.
     
-    return title, sections
+    Args:
+        markdown_text (str): Raw markdown text to be processed
+        
+    Returns:
+        Tuple[str, Dict[str, str]]: Title of the document and dictionary mapping headers to their content
+    """
+    index = SectionIndex(markdown_text)
+    return index.title, dict(index.items())
 
 def get_section(markdown_text: str, header_title: str) -> Optional[str]:
     """
@@ -71,10 +204,73 @@ def get_section(markdown_text: str, header_title: str) -> Optional[str]:
         header_title (str): Title of the section to extract
         
     Returns:
-        Optional[str]: Content of the requested section if found, None otherwise
+        Optional[str]: Content of the first section with that header if found, None otherwise
+    """
+    index = SectionIndex(markdown_text)
+    position = index.find(header_title)
+    return index.text(position) if position is not None else None
+
+# A cleaning step is a compiled pattern, its replacement and an optional
+# literal guard; the pass is skipped when the guard isn't in the text,
+# which can't change the result since every match contains the guard.
+# Group replacements are C-level getters rather than '\\1' templates,
+# which re expands in Python for every match. Steps aren't fused into one
+# alternation: each scans the previous step's output (removing a page
+# marker joins newline runs, stripping '_' can complete a '**' pair), and
+# a single pass would see neither those new matches nor the overlaps the
+# earlier step resolved.
+CleaningStep = Tuple['re.Pattern', Union[str, Callable[['re.Match'], str]], Optional[str]]
+
+PAGE_BREAK_STEPS: List[CleaningStep] = [
+    (re.compile(r'\n*-----\n*((\w\s)+\n*)?(\w)'), lambda m: ' ' + m[3], '-----'),
+    (re.compile(r'-----'), '', '-----'),
+    (re.compile(r'\n{3,}'), '\n\n', '\n\n\n'),
+]
+
+REFERENCE_STEPS: List[CleaningStep] = [
+    (re.compile(r'\[(\[\d{,3}\])+\]'), ' ', '[['),
+    (re.compile(r'\[(\[\d{,3}\]:\s*\d+\s*)+\[\d{,3}\]]'), '', '[['), # edge case [[9]: 375 [10]]
+    (re.compile(r'\[\[\d{,3}\]:\s*\d+[-‐‑‒–—―]\d+\s*\]'), '', '[['), # edge case [[9]: 482–484 ]
+    (re.compile(r'\[\w\]'), '', '['),
+]
+
+LINK_STEPS: List[CleaningStep] = [
+    (re.compile(r'\[(.*?)\]\(http.*?\)'), itemgetter(1), '](http'),
+]
+
+FORMATTING_STEPS: List[CleaningStep] = [
+    (re.compile(r'_([^_]*)_'), itemgetter(1), '_'),
+    (re.compile(r'\*\*(.*?)\*\*'), itemgetter(1), '**'),
+    (re.compile(r'```'), '', '```'),
+]
+
+KEY_VALUE_BOLD_STEPS: List[CleaningStep] = [
+    (re.compile(r'\s*\*\*(.*?)\*\* ([^\*\n]+)$'), lambda m: f'{m[1]}: {m[2]}', '**'),
+]
+
+SPACE_RUN_PATTERN = re.compile(r' {2,}')
+
+LIST_MARKER_PATTERN = re.compile(r'^[\d.)+\-*•◦‣⁃●○⚫]+\s')
+ALPHABETIC_LIST_PATTERN = re.compile(r'^[A-Za-z][\.\)\s]')
+KEY_VALUE_PATTERN = re.compile(r'^[^\n:]+:\s')
+BOLD_PATTERN = re.compile(r'\*\*(.*?)\*\*|__(.*?)__')
+BOLD_MARKER_PATTERN = re.compile(r'\*\*|__')
+
+def run_steps(s: str, steps: List[CleaningStep]) -> str:
+    """
+    Apply cleaning steps in order, skipping those whose guard is absent.
+    
+    Args:
+        s (str): Text to clean
+        steps (List[CleaningStep]): Steps to apply
+        
+    Returns:
+        str: Cleaned text
     """
-    sections = split_by_headers(markdown_text)
-    return sections.get(header_title)
+    for pattern, replacement, guard in steps:
+        if guard is None or guard in s:
+            s = pattern.sub(replacement, s)
+    return s
 
 def clean_page_breaks(s: str) -> str:
     """
@@ -87,11 +283,7 @@ def clean_page_breaks(s: str) -> str:
         str: Cleaned text with normalized spacing
     """
     # Remove page markers
-    s = re.sub(r'\n*-----\n*((\w\s)+\n*)?(\w)',r' \3', s)
-    s = re.sub(r'-----','', s)
-    s = re.sub(r'\n{3,}','\n\n', s)
-
-    return s
+    return run_steps(s, PAGE_BREAK_STEPS)
 
 def remove_links(s: str) -> str:
     """
@@ -103,9 +295,7 @@ def remove_links(s: str) -> str:
     Returns:
         str: Text with links removed but link text preserved
     """
-    s = re.sub(r'\[(.*?)\]\(http.*?\)', r'\1',s)
-    
-    return s
+    return run_steps(s, LINK_STEPS)
 
 def remove_references(s: str) -> str:
     """
@@ -117,11 +307,7 @@ def remove_references(s: str) -> str:
     Returns:
         str: Text with reference markers removed
     """
-    s = re.sub(r'\[(\[\d{,3}\])+\]', ' ',s)
-    s = re.sub(r'\[(\[\d{,3}\]:\s*\d+\s*)+\[\d{,3}\]]', '',s) # edge case [[9]: 375 [10]]
-    s = re.sub(r'\[\[\d{,3}\]:\s*\d+[-‐‑‒–—―]\d+\s*\]', '',s) # edge case [[9]: 482–484 ]
-    s = re.sub(r'\[\w\]', '',s)
-    return s
+    return run_steps(s, REFERENCE_STEPS)
 
 def clean_formatting(s: str) -> str:
     """
@@ -133,12 +319,7 @@ def clean_formatting(s: str) -> str:
     Returns:
         str: Clean text without markdown formatting
     """
-    s = re.sub(r'_([^_]*)_', r'\1',s)
-    s = re.sub(r'\*\*(.*?)\*\*', r'\1',s)
-    s = re.sub(r'```', '', s)
-    s = s.strip()
-
-    return s
+    return run_steps(s, FORMATTING_STEPS).strip()
 
 def catch_key_value_bold(s: str) -> str:
     """
@@ -150,9 +331,7 @@ def catch_key_value_bold(s: str) -> str:
     Returns:
         str: Text with bold patterns converted to key-value format
     """
-    s = re.sub(r'\s*\*\*(.*?)\*\* ([^\*\n]+)$', r'\1: \2', s)
-
-    return s
+    return run_steps(s, KEY_VALUE_BOLD_STEPS)
 
 def is_paragraph(text: str, min_length: int = 100, max_bold_percentage: int = 50) -> bool:
     """
@@ -167,36 +346,35 @@ def is_paragraph(text: str, min_length: int = 100, max_bold_percentage: int = 50
         bool: True if text represents a proper paragraph
     """
     # Check minimum length
-    if len(text.strip()) < min_length:
+    stripped = text.strip()
+    if len(stripped) < min_length:
         return False
             
-    # Check first characters of each line for list patterns
-    lines = text.strip().split('\n')
-    tracker = {'marker': 0, 'alphabet':0, 'key_value': 0 }
-    for line in lines:
+    # Check first characters of each line for list patterns,
+    # stopping as soon as any pattern has been seen twice
+    markers = alphabet = key_value = 0
+    for line in stripped.split('\n'):
         line = line.strip()
         if line:
             # Check for common list markers including alphabetic lists
-            if re.match(r'^[\d.)+\-*•◦‣⁃●○⚫]+\s', line):
-                tracker['marker'] += 1
+            if LIST_MARKER_PATTERN.match(line):
+                markers += 1
             # Check for alphabetic list patterns (A), B), C) or A. B. C. or a. b. c.)
-            if re.match(r'^[A-Za-z][\.\)\s]', line):
-                tracker['alphabet'] += 1
+            if ALPHABETIC_LIST_PATTERN.match(line):
+                alphabet += 1
             # Check for label: value pattern
-            if re.match(r'^[^\n:]+:\s', line):
-                tracker['key_value'] += 1
-                
-    if tracker['marker'] > 1 or \
-        tracker['alphabet'] > 1 or \
-            tracker['key_value'] > 1:
-        return False       
+            if ':' in line and KEY_VALUE_PATTERN.match(line):
+                key_value += 1
+            if markers > 1 or alphabet > 1 or key_value > 1:
+                return False
     
     # Check format percentage
-    bold_pattern = r'\*\*(.*?)\*\*|__(.*?)__'
-    bold_matches = re.findall(bold_pattern, text)
-    bold_length = sum(len(match[0] or match[1]) for match in bold_matches)
-    clean_text = re.sub(r'\*\*|__', '', text)
-    total_length = len(clean_text.strip())
+    if '**' in text or '__' in text:
+        bold_length = sum(len(match[0] or match[1]) for match in BOLD_PATTERN.findall(text))
+        total_length = len(BOLD_MARKER_PATTERN.sub('', text).strip())
+    else:
+        bold_length = 0
+        total_length = len(stripped)
     
     if total_length == 0:
         return False
@@ -217,35 +395,50 @@ def clean_paragraph(s: str) -> str:
     Returns:
         str: Cleaned paragraph text
     """
-    s = re.sub(r'\n+', ' ',s)
-    s = re.sub(r' {2,}', ' ',s)
-
+    # Newlines become spaces, so newline runs collapse with the space runs
+    s = s.replace('\n', ' ')
+    if '  ' in s:
+        s = SPACE_RUN_PATTERN.sub(' ', s)
     return s
 
-def chunk_text(text: str, max_size: int = CHUNK_SIZE, overlap: int = 30) -> List[str]:
+def iter_chunks(pieces: Iterable[str], max_size: int = CHUNK_SIZE, overlap: int = 30) -> Iterator[str]:
     """
-    Split text into overlapping chunks of specified size.
+    Chunk the concatenation of `pieces` exactly like `chunk_text`, holding
+    only about `max_size` characters of it at a time.
     
     Args:
-        text (str): Text to split into chunks
+        pieces (Iterable[str]): Consecutive parts of the text
         max_size (int): Maximum size of each chunk
         overlap (int): Number of characters to overlap between chunks
         
-    Returns:
-        List[str]: List of text chunks
+    Yields:
+        str: Text chunks
     """
-    chunks: List[str] = []
+    pieces = iter(pieces)
+    text = ''
     current_pos = 0
-    text_length = len(text)
+    more = True
     
-    while current_pos < text_length:
+    while True:
+        # Read ahead until a full window is buffered or the text ends
+        while more and len(text) - current_pos <= max_size:
+            piece = next(pieces, None)
+            if piece is None:
+                more = False
+            else:
+                text = text[current_pos:] + piece
+                current_pos = 0
+        text_length = len(text)
+        if current_pos >= text_length:
+            return
+        
         # Determine the initial chunk size
         end_pos = min(current_pos + max_size, text_length)
         
         if end_pos == text_length:
             # If this is the last chunk, just add it and break
-            chunks.append(text[current_pos:])
-            break
+            yield text[current_pos:]
+            return
             
         # Try to find a period within the last quarter of the chunk
         quarter = (end_pos - current_pos) // 4
@@ -265,113 +458,330 @@ def chunk_text(text: str, max_size: int = CHUNK_SIZE, overlap: int = 30) -> List
         # Add the chunk
         chunk = text[current_pos:chunk_end].strip()
         if chunk:
-            chunks.append(chunk)
+            yield chunk
         
         # Move position forward, accounting for overlap
         current_pos = max(chunk_end - overlap, current_pos + 1)
+
+def chunk_text(text: str, max_size: int = CHUNK_SIZE, overlap: int = 30) -> List[str]:
+    """
+    Split text into overlapping chunks of specified size.
     
-    return chunks
+    Args:
+        text (str): Text to split into chunks
+        max_size (int): Maximum size of each chunk
+        overlap (int): Number of characters to overlap between chunks
+        
+    Returns:
+        List[str]: List of text chunks
+    """
+    return list(iter_chunks((text,), max_size, overlap))
+
+REFERENCE_HEADERS = (
+    'reference', 'references', 'works cited', 'bibliography',
+    'works referenced', 'citations'
+)
 
-def get_docs(filename: str, outfile: str, break_on_ref: bool = True) -> None:
+def clean_section(content: str, ref_found: bool = False, break_on_ref: bool = True) -> List[str]:
     """
-    Process document and generate various output formats.
+    Clean one section's markdown into paragraphs and collected phrases.
     
     Args:
-        filename (str): Path to input document
-        outfile (str): Base name for output files
-        break_on_ref (bool): Whether to stop processing at references section
+        content (str): Markdown of the section
+        ref_found (bool): Whether a references section has been reached
+        break_on_ref (bool): Whether processing stops at references section
+        
+    Returns:
+        List[str]: Cleaned sub-sections, chunked to CHUNK_SIZE
     """
-    # Transform to markdown
-    doc = pymupdf4llm.to_markdown(filename)
-    doc = clean_page_breaks(doc)
+    f_sub_sections: List[str] = []
+    phrase_collector: List[str] = []
+    
+    for sub in content.split('\n\n'):
+        temp = remove_references(sub)
+        temp = remove_links(temp)
+        if is_paragraph(sub):
+            # Save clean out the phrase collector
+            if phrase_collector:
+                f_sub_sections.append('; '.join(phrase_collector))
+                phrase_collector = []
+            
+            if not break_on_ref and ref_found: 
+                f_sub_sections.append(temp)
+            
+            temp = clean_formatting(temp)
+            temp = clean_paragraph(temp)
+            if len(temp) > CHUNK_SIZE:
+                f_sub_sections.extend(chunk_text(temp))
+            else:
+                f_sub_sections.append(temp)
+        else:
+            temp = catch_key_value_bold(temp)
+            temp = clean_formatting(temp)
+            if temp:
+                phrase_collector.append(temp.replace('\n','; '))
 
-    pathlib.Path(f"{outfile}_check1.md").write_bytes(doc.encode())
+    # Save and clean out the phrase collector
+    if phrase_collector:
+        phrases = '; '.join(phrase_collector)
+        if len(phrases) > CHUNK_SIZE:
+            f_sub_sections.extend(chunk_text(phrases))
+        else:
+            f_sub_sections.append(phrases)
 
-    # Split by subjects
-    title, splits = split_by_headers(doc)
+    return f_sub_sections
 
-    # Format anything descriptive
+def clean_sections(index: SectionIndex, break_on_ref: bool = True) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Lazily clean each section in document order.
+    
+    Args:
+        index (SectionIndex): Sections of the document
+        break_on_ref (bool): Whether to stop processing at references section
+        
+    Yields:
+        Tuple[str, List[str]]: Header and its cleaned sub-sections
+    """
     ref_found = False
-    f_splits = {}
-    for header, content in splits.items():
+    for header, content in index.items():
         # Check if current section is references
-        is_ref = any(header.lower().strip() in ref for ref in {
-            'reference', 'references', 'works cited', 'bibliography',
-            'works referenced', 'citations'
-        })
+        is_ref = any(header.lower().strip() in ref for ref in REFERENCE_HEADERS)
         if break_on_ref:
             if is_ref or ref_found:
                 break
 
-        sub_sections = splits[header].split('\n\n')
-        f_sub_sections: List[str] = []
-        phrase_collector: List[str] = []
-        
-        for sub in sub_sections:
-            temp = remove_references(sub)
-            temp = remove_links(temp)
-            if is_paragraph(sub):
-                # Save clean out the phrase collector
-                if phrase_collector:
-                    f_sub_sections.append('; '.join(phrase_collector))
-                    phrase_collector = []
-                
-                if not break_on_ref and ref_found: 
-                    f_sub_sections.append(temp)
-                
-                temp = clean_formatting(temp)
-                temp = clean_paragraph(temp)
-                if len(temp) > CHUNK_SIZE:
-                    f_sub_sections.extend(chunk_text(temp))
+        yield header, clean_section(content, ref_found, break_on_ref)
+
+class JsonListWriter:
+    """
+    Writes a JSON list one item at a time, byte-identical to json.dump of the whole list.
+    """
+    
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.count = 0
+        f.write('[')
+    
+    def write(self, item) -> None:
+        self.write_encoded(json.dumps(item))
+    
+    def write_encoded(self, encoded: str) -> None:
+        self.f.write(', ' + encoded if self.count else encoded)
+        self.count += 1
+    
+    def close(self) -> None:
+        self.f.write(']')
+
+def write_docs(doc: str, outfile: str, break_on_ref: bool = True) -> None:
+    """
+    Clean and split a document's markdown and write the output formats.
+    
+    Sections are cleaned and written one at a time, so apart from the
+    markdown itself only the current section is held in memory. The
+    header chunks that follow the docs in the JSON output are spooled to
+    temporary files until the docs are written.
+    
+    Args:
+        doc (str): Markdown of the whole document
+        outfile (str): Base name for output files
+        break_on_ref (bool): Whether to stop processing at references section
+    """
+    doc = clean_page_breaks(doc)
+
+    pathlib.Path(f"{outfile}_check1.md").write_bytes(doc.encode())
+
+    # Split by subjects
+    index = SectionIndex(doc)
+    title = index.title
+
+    with ExitStack() as stack:
+        check2 = stack.enter_context(open(f"{outfile}_check2.md", 'w', encoding='utf-8', newline=''))
+        text = stack.enter_context(open(f"{outfile}.txt", 'w', encoding='utf-8', newline=''))
+        docs = JsonListWriter(stack.enter_context(open(f'{outfile}.json', 'w', newline='')))
+        second_chunks = stack.enter_context(tempfile.TemporaryFile('w+', encoding='utf-8'))
+        third_chunks = stack.enter_context(tempfile.TemporaryFile('w+', encoding='utf-8'))
+
+        def write_doc(item: str) -> None:
+            text.write('\n\n' + item if docs.count else item)
+            docs.write(item)
+
+        def second() -> Iterator[str]:
+            # Headers and sub-sections, space-separated, as the text to chunk
+            separator = ''
+            for header, content in sections():
+                yield separator + ' '.join((f'{title} {header}', *content)).lower()
+                separator = ' '
+
+        # The first section headed by the title leads the docs; only the
+        # preamble can come before it, so at most that one is held back
+        held: List[Tuple[str, List[str]]] = []
+        title_found = False
+
+        def sections() -> Iterator[Tuple[str, List[str]]]:
+            nonlocal title_found
+            # Format anything descriptive, keeping repeated headers as separate sections
+            for header, content in clean_sections(index, break_on_ref):
+                check2.write(f'{title} {header}\n\n')
+                for c in content:
+                    check2.write(f'{c}\n\n')
+                check2.write('\n\n')
+                third_chunks.writelines(f'{json.dumps(chunk)}\n' for chunk in chunk_text(' '.join(content).lower(), 200, 20))
+
+                if not title_found and header == title:
+                    title_found = True
+                    for section in content:
+                        write_doc(f'{section} - {title}')
+                    for held_header, held_content in held:
+                        for section in held_content:
+                            write_doc(f'{section} - {title} {held_header}')
+                    held.clear()
+                if title_found:
+                    for section in content:
+                        write_doc(f'{section} - {title} {header}')
                 else:
-                    f_sub_sections.append(temp)
-            else:
-                temp = catch_key_value_bold(temp)
-                temp = clean_formatting(temp)
-                if temp:
-                    phrase_collector.append(temp.replace('\n','; '))
-
-        # Save and clean out the phrase collector
-        if phrase_collector:
-            phrases = '; '.join(phrase_collector)
-            if len(phrases) > CHUNK_SIZE:
-                f_sub_sections.extend(chunk_text(phrases))
-            else:
-                f_sub_sections.append(phrases)
-            phrase_collector = []
+                    held.append((header, content))
+                yield header, content
+
+        second_chunks.writelines(f'{json.dumps(chunk)}\n' for chunk in iter_chunks(second(), 300, 30))
+        for held_header, held_content in held:
+            for section in held_content:
+                write_doc(f'{section} - {title} {held_header}')
 
-        f_splits[header] = f_sub_sections
+        # Save outputs in different formats
+        for spool in (second_chunks, third_chunks):
+            spool.seek(0)
+            # Spooled chunks are already encoded, one per line
+            for line in spool:
+                docs.write_encoded(line[:-1])
+        docs.close()
 
-    # Prepare output formats
-    output = []
-    second = []
-    third = []
-    for header, content in f_splits.items():
-        output.append(f'{title} {header}\n\n')
-        second.append(f'{title} {header}')
-        third.extend(chunk_text(' '.join(content).lower(), 200, 20))
-        for c in content:
-            output.append(f'{c}\n\n')
-            second.append(f'{c}')
-        output.append('\n\n')
+def page_ranges(page_count: int, pages_per_task: int = PAGES_PER_TASK) -> List[List[int]]:
+    """
+    Split a document's pages into consecutive ranges for parallel conversion.
+    
+    Args:
+        page_count (int): Number of pages in the document
+        pages_per_task (int): Maximum pages per range
+        
+    Returns:
+        List[List[int]]: Zero-based page numbers of each range, in order
+    """
+    return [list(range(start, min(start + pages_per_task, page_count)))
+            for start in range(0, page_count, pages_per_task)]
+
+def header_info(filename: str):
+    """
+    Identify header font sizes over the whole document, so every page range
+    maps font sizes to the same header levels as a single-pass conversion.
+    
+    Args:
+        filename (str): Path to input document
+        
+    Returns:
+        Header info accepted by pymupdf4llm.to_markdown, or None if unavailable
+    """
+    if hasattr(pymupdf4llm, 'IdentifyHeaders'):
+        return pymupdf4llm.IdentifyHeaders(str(filename))
+    return None
+
+def markdown_range(filename: str, pages: List[int], hdr_info=None) -> str:
+    """
+    Convert a range of pages to markdown.
+    
+    Args:
+        filename (str): Path to input document
+        pages (List[int]): Zero-based page numbers to convert
+        hdr_info: Header info from `header_info`
+        
+    Returns:
+        str: Markdown of the pages, with the same page separators as a full conversion
+    """
+    return pymupdf4llm.to_markdown(str(filename), pages=pages, hdr_info=hdr_info)
+
+def to_markdown(filename: str, workers: int = 1, pages_per_task: int = PAGES_PER_TASK) -> str:
+    """
+    Convert a PDF to markdown, splitting large documents across processes.
+    
+    Args:
+        filename (str): Path to input document
+        workers (int): Worker processes; 1 converts in this process
+        pages_per_task (int): Pages converted per worker task
+        
+    Returns:
+        str: Markdown identical to a single-pass conversion
+    """
+    with pymupdf.open(filename) as pdf:
+        page_count = pdf.page_count
 
-    # Save outputs in different formats
-    pathlib.Path(f"{outfile}_check2.md").write_bytes(''.join(output).encode())
-    chunks = chunk_text(' '.join(second).lower(), 300, 30) + third
+    if workers <= 1 or page_count <= pages_per_task:
+        return pymupdf4llm.to_markdown(str(filename))
 
-    docs = []
-    for section in f_splits[title]:
-        docs.append(f'{section} - {title}')
+    hdr_info = header_info(filename)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(markdown_range, filename, pages, hdr_info)
+                   for pages in page_ranges(page_count, pages_per_task)]
+        return ''.join(f.result() for f in futures)
+
+def get_docs(filename: str, outfile: str, break_on_ref: bool = True, workers: int = 1) -> None:
+    """
+    Process document and generate various output formats.
+    
+    Args:
+        filename (str): Path to input document
+        outfile (str): Base name for output files
+        break_on_ref (bool): Whether to stop processing at references section
+        workers (int): Worker processes used to convert large PDFs
+    """
+    # Transform to markdown
+    write_docs(to_markdown(filename, workers), outfile, break_on_ref)
 
-    for header, sections in f_splits.items():
-        for section in sections:
-            docs.append(f'{section} - {title} {header}')
+def process_pdfs(jobs: List[Tuple[str, str]], workers: int = 1, break_on_ref: bool = True,
+                 pages_per_task: int = PAGES_PER_TASK) -> None:
+    """
+    Process many documents on one process pool, fanning out across files
+    and across page ranges within each file.
+    
+    Page ranges of every file are converted concurrently, then each file's
+    markdown is merged in page order and post-processed, so the outputs are
+    identical to calling `get_docs` on each file serially.
+    
+    Args:
+        jobs (List[Tuple[str, str]]): (input document, output base name) pairs
+        workers (int): Worker processes; 1 processes everything serially
+        break_on_ref (bool): Whether to stop processing at references section
+        pages_per_task (int): Pages converted per worker task
+    """
+    if workers <= 1:
+        for filename, outfile in jobs:
+            get_docs(filename, outfile, break_on_ref)
+        return
 
-    with open(f'{outfile}.json', 'w') as f:
-        json.dump(docs + chunks, f)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        conversions = []
+        for filename, outfile in jobs:
+            with pymupdf.open(filename) as pdf:
+                page_count = pdf.page_count
+            if page_count <= pages_per_task:
+                futures = [pool.submit(pymupdf4llm.to_markdown, str(filename))]
+            else:
+                hdr_info = header_info(filename)
+                futures = [pool.submit(markdown_range, filename, pages, hdr_info)
+                           for pages in page_ranges(page_count, pages_per_task)]
+            conversions.append((outfile, futures))
 
-    pathlib.Path(f"{outfile}.txt").write_bytes('\n\n'.join(docs).encode())
+        writes = [
+            pool.submit(write_docs, ''.join(f.result() for f in futures), outfile, break_on_ref)
+            for outfile, futures in conversions
+        ]
+        for future in writes:
+            future.result()
 
 if __name__ == '__main__':
-    get_docs("docs/pdfs/Renard R.31 (1) (1).pdf", "docs1")
-    get_docs("docs/pdfs/Australia Women's Softball Team (1) (1).pdf", "docs2")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Convert PDFs to cleaned docs')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes for PDF conversion')
+    args = parser.parse_args()
+
+    process_pdfs([
+        ("docs/pdfs/Renard R.31 (1) (1).pdf", "docs1"),
+        ("docs/pdfs/Australia Women's Softball Team (1) (1).pdf", "docs2"),
+    ], workers=args.workers)
\ No newline at end of file
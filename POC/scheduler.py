@@ -0,0 +1,247 @@
+"""
+Quota-aware asyncio scheduler for calls to rate-limited services.
+
+Each service gets a token bucket sized to its per-minute quota and a
+concurrency limit. Calls that come back rate limited (HTTP 429, gRPC
+RESOURCE_EXHAUSTED) pause the service for the Retry-After delay and halve
+its rate, which then climbs back towards the configured quota as calls
+succeed.
+"""
+import asyncio
+import random
+import time
+
+RATE_LIMIT_STATUSES = {429}
+RATE_LIMIT_ERRORS = {'ResourceExhausted', 'TooManyRequests', 'RateLimitError'}
+
+# Adaptive rate bounds, as fractions of the configured quota
+MIN_RATE_FRACTION = 0.05
+RECOVERY_STEP = 0.05
+
+
+def is_rate_limited(error):
+    """
+    Whether `error` is a provider rejecting the call for exceeding its quota.
+    """
+    status = getattr(error, 'status_code', None) or getattr(error, 'status', None) or getattr(error, 'code', None)
+    if callable(status):
+        status = status()
+    return status in RATE_LIMIT_STATUSES or type(error).__name__ in RATE_LIMIT_ERRORS
+
+
+def retry_after(error):
+    """
+    Seconds the provider asked us to wait, from a retry_after attribute or a
+    Retry-After header on the error's response, or None.
+    """
+    value = getattr(error, 'retry_after', None)
+    if value is None:
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        value = headers.get('Retry-After') or headers.get('retry-after')
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket that never lets more than `limit` units through in any
+    `period` seconds.
+
+    The bucket holds at most `burst` tokens and refills at
+    (limit - burst) / period per second, so a full burst plus a period of
+    refill still fits the quota. `burst` must cover the largest single
+    cost, e.g. the embedding batch size when the quota counts texts.
+    """
+
+    def __init__(self, limit, period=60.0, burst=1):
+        if limit <= burst:
+            raise ValueError(f"Quota {limit} must be larger than the burst size {burst}")
+        self.limit = limit
+        self.period = period
+        self.burst = burst
+        self.max_rate = (limit - burst) / period
+        self.rate = self.max_rate
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = None
+        self._loop = None
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, cost=1):
+        if cost > self.burst:
+            raise ValueError(f"Cost {cost} is larger than the burst size {self.burst}")
+        # The lock queues waiters in arrival order; buckets outlive event
+        # loops when shared across runs, so it's made per loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return
+                await asyncio.sleep((cost - self.tokens) / self.rate)
+
+    def throttle(self, delay=None):
+        """
+        Back off after a rate-limited call: halve the rate, drop saved tokens
+        and pause for `delay` seconds (or one token's worth if not given).
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+        self.tokens = 0.0
+        self.paused_until = max(self.paused_until, now + (delay if delay is not None else 1 / self.rate))
+
+    def relax(self):
+        """
+        Step the rate back towards the quota after a successful call.
+        """
+        if self.rate < self.max_rate:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_STEP)
+
+
+class Progress:
+    """
+    Completed-job counter that prints throughput and an ETA every `interval` seconds.
+    """
+
+    def __init__(self, label, total, interval=5.0):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.started = time.monotonic()
+
+    def line(self, scheduler):
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        eta = (self.total - self.done) / rate if rate else float('inf')
+        return (f"{self.label}: {self.done}/{self.total} jobs ({self.done / max(1, self.total):.0%}), "
+                f"{rate:.1f}/s, ETA {eta:.0f}s, {scheduler.rate_limited} rate-limited")
+
+    async def report(self, scheduler):
+        while True:
+            await asyncio.sleep(self.interval)
+            print(self.line(scheduler))
+
+
+class Scheduler:
+    """
+    Runs blocking service calls on threads under per-service quotas.
+
+    Args:
+        buckets (dict): Service name to TokenBucket; services without one are unthrottled
+        concurrency (dict): Service name to maximum calls in flight (default 4)
+        max_attempts (int): Attempts per call for errors other than rate limiting
+        max_rate_limited (int): Rate-limited retries per call before giving up
+        progress_interval (float): Seconds between progress lines, None for none
+    """
+
+    def __init__(self, buckets=None, concurrency=None, max_attempts=5, max_rate_limited=20, progress_interval=5.0):
+        self.buckets = {name: bucket for name, bucket in (buckets or {}).items() if bucket is not None}
+        self.concurrency = concurrency or {}
+        self.max_attempts = max_attempts
+        self.max_rate_limited = max_rate_limited
+        self.progress_interval = progress_interval
+        self.rate_limited = 0
+        self.retries = 0
+        self.calls = {}
+        self._semaphores = {}
+
+    def _semaphore(self, service):
+        key = (asyncio.get_running_loop(), service)
+        if key not in self._semaphores:
+            self._semaphores[key] = asyncio.Semaphore(self.concurrency.get(service, 4))
+        return self._semaphores[key]
+
+    async def call(self, service, fn, *args, cost=1):
+        """
+        Call fn(*args) on a thread once `service` has quota and a free slot.
+
+        Rate-limited calls wait out the throttled bucket and retry; other
+        errors are retried with jittered exponential backoff.
+        """
+        bucket = self.buckets.get(service)
+        attempts = 0
+        limited = 0
+        while True:
+            async with self._semaphore(service):
+                if bucket is not None:
+                    await bucket.acquire(cost)
+                self.calls[service] = self.calls.get(service, 0) + 1
+                try:
+                    result = await asyncio.to_thread(fn, *args)
+                except Exception as e:
+                    error = e
+                else:
+                    if bucket is not None:
+                        bucket.relax()
+                    return result
+
+            if is_rate_limited(error):
+                self.rate_limited += 1
+                limited += 1
+                if limited > self.max_rate_limited:
+                    raise error
+                delay = retry_after(error)
+                if bucket is not None:
+                    bucket.throttle(delay)
+                else:
+                    await asyncio.sleep(delay if delay is not None else min(30.0, 2 ** limited))
+                continue
+
+            attempts += 1
+            if attempts >= self.max_attempts:
+                raise error
+            self.retries += 1
+            delay = min(30.0, 2 ** (attempts - 1)) * (0.5 + random.random() / 2)
+            print(f"Attempt {attempts} on {service} failed ({error}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def gather(self, jobs, label='jobs'):
+        """
+        Await `jobs` with progress reporting.
+
+        Returns:
+            list: Each job's result, or the exception it raised, in order
+        """
+        progress = Progress(label, len(jobs), self.progress_interval or 0)
+
+        async def tracked(job):
+            try:
+                return await job
+            finally:
+                progress.done += 1
+
+        reporter = asyncio.create_task(progress.report(self)) if self.progress_interval else None
+        try:
+            return await asyncio.gather(*(tracked(job) for job in jobs), return_exceptions=True)
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+            if self.progress_interval:
+                print(progress.line(self))
+
+    def map(self, service, fn, items, cost=1, label=None):
+        """
+        Blocking helper: call fn(item) for every item under the service's quota.
+
+        Returns:
+            list: Results or exceptions, in the order of `items`
+        """
+        async def run():
+            return await self.gather([self.call(service, fn, item, cost=cost) for item in items], label or service)
+        return asyncio.run(run())
@@ -16,7 +16,18 @@ pip install \
     --only-binary=:all: \
     --target .aws-sam/layers/python/lib/python3.12/site-packages \
     -r aws/requirements.txt
-    
+
+# The inference functions get a smaller layer without PyMuPDF; boto3 is
+# left to the Lambda runtime. Less to unpack means a faster cold start
+mkdir -p .aws-sam/inference-layer/python/lib/python3.12/site-packages
+pip install \
+    --platform manylinux2014_x86_64 \
+    --implementation cp \
+    --python-version 3.12 \
+    --only-binary=:all: \
+    --target .aws-sam/inference-layer/python/lib/python3.12/site-packages \
+    -r aws/requirements-inference.txt
+
 
 # Deactivate virtual environment
 deactivate
@@ -1,106 +1,611 @@
-import google.generativeai as genai
+import contextvars
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
-from pinecone import Pinecone
-from util import create_log, get_secret
+# google.generativeai, pinecone and boto3, and the numpy-backed caches and
+# stores, are imported by the client factories on first use rather than
+# here, keeping them out of the cold start; a warm-up event
+# ({"warmup": true}) builds the clients ahead of traffic
+from clients import ClientPool
+from context_assembly import CONTEXT_TOKEN_BUDGET, assemble_context
+from fallback import FallbackPolicy
+from tracing import Lazy, Tracer
+from util import create_log, SecretProvider
 
-PINECONE_DEV_KEY = get_secret("PINECONE_DEV_KEY")
-GEMINI_DEV_KEY = get_secret("GEMINI_DEV_KEY")
 LOG_LEVEL = os.environ.get("LOG_LEVEL")
 
+INDEX_NAME = 'semantic-search-gemini'
+EMBEDDING_MODEL = "models/text-embedding-004"
+GENERATION_MODELS = ["gemini-1.5-flash-8b", "gemini-1.5-flash", "gemini-1.0-pro"]
+NO_ANSWER_MARKERS = ("I'm sorry", "I cannot answer")
+
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", 10000))
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", 0.95))
+INDEX_VERSION_TTL = float(os.environ.get("INDEX_VERSION_TTL", 60))
+
+# 'vector', 'lexical' (BM25 over LEXICAL_INDEX_PATH) or 'hybrid' (both fused
+# by reciprocal rank); lexical modes fall back to vector without an index
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_TOP_K = 5
+FUSION_CANDIDATES = int(os.environ.get("FUSION_CANDIDATES", 20))
+# Matches fetched for the context assembler, which merges overlapping
+# windows and packs them into CONTEXT_TOKEN_BUDGET tokens
+CONTEXT_CANDIDATES = int(os.environ.get("CONTEXT_CANDIDATES", 20))
+# A lexical match at least this confident, and this far ahead of the
+# runner-up, is answered without embedding or vector search; 0 disables it
+LEXICAL_FAST_PATH_CONFIDENCE = float(os.environ.get("LEXICAL_FAST_PATH_CONFIDENCE", 0.6))
+LEXICAL_FAST_PATH_MARGIN = float(os.environ.get("LEXICAL_FAST_PATH_MARGIN", 1.5))
+
+FALLBACK_MODE = os.environ.get("FALLBACK_MODE", "hedged")
+HEDGE_DELAY = float(os.environ.get("HEDGE_DELAY", 3.0))
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", 0.9))
+# Losing hedge/race calls still running, above which no more are started
+FALLBACK_MAX_ABANDONED = int(os.environ.get("FALLBACK_MAX_ABANDONED", 8))
+
+# Batch requests ({"questions": [...]}) are kept within API Gateway's 29s
+# integration timeout and Lambda's 6MB synchronous response limit
+MAX_BATCH_QUESTIONS = int(os.environ.get("MAX_BATCH_QUESTIONS", 50))
+MAX_QUESTION_CHARS = int(os.environ.get("MAX_QUESTION_CHARS", 2000))
+MAX_RESPONSE_BYTES = int(os.environ.get("MAX_RESPONSE_BYTES", 5 * 1024 * 1024))
+BATCH_QUERY_CONCURRENCY = int(os.environ.get("BATCH_QUERY_CONCURRENCY", 16))
+BATCH_GENERATION_CONCURRENCY = int(os.environ.get("BATCH_GENERATION_CONCURRENCY", 4))
+API_GATEWAY_TIMEOUT = 29
+DEADLINE_MARGIN = float(os.environ.get("DEADLINE_MARGIN", 2.0))
+
 logger = create_log('inference_handler', LOG_LEVEL)
 
-def create_context(question):
+# Per-request stage timings, written as CloudWatch EMF lines
+tracer = Tracer('inference')
+
+# Secrets are fetched together on first use rather than at import
+secrets = SecretProvider(["PINECONE_DEV_KEY", "GEMINI_DEV_KEY"])
+
+_index_version = {'value': None, 'checked': 0.0}
+
+# Clients live at module scope so warm invocations reuse them
+clients = ClientPool()
+
+
+def _configure_gemini():
+    with tracer.span('sdk_import'):
+        import google.generativeai as genai
+    with tracer.span('secrets'):
+        api_key = secrets.get("GEMINI_DEV_KEY")
+    genai.configure(api_key=api_key)
+    return genai
+
+
+def _pinecone_index():
+    with tracer.span('sdk_import'):
+        from pinecone import Pinecone
+    with tracer.span('secrets'):
+        api_key = secrets.get("PINECONE_DEV_KEY")
+    return Pinecone(api_key=api_key).Index(INDEX_NAME)
+
+
+def _embedding_cache():
+    from cache import embedding_cache_from_env
+    return embedding_cache_from_env()
+
+
+def _answer_cache():
+    from cache import SemanticAnswerCache
+    return SemanticAnswerCache(max_size=ANSWER_CACHE_SIZE, threshold=ANSWER_CACHE_THRESHOLD)
+
+
+def _vector_store():
+    from vector_store import vector_store_from_env
+    return vector_store_from_env(_pinecone_index, read_only=True)
+
+
+def _lexical_index():
+    from lexical_index import lexical_index_from_env
+    return lexical_index_from_env(version=get_index_version())
+
+
+def _docstore():
+    from docstore import docstore_from_env
+    return docstore_from_env(version=get_index_version())
+
+
+def _generative_model(name):
+    return clients.get('gemini').GenerativeModel(name)
+
+
+def _refresh_gemini(error):
     """
-    Create a context for a question by finding the most similar context from the pinecone index
+    After an auth failure, expire the secrets and drop every Gemini client
+    so they are rebuilt (and genai reconfigured) with the rotated key
     """
-    logger.info(f"Creating context for question: {question}")
+    if secrets.refresh_on_auth_failure(error):
+        for client in ('gemini', *GENERATION_MODELS):
+            clients.invalidate(client)
+        return True
+    return False
 
-    pc = Pinecone(api_key=PINECONE_DEV_KEY)
-    logger.debug("Initialized Pinecone client")
 
-    index = pc.Index('semantic-search-gemini')
-    logger.debug("Connected to 'semantic-search-gemini' index")
-    
-    # Get the embeddings for the question
+# Query embeddings are cached by normalized question text
+clients.register('embedding_cache', _embedding_cache)
+# Answers are cached by question embedding and dropped when the index changes
+clients.register('answer_cache', _answer_cache)
+clients.register('vector_store', _vector_store, on_error=secrets.refresh_on_auth_failure)
+clients.register('gemini', _configure_gemini, on_error=_refresh_gemini)
+clients.register('lexical_index', _lexical_index)
+# With a docstore (DOCSTORE_PATH), vector queries return ids only and the
+# chunk texts are read locally
+clients.register('docstore', _docstore)
+for _model_name in GENERATION_MODELS:
+    clients.register(_model_name, lambda name=_model_name: _generative_model(name), on_error=_refresh_gemini)
+
+# Clients built by a warm-up event, in the order a query first uses them
+WARMUP_CLIENTS = ['lexical_index', 'embedding_cache', 'gemini', 'answer_cache', 'vector_store', 'docstore',
+                  *GENERATION_MODELS]
+
+# Models are tried in order of preference, with refusals treated as a miss
+generation_policy = FallbackPolicy(
+    GENERATION_MODELS,
+    clients.get,
+    mode=FALLBACK_MODE,
+    hedge_percentile=HEDGE_PERCENTILE,
+    hedge_delay=HEDGE_DELAY,
+    is_acceptable=lambda text: bool(text) and "I'm sorry" not in text,
+    on_error=lambda name, error: _refresh_gemini(error),
+    max_abandoned=FALLBACK_MAX_ABANDONED)
+
+def embed_question(question):
+    """
+    Get the embedding for a question, using the embedding cache when possible
+    """
     logger.debug("Generating embeddings for question")
-    q_embeddings  = genai.embed_content(
-        model="models/text-embedding-004",
-        content=question)
+    with tracer.span('embed'):
+        q_embedding = clients.get('embedding_cache').get_or_embed(
+            question,
+            EMBEDDING_MODEL,
+            None,
+            lambda: clients.call('gemini', lambda genai: genai.embed_content(
+                model=EMBEDDING_MODEL,
+                content=question)['embedding']))
     logger.debug("Successfully generated embeddings")
+    return q_embedding
+
+def embed_questions(questions):
+    """
+    Get embeddings for several questions, embedding all cache misses in one request
+    """
+    embedding_cache = clients.get('embedding_cache')
+    embeddings = [embedding_cache.get(question, EMBEDDING_MODEL, None) for question in questions]
+    missing = list(dict.fromkeys(q for q, e in zip(questions, embeddings) if e is None))
+    if missing:
+        logger.debug("Generating embeddings for %d questions", len(missing))
+        with tracer.span('embed'):
+            result = clients.call(
+                'gemini',
+                lambda genai: genai.embed_content(model=EMBEDDING_MODEL, content=missing)['embedding'])
+        embedded = dict(zip(missing, result))
+        for question, embedding in embedded.items():
+            embedding_cache.put(question, EMBEDDING_MODEL, None, embedding)
+        embeddings = [e if e is not None else embedded[q] for q, e in zip(questions, embeddings)]
+    return embeddings
+
+def get_index_version():
+    """
+    Get the current index version used to invalidate cached answers.
+
+    INDEX_VERSION can be set at deploy time. Otherwise the version written
+    by ingestion (INDEX_VERSION_PATH, by default next to the docstore) is
+    used, re-read at most once every INDEX_VERSION_TTL seconds. Without
+    one, the index's vector count is a last resort, which misses
+    re-ingests that change chunks but not their number. When the version
+    changes, the docstore and lexical index are dropped so the next use
+    reopens (and, from S3, downloads) the re-ingested ones.
+    """
+    if os.environ.get("INDEX_VERSION"):
+        return os.environ["INDEX_VERSION"]
+
+    now = time.monotonic()
+    if _index_version['value'] is None or now - _index_version['checked'] > INDEX_VERSION_TTL:
+        from docstore import index_version_from_env
+        with tracer.span('index_stats'):
+            version = index_version_from_env()
+            if version is None:
+                stats = clients.call('vector_store', lambda index: index.describe_index_stats())
+                version = stats.total_vector_count
+        previous = _index_version['value']
+        _index_version['value'] = version
+        if previous is not None and version != previous:
+            logger.info("Index version changed from %s to %s, reloading the docstore and lexical index", previous, version)
+            clients.invalidate('docstore')
+            clients.invalidate('lexical_index')
+        _index_version['checked'] = now
+    return _index_version['value']
+
+def retrieval_mode():
+    """
+    Configured retrieval mode, or 'vector' when no lexical index is available
+    """
+    if RETRIEVAL_MODE == 'vector':
+        return RETRIEVAL_MODE
+    # Checked here too, as fast-path answers never reach the answer cache's
+    # check, so a re-ingested lexical index is still picked up
+    get_index_version()
+    if clients.get('lexical_index') is None:
+        return 'vector'
+    return RETRIEVAL_MODE
+
+def lexical_search(question, top_k=FUSION_CANDIDATES):
+    """
+    Rank chunks for a question with the BM25 lexical index
+    """
+    with tracer.span('lexical_query'):
+        result = clients.get('lexical_index').query(question, top_k=top_k)
+    logger.debug("Lexical confidence %.2f, margin %.2f", result.confidence, result.margin)
+    return result
+
+def lexical_is_confident(result):
+    """
+    Whether a lexical result is trusted without vector search
+    """
+    return (LEXICAL_FAST_PATH_CONFIDENCE > 0 and bool(result.matches)
+            and result.confidence >= LEXICAL_FAST_PATH_CONFIDENCE
+            and result.margin >= LEXICAL_FAST_PATH_MARGIN)
+
+def create_context(question, q_embedding=None, lexical=None):
+    """
+    Create a context for a question from the vector index, the lexical index or both fused
+    """
+    logger.info("Creating context for question: %s", question)
+    mode = retrieval_mode()
+
+    if mode != 'vector' and lexical is None:
+        lexical = lexical_search(question, FUSION_CANDIDATES if mode == 'hybrid' else CONTEXT_CANDIDATES)
+    if mode == 'lexical':
+        return join_context(lexical.matches)
+
+    # Get the embeddings for the question
+    if q_embedding is None:
+        q_embedding = embed_question(question)
     
     # Get the distances from the embeddings
-    logger.debug("Querying Pinecone index for similar contexts")
-    res = index.query(vector=[q_embeddings['embedding']], top_k=5, include_metadata=True)
-    logger.debug(f"Found {len(res.matches)} matching contexts")
-    logger.debug(f"Matches: {res.matches}")
-
-    results = []
-    for m in res.matches:
-        text = m['metadata']['text']
-        results.append(text)
- 
-    context = r"\n\n###\n\n".join(results)
-    logger.info(f"Created context with {len(results)} text segments")
-    logger.debug(f"Total context length: {len(context)} characters")
+    logger.debug("Querying '%s' index for similar contexts", INDEX_NAME)
+    top_k = FUSION_CANDIDATES if mode == 'hybrid' else CONTEXT_CANDIDATES
+    docstore = clients.get('docstore')
+    with tracer.span('vector_query'):
+        res = clients.call(
+            'vector_store',
+            lambda index: index.query(vector=[q_embedding], top_k=top_k, include_metadata=docstore is None))
+    logger.debug("Found %d matching contexts", len(res.matches))
+    logger.debug("Matches: %s", res.matches)
+    matches = res.matches if docstore is None else resolve_texts(res.matches, docstore)
+
+    if mode == 'hybrid':
+        from lexical_index import reciprocal_rank_fusion
+        return join_context(reciprocal_rank_fusion([matches, lexical.matches], top_k=CONTEXT_CANDIDATES))
+    return join_context(matches)
+
+def resolve_texts(matches, docstore):
+    """
+    Attach chunk texts from the docstore to id-only matches, dropping ids it doesn't hold
+    """
+    with tracer.span('docstore'):
+        texts = docstore.get_many(m['id'] for m in matches)
+    resolved = [
+        {'id': m['id'], 'score': m['score'], 'metadata': {'text': texts[m['id']]}}
+        for m in matches if m['id'] in texts
+    ]
+    if len(resolved) < len(matches):
+        logger.warning("%d matched ids are missing from the docstore", len(matches) - len(resolved))
+    return resolved
+
+def join_context(matches):
+    """
+    Assemble the prompt context from retrieved matches, best first, within CONTEXT_TOKEN_BUDGET
+    """
+    assembled = assemble_context(matches, max_tokens=CONTEXT_TOKEN_BUDGET, raw_k=RETRIEVAL_TOP_K)
+    context = assembled.text
+    logger.info("Created context with %d text segments from %d matches (%d merged, %d redundant)",
+                assembled.segments, assembled.candidates, assembled.merged, assembled.dropped)
+    logger.debug("Total context length: %d characters", len(context))
+    tracer.set('context_segments', assembled.segments)
+    tracer.set('context_chars', len(context))
+    tracer.set('context_tokens', assembled.tokens)
+    tracer.set('context_tokens_raw', assembled.raw_tokens)
 
     return context
 
+def build_prompt(question, context):
+    """
+    Build the generation prompt from the question and retrieved context
+    """
+    return f"You are a learning tool for veterans. Answer the question based on the context below, and if the question can't be answered based on the context, say \"I'm sorry I cannot answer the question\"\n\nContext: {context}\n\n---\n\nQuestion: {question}\nAnswer:"
+
 def answer_question(
-    question
+    question,
+    stream=False
 ):
     """
     Answer a question based on the most similar context from pinecone
+
+    With stream=True a generator of text chunks is returned instead of the
+    full answer text.
     """
-    logger.info(f"Starting to process question: {question}")
-    
-    genai.configure(api_key=GEMINI_DEV_KEY)
-    logger.debug("Configured Gemini API")
+    logger.info("Starting to process question: %s", question)
 
-    context = create_context(question)
-    logger.debug(f"Retrieved context length: {len(context)}")
+    # Questions with a confident exact-term match skip the embedding round trip
+    mode = retrieval_mode()
+    tracer.property('retrieval_mode', mode)
+    lexical = None
+    if mode != 'vector':
+        lexical = lexical_search(question)
+        fast_path = mode == 'lexical' or lexical_is_confident(lexical)
+        tracer.set('lexical_fast_path', 1 if fast_path else 0)
+        if fast_path:
+            logger.info("Answering from the lexical index (confidence %.2f)", lexical.confidence)
+            message = build_prompt(question, join_context(lexical.matches))
+            return _generate_answer(message, stream)
+
+    q_embedding = embed_question(question)
+    index_version = get_index_version()
+    cached = clients.get('answer_cache').lookup(q_embedding, index_version)
+    tracer.set('answer_cache_hit', 1 if cached is not None else 0)
+    if cached is not None:
+        logger.info("Answered from semantic answer cache")
+        return iter([cached]) if stream else cached
     
-    model1 = genai.GenerativeModel("gemini-1.5-flash-8b")
-    model2 = genai.GenerativeModel("gemini-1.5-flash")
-    model3 = genai.GenerativeModel("gemini-1.0-pro")
-    logger.debug(f"Initialized Gemini model")
+    context = create_context(question, q_embedding, lexical)
+    logger.debug("Retrieved context length: %d", len(context))
+
+    # Create a completions using the question and context
+    message = build_prompt(question, context)
+    return _generate_answer(message, stream, q_embedding, index_version)
 
+def _generate_answer(message, stream=False, q_embedding=None, index_version=None):
+    """
+    Generate an answer for a prompt, caching it when the question embedding is known
+    """
+    if stream:
+        return _stream_answer(message, q_embedding, index_version)
+    
     try:
-        # Create a completions using the question and context
-        message =  f"You are a learning tool for veterans. Answer the question based on the context below, and if the question can't be answered based on the context, say \"I'm sorry I cannot answer the question\"\n\nContext: {context}\n\n---\n\nQuestion: {question}\nAnswer:"
         logger.debug("Sending request to Gemini")
 
-        response = model1.generate_content(message)
-        try:
-            logger.info(f"Response text length: {len(response.text)}")
-        except:
-            response = model2.generate_content(message)
-            try:
-                logger.info(f"Response text length: {len(response.text)}")
-            except:
-                response = model3.generate_content(message)
-                try:
-                    logger.info(f"Response text length: {len(response.text)}")
-                except:
-                    response = "I cannot answer"
-
-        failure = "I'm sorry" in response.text
-        if not response.text or failure:
-            response = model2.generate_content(message)
-            if "I'm sorry" in response.text:
-                response = model3.generate_content(message)
-            
+        with tracer.span('generate'):
+            response = generation_policy.generate(message)
+        _trace_generation(response.decisions, response.model)
+        logger.info("Response from %s after %d fallbacks, text length: %d", response.model, response.fallbacks, len(response.text))
+
         logger.info("Successfully generated response from Gemini")
-        # logger.debug(f"Response text length: {len(response.text)}")
+
+        _cache_answer(q_embedding, response.text, index_version)
 
         return response.text
     
     except Exception as e:
-        logger.error(f"Error generating answer: {str(e)}", exc_info=True)
+        logger.error("Error generating answer: %s", e, exc_info=True)
         return ""
+
+def _stream_answer(message, q_embedding, index_version):
+    logger.debug("Streaming request to Gemini")
+    chunks = []
+    decisions = []
+    started = time.perf_counter()
+    try:
+        for chunk in generation_policy.stream(message, decisions):
+            chunks.append(chunk)
+            yield chunk
+    except Exception as e:
+        logger.error("Error streaming answer: %s", e, exc_info=True)
+        raise
+    finally:
+        tracer.add_time('generate', time.perf_counter() - started)
+        _trace_generation(decisions)
+
+    logger.info("Streamed %d chunks from Gemini", len(chunks))
+    _cache_answer(q_embedding, ''.join(chunks), index_version)
+
+def _trace_generation(decisions, model=None):
+    """
+    Record fallback count and each Gemini attempt's latency on the request trace
+    """
+    tracer.set('fallbacks', max(0, sum(1 for d in decisions if d['event'] == 'start') - 1))
+    for decision in decisions:
+        if 'latency' in decision:
+            tracer.set(f"attempt.{decision['model']}_ms", decision['latency'] * 1000)
+    tracer.property('attempts', decisions)
+    if model is not None:
+        tracer.property('model', model)
+
+def _cache_answer(q_embedding, text, index_version):
+    if q_embedding is not None and text and not any(marker in text for marker in NO_ANSWER_MARKERS):
+        clients.get('answer_cache').store(q_embedding, text, index_version)
         
 
+def answer_questions(questions, deadline=None):
+    """
+    Answer a batch of questions, returning one result per question in the original order
+
+    The questions are embedded in a single request, then retrieval runs on
+    up to BATCH_QUERY_CONCURRENCY threads with at most
+    BATCH_GENERATION_CONCURRENCY Gemini calls at once. Each result is a
+    dict with either an 'answer' or an 'error'; questions not answered by
+    `deadline` (a time.monotonic() value) are reported as timed out.
+
+    Work still running at the deadline is abandoned rather than awaited:
+    queued questions are cancelled, no Gemini call starts after it, and
+    calls in flight get the time left as their request timeout, so they end
+    by the deadline instead of holding generation slots and threads.
+    """
+    logger.info("Starting to process %d questions", len(questions))
+    try:
+        embeddings = embed_questions(questions)
+    except Exception as e:
+        logger.error("Error embedding questions: %s", e, exc_info=True)
+        return [{'question': question, 'error': f'Embedding failed: {str(e)}'} for question in questions]
+    index_version = get_index_version()
+    answer_cache = clients.get('answer_cache')
+    generation_slots = threading.BoundedSemaphore(BATCH_GENERATION_CONCURRENCY)
+
+    def answer(question, q_embedding):
+        cached = answer_cache.lookup(q_embedding, index_version)
+        if cached is not None:
+            return cached
+        message = build_prompt(question, create_context(question, q_embedding))
+        timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+        if not generation_slots.acquire(timeout=timeout):
+            raise TimeoutError('Timed out waiting for a generation slot')
+        try:
+            response = generation_policy.generate(message, deadline=deadline)
+        finally:
+            generation_slots.release()
+        _cache_answer(q_embedding, response.text, index_version)
+        return response.text
+
+    results = [None] * len(questions)
+    pool = ThreadPoolExecutor(max_workers=max(1, min(BATCH_QUERY_CONCURRENCY, len(questions))))
+    # Workers don't inherit context variables, so each question runs in a
+    # copy of this one to record its spans on the request's trace
+    futures = {pool.submit(contextvars.copy_context().run, answer, q, e): i
+               for i, (q, e) in enumerate(zip(questions, embeddings))}
+    timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+    done, not_done = wait(futures, timeout=timeout)
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    for future in done:
+        i = futures[future]
+        try:
+            results[i] = {'question': questions[i], 'answer': future.result()}
+        except Exception as e:
+            logger.error("Error answering question %d: %s", i, e, exc_info=True)
+            results[i] = {'question': questions[i], 'error': str(e)}
+    for future in not_done:
+        i = futures[future]
+        results[i] = {'question': questions[i], 'error': 'Timed out before an answer was generated'}
+
+    tracer.set('batch_size', len(questions))
+    tracer.set('batch_errors', sum(1 for r in results if 'error' in r))
+    tracer.set('batch_timeouts', len(not_done))
+    logger.info("Answered %d of %d questions", len(questions) - sum(1 for r in results if 'error' in r), len(questions))
+    return results
+
+def _batch_deadline(context):
+    """
+    Monotonic deadline leaving DEADLINE_MARGIN seconds to serialize and return
+    """
+    remaining = API_GATEWAY_TIMEOUT
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        remaining = min(remaining, context.get_remaining_time_in_millis() / 1000)
+    return time.monotonic() + remaining - DEADLINE_MARGIN
+
+def _fit_response(results):
+    """
+    Replace answers from the end with errors until the response fits MAX_RESPONSE_BYTES
+    """
+    sizes = [len(json.dumps(result).encode()) for result in results]
+    total = sum(sizes)
+    for i in reversed(range(len(results))):
+        if total <= MAX_RESPONSE_BYTES:
+            break
+        if 'answer' in results[i]:
+            results[i] = {'question': results[i]['question'], 'error': 'Response size limit reached'}
+            total += len(json.dumps(results[i]).encode()) - sizes[i]
+    return results
+
+def _error_response(status, message):
+    return {
+        'statusCode': status,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps({
+            'error': message
+        })
+    }
+
+def _handle_batch(questions, context):
+    if not isinstance(questions, list) or not questions:
+        logger.warning("Batch request received without a list of questions")
+        return _error_response(400, 'Questions must be a non-empty list')
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        logger.warning("Batch request with %d questions rejected", len(questions))
+        return _error_response(413, f'At most {MAX_BATCH_QUESTIONS} questions are allowed per request')
+
+    # Invalid questions get an error in place so results stay aligned
+    results = [None] * len(questions)
+    valid = []
+    for i, question in enumerate(questions):
+        if not isinstance(question, str) or not question.strip():
+            results[i] = {'question': question, 'error': 'Question is required'}
+        elif len(question) > MAX_QUESTION_CHARS:
+            results[i] = {'question': question, 'error': f'Question is longer than {MAX_QUESTION_CHARS} characters'}
+        else:
+            valid.append(i)
+
+    if valid:
+        answers = answer_questions([questions[i] for i in valid], _batch_deadline(context))
+        for i, result in zip(valid, answers):
+            results[i] = result
+
+    with tracer.span('serialize'):
+        response_body = json.dumps({'results': _fit_response(results)})
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': response_body
+    }
+
+def is_warmup(event):
+    """
+    Whether an event is a warm-up ping, {"warmup": true} as the event itself or its body
+    """
+    if not isinstance(event, dict):
+        return False
+    if event.get('warmup'):
+        return True
+    body = event.get('body')
+    if isinstance(body, str) and '"warmup"' in body:
+        try:
+            body = json.loads(body)
+        except json.JSONDecodeError:
+            return False
+    return isinstance(body, dict) and bool(body.get('warmup'))
+
+def warm_up():
+    """
+    Build every client without answering a question
+
+    This imports the SDKs, fetches the secrets and loads the local indexes,
+    so the first query after a warm-up finds everything in place. Returns
+    each client's build time in milliseconds, or the error for a client
+    that couldn't be built.
+    """
+    report = {}
+    for name in WARMUP_CLIENTS:
+        started = time.perf_counter()
+        try:
+            clients.get(name)
+        except Exception as e:
+            logger.warning("Warm-up of client '%s' failed: %s", name, e)
+            report[name] = f'error: {e}'
+            continue
+        elapsed = time.perf_counter() - started
+        tracer.add_time(f'warmup.{name}', elapsed)
+        report[name] = round(elapsed * 1000, 3)
+    logger.info("Warm-up finished: %s", report)
+    return report
+
+def client_stats(name):
+    """
+    Stats of the client called `name` for logging, without building it
+    """
+    client = clients.peek(name)
+    return client.stats() if client is not None else 'not built'
+
 def lambda_handler(event, context):
     """The central handler function called when the Lambda function is invoked.
 
@@ -115,17 +620,44 @@ def lambda_handler(event, context):
         the function but which is reflected in CloudWatch
     """
     logger.info('Starting Lambda Execution')
+    clients.begin_invocation()
+    tracer.begin(request_id=getattr(context, 'aws_request_id', None))
+    try:
+        response = _handle_request(event, context)
+        tracer.property('status_code', response['statusCode'])
+        return response
+    finally:
+        tracer.finish()
 
-    logger.debug(event)
+def _handle_request(event, context=None):
+    logger.debug("%s", event)
+
+    if is_warmup(event):
+        tracer.property('warmup', True)
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'warmup': True,
+                'clients_ms': warm_up()
+            })
+        }
 
     try:
         logger.info("Received new request")
-        logger.debug(f"Event: {json.dumps(event)}")
+        logger.debug("Event: %s", Lazy(json.dumps, event))
         
         # Get the request body
         body = json.loads(event.get('body', '{}'))
-        logger.debug(f"Parsed request body: {json.dumps(body)}")
+        logger.debug("Parsed request body: %s", Lazy(json.dumps, body))
         
+        # A list of questions is answered as a batch
+        if 'questions' in body:
+            return _handle_batch(body['questions'], context)
+
         # Extract the question from the request
         question = body.get('question')
         
@@ -143,29 +675,34 @@ def lambda_handler(event, context):
                 })
             }
         
-        logger.info(f"Processing question request: {question}")
+        logger.info("Processing question request: %s", question)
         
         # Process the question
         answer = answer_question(question)
         
         logger.info("Successfully processed question")
-        logger.debug(f"Generated answer: {answer}")
+        logger.info("Client reuse: %s", Lazy(clients.invocation_report))
+        logger.info("Embedding cache: %s", Lazy(client_stats, 'embedding_cache'))
+        logger.info("Answer cache: %s", Lazy(client_stats, 'answer_cache'))
+        logger.debug("Generated answer: %s", answer)
         
         # Return the response
+        with tracer.span('serialize'):
+            response_body = json.dumps({
+                'question': question,
+                'answer': answer
+            })
         return {
             'statusCode': 200,
             'headers': {
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps({
-                'question': question,
-                'answer': answer
-            })
+            'body': response_body
         }
     
     except json.JSONDecodeError as e:
-        logger.error(f"Invalid JSON in request body: {str(e)}")
+        logger.error("Invalid JSON in request body: %s", e)
         return {
             'statusCode': 400,
             'headers': {
@@ -178,7 +715,7 @@ def lambda_handler(event, context):
         }
     
     except Exception as e:
-        logger.critical(f"Unexpected error: {str(e)}", exc_info=True)
+        logger.critical("Unexpected error: %s", e, exc_info=True)
         return {
             'statusCode': 500,
             'headers': {
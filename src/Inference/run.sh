@@ -0,0 +1,7 @@
+#!/bin/bash
+
+# Entry point for the streaming inference function. The Lambda Web Adapter
+# starts this script and proxies function URL requests to the server.
+PATH=$PATH:$LAMBDA_TASK_ROOT/bin \
+    PYTHONPATH=/opt/python:/opt/python/lib/python3.12/site-packages:$LAMBDA_TASK_ROOT:$PYTHONPATH \
+    exec python3 stream_server.py
@@ -0,0 +1,106 @@
+import json
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from inference import answer_question, logger, tracer, warm_up
+
+PORT = int(os.environ.get("PORT", 8080))
+# Written as the last chunk when generation fails after the response has
+# started, since the status code can no longer change
+STREAM_ERROR_MARKER = '\n[error] '
+
+
+class StreamingHandler(BaseHTTPRequestHandler):
+    """
+    Response-streaming variant of the inference handler.
+
+    Python Lambda runtimes can't stream responses from a plain handler, so
+    this runs as a small HTTP server behind the AWS Lambda Web Adapter with
+    a RESPONSE_STREAM function URL. Each answer chunk is written as an HTTP
+    chunk as soon as Gemini produces it.
+
+    Retrieval and the first chunk are awaited before the status line is
+    sent, so failing requests get a JSON error with a 5xx status. A
+    failure after that ends the stream with STREAM_ERROR_MARKER and the
+    error message.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        # Readiness check used by the Lambda Web Adapter
+        self._send_json(200, {'status': 'ok'})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError as e:
+            logger.error("Invalid JSON in request body: %s", e)
+            self._send_json(400, {'error': 'Invalid JSON in request body'})
+            return
+        if not isinstance(body, dict):
+            logger.warning("Request body is not a JSON object")
+            self._send_json(400, {'error': 'Request body must be a JSON object'})
+            return
+
+        if body.get('warmup'):
+            self._send_json(200, {'warmup': True, 'clients_ms': warm_up()})
+            return
+
+        question = body.get('question')
+        if not question:
+            logger.warning("Request received with missing question")
+            self._send_json(400, {'error': 'Question is required'})
+            return
+
+        logger.info("Streaming answer for question: %s", question)
+        tracer.begin(request_id=self.headers.get('x-amzn-request-id'), stream=True)
+        try:
+            started = time.perf_counter()
+            try:
+                chunks = iter(answer_question(question, stream=True))
+                first = next(chunks, None)
+            except Exception as e:
+                logger.critical("Unexpected error: %s", e, exc_info=True)
+                self._send_json(500, {'error': f'Internal server error: {str(e)}'})
+                return
+            tracer.add_time('first_chunk', time.perf_counter() - started)
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            try:
+                if first is not None:
+                    self._write_chunk(first.encode())
+                for chunk in chunks:
+                    self._write_chunk(chunk.encode())
+            except Exception as e:
+                logger.error("Error after streaming started: %s", e, exc_info=True)
+                self._write_chunk(f'{STREAM_ERROR_MARKER}{str(e)}'.encode())
+            self._write_chunk(b'')
+        finally:
+            tracer.finish()
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f'{len(data):X}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+if __name__ == '__main__':
+    ThreadingHTTPServer(('0.0.0.0', PORT), StreamingHandler).serve_forever()
@@ -1,13 +1,34 @@
 import argparse
+import math
+import os
 import requests
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 import mimetypes
 import json
-from typing import Optional, Dict
+from typing import Optional, Dict, Iterable, List, TextIO
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 GENERATOR_URL = 'https://3gde7dimc6.execute-api.us-east-1.amazonaws.com/Prod/upload'
 PROCESSOR_URL = 'temp'
-INFERENCE_URL = 'https://3gde7dimc6.execute-api.us-east-1.amazonaws.com/Prod/inference'
+INFERENCE_URL = os.environ.get('INFERENCE_URL', 'https://3gde7dimc6.execute-api.us-east-1.amazonaws.com/Prod/inference')
+# Function URL of the streaming inference function, printed by the stack's outputs
+INFERENCE_STREAM_URL = os.environ.get('INFERENCE_STREAM_URL')
+# Ends a stream that failed after it started, see stream_server.STREAM_ERROR_MARKER
+STREAM_ERROR_MARKER = '\n[error] '
+
+# Bulk mode: requests in flight, and questions per request ({"questions": [...]}
+# bodies are answered as a batch by the endpoint, up to MAX_BATCH_QUESTIONS)
+BULK_CONCURRENCY = int(os.environ.get('BULK_CONCURRENCY', 8))
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', 1))
+# Throttled and unavailable responses are turned away before any work starts,
+# so they are retried with backoff, honouring Retry-After. 502/504 may come
+# after the endpoint already answered (or is still answering), so they aren't
+RETRY_STATUSES = (429, 503)
 
 def upload_pdf(pdf_path: str) -> None:
     """
@@ -97,19 +118,396 @@ def query_model(question: str) -> Optional[Dict]:
         print(f"Error querying inference endpoint: {str(e)}")
         return None
 
+def signed_headers(url: str, data: bytes) -> Dict[str, str]:
+    """
+    SigV4 headers for a POST of `data` to an IAM-authenticated function URL
+
+    Credentials come from the usual AWS sources (environment, profile or
+    role), and the region from the URL (https://<id>.lambda-url.<region>.on.aws/).
+
+    Args:
+        url (str): Function URL
+        data (bytes): Exact request body that will be sent
+
+    Returns:
+        Dict[str, str]: Headers to send with the request
+
+    Raises:
+        ValueError: If no AWS credentials are configured
+    """
+    import boto3
+    from botocore.auth import SigV4Auth
+    from botocore.awsrequest import AWSRequest
+
+    session = boto3.Session()
+    credentials = session.get_credentials()
+    if credentials is None:
+        raise ValueError("--stream needs AWS credentials allowed to call lambda:InvokeFunctionUrl")
+    host = url.split('://', 1)[-1].split('/', 1)[0]
+    region = host.split('.')[2] if '.lambda-url.' in host else session.region_name
+    request = AWSRequest(method='POST', url=url, data=data, headers={'Content-Type': 'application/json'})
+    SigV4Auth(credentials.get_frozen_credentials(), 'lambda', region).add_auth(request)
+    return dict(request.headers)
+
+
+def _marker_prefix(text: str) -> int:
+    """
+    Length of the longest end of `text` that could start STREAM_ERROR_MARKER
+    """
+    for size in range(min(len(text), len(STREAM_ERROR_MARKER) - 1), 0, -1):
+        if STREAM_ERROR_MARKER.startswith(text[-size:]):
+            return size
+    return 0
+
+
+def stream_query(question: str) -> Optional[str]:
+    """
+    Query the streaming inference endpoint and print tokens as they arrive
+
+    The function URL uses IAM auth, so the request is signed with the
+    caller's AWS credentials. Text that could be the start of
+    STREAM_ERROR_MARKER is held back until the next chunk shows whether
+    it is, so a marker split across chunks is still recognised.
+
+    Args:
+        question (str): The question to process
+        
+    Returns:
+        Optional[str]: Full answer text or None if request fails
+
+    Raises:
+        ValueError: If INFERENCE_STREAM_URL isn't set
+    """
+    if not INFERENCE_STREAM_URL:
+        raise ValueError("--stream needs INFERENCE_STREAM_URL set to the streaming function's URL")
+    try:
+        data = json.dumps({'question': question}).encode()
+        response = requests.post(
+            INFERENCE_STREAM_URL,
+            data=data,
+            headers=signed_headers(INFERENCE_STREAM_URL, data),
+            stream=True,
+            timeout=60
+        )
+        response.raise_for_status()
+
+        answer = []
+        pending = ''
+        chunks = response.iter_content(chunk_size=None, decode_unicode=True)
+        for chunk in chunks:
+            text, marker, error = (pending + chunk).partition(STREAM_ERROR_MARKER)
+            if marker:
+                print(text)
+                error += ''.join(chunks)
+                print(f"Error while streaming the answer: {error}")
+                return None
+            held = _marker_prefix(text)
+            text, pending = text[:len(text) - held], text[len(text) - held:]
+            answer.append(text)
+            print(text, end='', flush=True)
+        answer.append(pending)
+        print(pending)
+        return ''.join(answer)
+
+    except requests.exceptions.RequestException as e:
+        print(f"Error querying streaming inference endpoint: {str(e)}")
+        return None
+
+
+def _json_lines(lines: List[str]) -> Optional[List]:
+    """
+    Parse every line as a JSON string or object, or return None if any isn't one
+    """
+    entries = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(entry, (str, dict)):
+            return None
+        entries.append(entry)
+    return entries
+
+def read_questions(path: str) -> List[Dict]:
+    """
+    Read questions from a text file with one question per line, or JSONL
+    with a string or {"question": ..., "id": ...} object per line
+
+    A file is read as JSONL if its name ends in .jsonl or every line parses
+    as JSON, so a text question that happens to start with a quote stays
+    as written. Blank lines and lines starting with '#' are skipped.
+    Questions without an id are numbered by line.
+
+    Args:
+        path (str): Questions file, or '-' for stdin
+
+    Returns:
+        List[Dict]: {'id', 'question'} items in file order
+
+    Raises:
+        ValueError: If a .jsonl file has a line that isn't valid JSON
+        KeyError: If a JSONL object has no 'question'
+    """
+    lines = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    with lines:
+        numbered = [(number, line.strip()) for number, line in enumerate(lines, start=1)]
+    numbered = [(number, line) for number, line in numbered if line and not line.startswith('#')]
+
+    texts = [line for _, line in numbered]
+    entries = [json.loads(line) for line in texts] if path.endswith('.jsonl') else _json_lines(texts)
+    if entries is None:
+        return [{'id': number, 'question': line} for number, line in numbered]
+
+    items = []
+    for (number, _), entry in zip(numbered, entries):
+        if isinstance(entry, dict):
+            items.append({'id': entry.get('id', number), 'question': entry['question']})
+        else:
+            items.append({'id': number, 'question': entry})
+    return items
+
+def create_session(concurrency: int = BULK_CONCURRENCY, retries: int = 2) -> requests.Session:
+    """
+    Session whose connection pool keeps one keep-alive connection per concurrent request
+
+    Args:
+        concurrency (int): Requests that may be in flight at once
+        retries (int): Retries of connection errors and RETRY_STATUSES responses
+
+    Returns:
+        requests.Session: Session for the inference endpoint
+    """
+    # Only requests that never reached the endpoint, or were turned away by
+    # RETRY_STATUSES, are retried; after a read timeout the endpoint may
+    # still be answering, and a retry would pay for the generation twice
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=False,
+        other=0,
+        status=retries,
+        backoff_factor=0.5,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({'POST'}),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, pool_block=True, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Content-Type'] = 'application/json'
+    return session
+
+def post_questions(session: requests.Session, url: str, items: List[Dict], timeout: float = 60) -> List[Dict]:
+    """
+    Send questions in one request and return a record per question
+
+    A single question is sent as {"question": ...} and several as a batch.
+    Failures are recorded per question rather than raised.
+
+    Args:
+        session (requests.Session): Pooled session
+        url (str): Inference endpoint
+        items (List[Dict]): {'id', 'question'} items
+        timeout (float): Request timeout in seconds
+
+    Returns:
+        List[Dict]: {'id', 'question', 'answer' | 'error', 'status', 'latency_ms'} per item
+    """
+    body = {'question': items[0]['question']} if len(items) == 1 else {'questions': [i['question'] for i in items]}
+    status = None
+    started = time.perf_counter()
+    try:
+        response = session.post(url, json=body, timeout=timeout)
+        status = response.status_code
+        if status != 200:
+            try:
+                message = response.json()['error']
+            except (ValueError, KeyError, TypeError):
+                message = f'{status} {response.reason}'
+            raise ValueError(message)
+        data = response.json()
+        results = [data] if len(items) == 1 else data['results']
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        results = [{'error': str(e) or type(e).__name__}] * len(items)
+    if len(results) < len(items):
+        missing = {'error': f'No result returned, the response had {len(results)} for {len(items)} questions'}
+        results = list(results) + [missing] * (len(items) - len(results))
+    latency_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    records = []
+    for item, result in zip(items, results):
+        record = {'id': item['id'], 'question': item['question']}
+        if 'error' in result:
+            record['error'] = result['error']
+        else:
+            record['answer'] = result.get('answer')
+        record['status'] = status
+        record['latency_ms'] = latency_ms
+        records.append(record)
+    return records
+
+def connections_opened(session: requests.Session) -> int:
+    """
+    Number of connections the session's pools have opened, to check keep-alive reuse
+    """
+    opened = 0
+    # The same adapter may be mounted for several prefixes
+    for adapter in {id(a): a for a in session.adapters.values()}.values():
+        pools = adapter.poolmanager.pools
+        opened += sum(pools[key].num_connections for key in pools.keys())
+    return opened
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile of an ascending list
+    """
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+def bulk_query(
+    items: Iterable[Dict],
+    output: TextIO,
+    url: str = INFERENCE_URL,
+    concurrency: int = BULK_CONCURRENCY,
+    batch_size: int = BULK_BATCH_SIZE,
+    timeout: float = 60,
+    session: Optional[requests.Session] = None
+) -> Dict:
+    """
+    Answer many questions over a pooled session, writing each answer as a
+    JSONL line as soon as its request completes
+
+    At most `concurrency` requests are in flight, each carrying up to
+    `batch_size` questions, so lines come out in completion order; use the
+    'id' field to match them to the input.
+
+    Args:
+        items (Iterable[Dict]): {'id', 'question'} items, e.g. from `read_questions`
+        output (TextIO): Stream the JSONL records are written to
+        url (str): Inference endpoint
+        concurrency (int): Requests in flight at once
+        batch_size (int): Questions per request
+        timeout (float): Request timeout in seconds
+        session (Optional[requests.Session]): Session to use instead of a new pooled one
+
+    Returns:
+        Dict: Throughput and latency summary
+    """
+    items = list(items)
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    own_session = session is None
+    if own_session:
+        session = create_session(concurrency)
+
+    latencies = []
+    answered = errors = 0
+    started = time.perf_counter()
+    pending = set()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        queue = iter(batches)
+        # Only `concurrency` batches are submitted ahead so large files stream through
+        for batch in queue:
+            pending.add(pool.submit(post_questions, session, url, batch, timeout))
+            if len(pending) >= concurrency:
+                break
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                records = future.result()
+                latencies.append(records[0]['latency_ms'])
+                for record in records:
+                    if 'error' in record:
+                        errors += 1
+                    else:
+                        answered += 1
+                    output.write(json.dumps(record) + '\n')
+                output.flush()
+                batch = next(queue, None)
+                if batch is not None:
+                    pending.add(pool.submit(post_questions, session, url, batch, timeout))
+    seconds = time.perf_counter() - started
+
+    connections = connections_opened(session)
+    if own_session:
+        session.close()
+
+    latencies.sort()
+    return {
+        'questions': len(items),
+        'answered': answered,
+        'errors': errors,
+        'requests': len(batches),
+        'connections': connections,
+        'seconds': round(seconds, 3),
+        'questions_per_sec': round(len(items) / seconds, 2) if seconds else 0.0,
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else 0.0,
+            'mean': round(sum(latencies) / len(latencies), 1) if latencies else 0.0
+        }
+    }
+
+def print_summary(summary: Dict, file: TextIO = sys.stderr) -> None:
+    """
+    Print a bulk run's summary
+    """
+    latency = summary['latency_ms']
+    print(f"Answered {summary['answered']}/{summary['questions']} questions ({summary['errors']} errors) "
+          f"in {summary['seconds']:.1f}s over {summary['requests']} requests and {summary['connections']} connections: "
+          f"{summary['questions_per_sec']:.2f} questions/s", file=file)
+    print(f"Request latency ms: p50 {latency['p50']:.0f}, p95 {latency['p95']:.0f}, p99 {latency['p99']:.0f}, "
+          f"max {latency['max']:.0f}, mean {latency['mean']:.0f}", file=file)
+
+
+def positive_int(value: str) -> int:
+    """
+    argparse type for counts that must be at least 1
+    """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
 
 def main():
     parser = argparse.ArgumentParser(description='Upload PDF to S3 and trigger processing')
     parser.add_argument('--pdf_path', help='Path to the PDF file')
     parser.add_argument('--query', help='question for the model')
+    parser.add_argument('--stream', action='store_true', help='print the answer as it is generated')
+    parser.add_argument('--questions', help='text file (one question per line) or JSONL of questions to answer in bulk, - for stdin')
+    parser.add_argument('--output', default='-', help='JSONL file for bulk answers, - for stdout (default)')
+    parser.add_argument('--concurrency', type=positive_int, default=BULK_CONCURRENCY, help='bulk requests in flight')
+    parser.add_argument('--batch-size', type=positive_int, default=BULK_BATCH_SIZE, help='questions per bulk request')
+    parser.add_argument('--url', default=INFERENCE_URL, help='inference endpoint for bulk mode')
     args = parser.parse_args()
     
     try:
         if args.pdf_path:
             upload_pdf(args.pdf_path)
 
+        if args.questions:
+            items = read_questions(args.questions)
+            if args.output == '-':
+                summary = bulk_query(items, sys.stdout, args.url, args.concurrency, args.batch_size)
+            else:
+                with open(args.output, 'w', encoding='utf-8') as output:
+                    summary = bulk_query(items, output, args.url, args.concurrency, args.batch_size)
+            print_summary(summary)
+            if summary['errors']:
+                exit(1)
+
         if args.query:
-            query_model(args.query)
+            if args.stream:
+                if stream_query(args.query) is None:
+                    exit(1)
+            else:
+                query_model(args.query)
     except Exception as e:
         print(f"Error: {str(e)}")
         exit(1)
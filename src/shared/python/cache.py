@@ -0,0 +1,647 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from util import create_log
+
+logger = create_log('cache', os.environ.get("LOG_LEVEL"))
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text so case and whitespace variants share a cache entry.
+
+    Args:
+        text (str): Raw text
+
+    Returns:
+        str: Lowercased text with whitespace runs collapsed to single spaces
+    """
+    return WHITESPACE_PATTERN.sub(' ', text).strip().lower()
+
+
+def embedding_key(text: str, model: str, task_type: Optional[str] = None, normalize: bool = True) -> str:
+    """
+    Build the cache key for an embedding request.
+
+    Args:
+        text (str): Text being embedded
+        model (str): Embedding model name
+        task_type (Optional[str]): Embedding task type, if any
+        normalize (bool): Share keys between case and whitespace variants;
+            turn off to key on the exact text, e.g. for document chunks
+
+    Returns:
+        str: Hex digest identifying (text, model, task type)
+    """
+    raw = '\x1f'.join((model, task_type or '', normalize_text(text) if normalize else text))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with a size cap and per-entry TTL.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            expires = time.monotonic() + self.ttl if self.ttl else None
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+class DiskCache:
+    """
+    Shared embedding tier backed by a SQLite file, e.g. on /tmp or EFS.
+
+    Vectors are stored as float32 blobs. Each thread gets its own connection
+    and writes take the database lock up front, so a worker pool or several
+    processes can share one file. WAL mode lets readers run alongside the
+    writer; turn it off on network filesystems such as EFS, which don't
+    support it. With `max_bytes` set, least recently used entries are
+    evicted once the stored vectors grow past that size.
+    """
+
+    # SQLite's default limit on host parameters per statement is 999
+    MAX_PARAMS = 500
+
+    def __init__(self, path: str, max_bytes: Optional[int] = None, wal: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.wal = wal
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._write() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS vectors '
+                '(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS vectors_last_used ON vectors (last_used)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit, transactions are opened explicitly by _write
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            if self.wal:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def get(self, key: str) -> Optional[List[float]]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        Look up many keys at once.
+
+        Args:
+            keys (List[str]): Cache keys
+
+        Returns:
+            Dict[str, List[float]]: Embeddings of the keys that were found
+        """
+        found: Dict[str, List[float]] = {}
+        conn = self._connect()
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), self.MAX_PARAMS):
+            group = unique[i:i + self.MAX_PARAMS]
+            marks = ','.join('?' * len(group))
+            for key, value in conn.execute(f'SELECT key, value FROM vectors WHERE key IN ({marks})', group):
+                found[key] = np.frombuffer(value, dtype=np.float32).tolist()
+
+        if found and self.max_bytes:
+            # Recency only matters when something may be evicted
+            hit_keys = list(found)
+            with self._write() as conn:
+                now = time.time()
+                for i in range(0, len(hit_keys), self.MAX_PARAMS):
+                    group = hit_keys[i:i + self.MAX_PARAMS]
+                    marks = ','.join('?' * len(group))
+                    conn.execute(f'UPDATE vectors SET last_used = ? WHERE key IN ({marks})', [now, *group])
+
+        with self._lock:
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put(self, key: str, value: List[float]) -> None:
+        self.put_many([(key, value)])
+
+    def put_many(self, items: List[Tuple[str, List[float]]]) -> None:
+        """
+        Store many embeddings in one transaction, then evict if over `max_bytes`.
+
+        Args:
+            items (List[Tuple[str, List[float]]]): Cache keys and embeddings
+        """
+        now = time.time()
+        rows = []
+        for key, value in items:
+            blob = np.asarray(value, dtype=np.float32).tobytes()
+            rows.append((key, blob, len(blob), now))
+        with self._write() as conn:
+            conn.executemany('INSERT OR REPLACE INTO vectors VALUES (?, ?, ?, ?)', rows)
+            if self.max_bytes:
+                self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM vectors').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in conn.execute('SELECT key, size FROM vectors ORDER BY last_used'):
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        conn.executemany('DELETE FROM vectors WHERE key = ?', victims)
+        with self._lock:
+            self.evictions += len(victims)
+        logger.info(f"Evicted {len(victims)} embeddings from {self.path}")
+
+    def usage(self) -> Dict[str, int]:
+        entries, size = self._connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM vectors').fetchone()
+        return {'entries': entries, 'bytes': size}
+
+    def export_to(self, path: str) -> None:
+        """
+        Write a consistent snapshot of the cache to another SQLite file.
+
+        Args:
+            path (str): Destination file, replaced if it exists
+        """
+        if os.path.exists(path):
+            os.remove(path)
+        target = sqlite3.connect(path)
+        try:
+            self._connect().backup(target)
+        finally:
+            target.close()
+
+    def import_from(self, path: str) -> int:
+        """
+        Merge entries from an exported cache, keeping existing entries.
+
+        Args:
+            path (str): File written by `export_to`
+
+        Returns:
+            int: Number of entries added
+        """
+        conn = self._connect()
+        conn.execute('ATTACH DATABASE ? AS source', (path,))
+        try:
+            with self._write() as conn:
+                before = conn.total_changes
+                conn.execute('INSERT OR IGNORE INTO vectors SELECT key, value, size, last_used FROM source.vectors')
+                added = conn.total_changes - before
+                if self.max_bytes:
+                    self._evict(conn)
+        finally:
+            conn.execute('DETACH DATABASE source')
+        return added
+
+    def close(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class S3Cache:
+    """
+    Shared embedding tier storing one JSON object per key in an S3 bucket.
+    """
+
+    def __init__(self, bucket: str, prefix: str = 'embedding-cache/', client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self._client = client
+
+    def _get_client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.session.Session().client('s3')
+        return self._client
+
+    def get(self, key: str) -> Optional[List[float]]:
+        client = self._get_client()
+        try:
+            body = client.get_object(Bucket=self.bucket, Key=f'{self.prefix}{key}')['Body'].read()
+        except client.exceptions.NoSuchKey:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(body)
+
+    def put(self, key: str, value: List[float]) -> None:
+        self._get_client().put_object(
+            Bucket=self.bucket,
+            Key=f'{self.prefix}{key}',
+            Body=json.dumps(value).encode(),
+            ContentType='application/json'
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-process LRU in front of an optional
+    shared tier (DiskCache or S3Cache). Shared-tier hits are promoted into
+    the local tier.
+    """
+
+    def __init__(self, local: Optional[LRUCache] = None, shared=None):
+        self.local = local if local is not None else LRUCache()
+        self.shared = shared
+
+    def get(self, text: str, model: str, task_type: Optional[str] = None) -> Optional[List[float]]:
+        key = embedding_key(text, model, task_type)
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception as e:
+                logger.warning(f"Shared embedding cache lookup failed: {str(e)}")
+                value = None
+            if value is not None:
+                self.local.put(key, value)
+        return value
+
+    def put(self, text: str, model: str, task_type: Optional[str], embedding: List[float]) -> None:
+        key = embedding_key(text, model, task_type)
+        self.local.put(key, embedding)
+        if self.shared is not None:
+            try:
+                self.shared.put(key, embedding)
+            except Exception as e:
+                logger.warning(f"Shared embedding cache write failed: {str(e)}")
+
+    def get_or_embed(
+        self,
+        text: str,
+        model: str,
+        task_type: Optional[str],
+        embed: Callable[[], List[float]]
+    ) -> List[float]:
+        """
+        Return the cached embedding for `text`, calling `embed` on a miss.
+
+        Args:
+            text (str): Text being embedded
+            model (str): Embedding model name
+            task_type (Optional[str]): Embedding task type, if any
+            embed (Callable[[], List[float]]): Produces the embedding on a miss
+
+        Returns:
+            List[float]: The embedding vector
+        """
+        embedding = self.get(text, model, task_type)
+        if embedding is None:
+            embedding = embed()
+            self.put(text, model, task_type, embedding)
+        return embedding
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {'local': self.local.stats()}
+        if self.shared is not None:
+            stats['shared'] = self.shared.stats()
+        return stats
+
+
+def split_s3_uri(uri: str) -> Tuple[str, str]:
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    return bucket, key
+
+
+def download_s3_file(uri: str, path: str) -> None:
+    """
+    Download an s3://bucket/key object to a local file.
+
+    Args:
+        uri (str): Source object
+        path (str): Destination file
+    """
+    import boto3
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    bucket, key = split_s3_uri(uri)
+    boto3.session.Session().client('s3').download_file(bucket, key, path)
+
+
+def fetch_s3_copy(objects: List[Tuple[str, str]], marker: str, version=None) -> bool:
+    """
+    Download s3:// objects to local files unless they are already there for `version`.
+
+    `marker` is a local file holding the version the copy was downloaded
+    for. It is written after every object has been downloaded, so an
+    interrupted download is fetched again. Without a `version`, any
+    complete copy is kept.
+
+    Args:
+        objects (List[Tuple[str, str]]): (s3 uri, local path) pairs, downloaded in order
+        marker (str): Local file recording the version of the copy
+        version: Version the copy must be for, e.g. the index version
+
+    Returns:
+        bool: Whether the objects were downloaded
+    """
+    current = Path(marker).read_text() if os.path.exists(marker) else None
+    if current is not None and (version is None or current == str(version)):
+        return False
+    for uri, path in objects:
+        download_s3_file(uri, path)
+    Path(marker).write_text('' if version is None else str(version))
+    return True
+
+
+def upload_s3_file(path: str, uri: str) -> None:
+    """
+    Upload a local file to an s3://bucket/key object.
+
+    Args:
+        path (str): Source file
+        uri (str): Destination object
+    """
+    import boto3
+    bucket, key = split_s3_uri(uri)
+    boto3.session.Session().client('s3').upload_file(path, bucket, key)
+
+
+def read_s3_text(uri: str) -> Optional[str]:
+    """
+    Read an s3://bucket/key object as text.
+
+    Args:
+        uri (str): Source object
+
+    Returns:
+        Optional[str]: The object's contents, or None if it doesn't exist
+    """
+    import boto3
+    client = boto3.session.Session().client('s3')
+    bucket, key = split_s3_uri(uri)
+    try:
+        return client.get_object(Bucket=bucket, Key=key)['Body'].read().decode()
+    except client.exceptions.NoSuchKey:
+        return None
+
+
+def embedding_cache_from_env() -> EmbeddingCache:
+    """
+    Build an EmbeddingCache configured from environment variables.
+
+    EMBEDDING_CACHE_SIZE and EMBEDDING_CACHE_TTL size the local tier.
+    EMBEDDING_CACHE_PATH enables the SQLite tier, EMBEDDING_CACHE_BUCKET
+    the S3 tier (the path wins if both are set). EMBEDDING_CACHE_MAX_BYTES
+    caps the SQLite file and EMBEDDING_CACHE_SEED (s3://bucket/key of an
+    exported cache) warms it on a cold start.
+
+    Returns:
+        EmbeddingCache: Configured cache
+    """
+    local = LRUCache(
+        max_size=int(os.environ.get('EMBEDDING_CACHE_SIZE', 1024)),
+        ttl=float(os.environ.get('EMBEDDING_CACHE_TTL', 3600))
+    )
+    shared = None
+    if os.environ.get('EMBEDDING_CACHE_PATH'):
+        path = os.environ['EMBEDDING_CACHE_PATH']
+        seed = os.environ.get('EMBEDDING_CACHE_SEED')
+        if seed and not os.path.exists(path):
+            try:
+                download_s3_file(seed, path)
+            except Exception as e:
+                logger.warning(f"Could not seed embedding cache from {seed}: {str(e)}")
+        max_bytes = os.environ.get('EMBEDDING_CACHE_MAX_BYTES')
+        shared = DiskCache(path, max_bytes=int(max_bytes) if max_bytes else None)
+    elif os.environ.get('EMBEDDING_CACHE_BUCKET'):
+        shared = S3Cache(os.environ['EMBEDDING_CACHE_BUCKET'])
+    return EmbeddingCache(local, shared)
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache keyed by question embedding.
+
+    Cached question embeddings are kept L2-normalized in a float32 matrix
+    that starts small and doubles as answers are stored, up to `max_size`
+    rows. A new question whose cosine similarity to a cached one reaches
+    `threshold` gets the stored answer. Entries are evicted
+    least-recently-used once `max_size` is reached, and the whole cache is
+    dropped whenever the index version changes.
+
+    Up to EXACT_ROWS entries a lookup is a single matrix-vector product.
+    Past that, every entry is also kept as a SKETCH_DIMENSION random
+    projection: a lookup scores the sketches, keeps the best CANDIDATES
+    rows and re-scores only those against the full vectors, like
+    QuantizedVectorStore does with its codes. A near-duplicate scores far
+    above everything else, so it survives the sketch pass.
+    """
+
+    INITIAL_CAPACITY = 64
+    EXACT_ROWS = 2048
+    SKETCH_DIMENSION = 64
+    CANDIDATES = 256
+
+    def __init__(self, dimension: int = 768, max_size: int = 10000, threshold: float = 0.95):
+        self.dimension = dimension
+        self.max_size = max_size
+        self.threshold = threshold
+        self.index_version = None
+        self.hits = 0
+        self.misses = 0
+        self._vectors = np.zeros((0, dimension), dtype=np.float32)
+        self._projection = None
+        if dimension > self.SKETCH_DIMENSION:
+            rng = np.random.default_rng(0)
+            self._projection = (rng.standard_normal((dimension, self.SKETCH_DIMENSION), dtype=np.float32)
+                                / np.float32(np.sqrt(self.SKETCH_DIMENSION)))
+        self._sketches = np.zeros((0, self.SKETCH_DIMENSION), dtype=np.float32)
+        self._last_used = np.zeros(0, dtype=np.int64)
+        self._answers: List[Optional[str]] = []
+        self._count = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    def _normalize(self, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, index_version) -> None:
+        if index_version != self.index_version:
+            if self._count:
+                logger.info(f"Index version changed to {index_version}, dropping {self._count} cached answers")
+            self._clear()
+            self.index_version = index_version
+
+    def _clear(self) -> None:
+        self._count = 0
+        self._answers = [None] * len(self._answers)
+
+    def _grow(self) -> None:
+        capacity = min(self.max_size, max(self.INITIAL_CAPACITY, 2 * len(self._answers)))
+        vectors = np.zeros((capacity, self.dimension), dtype=np.float32)
+        vectors[:self._count] = self._vectors[:self._count]
+        sketches = np.zeros((capacity, self.SKETCH_DIMENSION), dtype=np.float32)
+        sketches[:self._count] = self._sketches[:self._count]
+        last_used = np.zeros(capacity, dtype=np.int64)
+        last_used[:self._count] = self._last_used[:self._count]
+        self._vectors, self._sketches, self._last_used = vectors, sketches, last_used
+        self._answers.extend([None] * (capacity - len(self._answers)))
+
+    def lookup(self, embedding: List[float], index_version=None) -> Optional[str]:
+        """
+        Return a cached answer for a near-duplicate question, if any.
+
+        Args:
+            embedding (List[float]): Question embedding
+            index_version: Current version of the vector index
+
+        Returns:
+            Optional[str]: Cached answer, or None on a miss
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            if not self._count:
+                self.misses += 1
+                return None
+
+            count = self._count
+            if self._projection is None or count <= max(self.EXACT_ROWS, self.CANDIDATES):
+                rows = None
+                scores = self._vectors[:count] @ query
+            else:
+                approximate = self._sketches[:count] @ (query @ self._projection)
+                rows = np.argpartition(approximate, count - self.CANDIDATES)[count - self.CANDIDATES:]
+                scores = self._vectors[rows] @ query
+            best = int(scores.argmax())
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            slot = best if rows is None else int(rows[best])
+            self._clock += 1
+            self._last_used[slot] = self._clock
+            self.hits += 1
+            return self._answers[slot]
+
+    def store(self, embedding: List[float], answer: str, index_version=None) -> None:
+        """
+        Cache `answer` under the question embedding.
+
+        Args:
+            embedding (List[float]): Question embedding
+            answer (str): Generated answer
+            index_version: Version of the vector index the answer came from
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            if self._count == len(self._answers) and self._count < self.max_size:
+                self._grow()
+            if self._count < self.max_size:
+                slot = self._count
+                self._count += 1
+            else:
+                slot = int(self._last_used.argmin())
+
+            self._clock += 1
+            self._vectors[slot] = vector
+            if self._projection is not None:
+                self._sketches[slot] = vector @ self._projection
+            self._last_used[slot] = self._clock
+            self._answers[slot] = answer
+
+    def invalidate(self) -> None:
+        """Drop every cached answer, e.g. after documents are re-ingested."""
+        with self._lock:
+            self._clear()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'size': self._count,
+            'hits': self.hits,
+            'misses': self.misses,
+            'index_version': self.index_version
+        }
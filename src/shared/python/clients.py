@@ -0,0 +1,172 @@
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from util import create_log
+
+logger = create_log('clients', os.environ.get("LOG_LEVEL"))
+
+REUSED = 'reused'
+CONNECTED = 'connected'
+
+# Modules the inference handler imports in its client factories rather
+# than at import, keeping them out of the cold start
+DEFERRED_SDKS = ('google.generativeai', 'pinecone', 'boto3', 'botocore', 'numpy')
+
+
+class ClientPool:
+    """
+    Container-scoped registry of lazily created service clients.
+
+    Each client is built once by its factory and kept for the lifetime of
+    the Lambda container, so warm invocations reuse the same objects (and
+    the keep-alive HTTP connections they hold). A client that raises while
+    in use can be dropped with `invalidate` and is rebuilt on next use.
+
+    Factories run outside the pool's lock, under a lock of their own name,
+    so a slow build (an SDK import, a handshake, fetching secrets) only
+    holds up callers waiting for that same client.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._error_hooks: Dict[str, Callable[[Exception], Any]] = {}
+        self._clients: Dict[str, Any] = {}
+        self._constructions: Dict[str, int] = {}
+        self._invocation: Dict[str, str] = {}
+        self._building: Dict[str, threading.Lock] = {}
+        self._lock = threading.RLock()
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        on_error: Optional[Callable[[Exception], Any]] = None
+    ) -> None:
+        """
+        Register a factory used to build the client called `name`.
+
+        Args:
+            name (str): Key the client is looked up by
+            factory (Callable[[], Any]): Zero-argument callable returning a new client
+            on_error (Optional[Callable[[Exception], Any]]): Called with the exception
+                before a failed client is rebuilt, e.g. to refresh credentials
+        """
+        with self._lock:
+            self._factories[name] = factory
+            if on_error is not None:
+                self._error_hooks[name] = on_error
+            self._clients.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        """
+        Return the client called `name`, building it on first use.
+
+        Args:
+            name (str): Registered client name
+
+        Returns:
+            Any: The cached client instance
+        """
+        with self._lock:
+            if name in self._clients:
+                self._invocation.setdefault(name, REUSED)
+                return self._clients[name]
+            if name not in self._factories:
+                raise KeyError(f"No client registered as '{name}'")
+            building = self._building.setdefault(name, threading.Lock())
+
+        with building:
+            with self._lock:
+                # Another thread may have built it while this one waited
+                if name in self._clients:
+                    self._invocation.setdefault(name, REUSED)
+                    return self._clients[name]
+                factory = self._factories[name]
+
+            client = factory()
+
+            with self._lock:
+                # A factory registered during the build replaces this client
+                if self._factories.get(name) is factory:
+                    self._clients[name] = client
+                self._constructions[name] = self._constructions.get(name, 0) + 1
+                self._invocation[name] = CONNECTED
+            logger.debug(f"Created client '{name}'")
+            return client
+
+    def peek(self, name: str) -> Optional[Any]:
+        """
+        Return the client called `name` if it is already built, without building it.
+
+        Args:
+            name (str): Registered client name
+
+        Returns:
+            Optional[Any]: The cached client, or None
+        """
+        with self._lock:
+            return self._clients.get(name)
+
+    def invalidate(self, name: str) -> None:
+        """
+        Drop the cached client called `name` so the next `get` reconnects.
+
+        Args:
+            name (str): Registered client name
+        """
+        with self._lock:
+            if self._clients.pop(name, None) is not None:
+                logger.warning(f"Dropped client '{name}', will reconnect on next use")
+
+    def call(self, name: str, fn: Callable[[Any], Any], retries: int = 1) -> Any:
+        """
+        Run `fn` against the client called `name`, reconnecting on failure.
+
+        Args:
+            name (str): Registered client name
+            fn (Callable[[Any], Any]): Function receiving the client
+            retries (int): Number of reconnect-and-retry attempts after a failure
+
+        Returns:
+            Any: Result of `fn`
+        """
+        for attempt in range(retries + 1):
+            try:
+                return fn(self.get(name))
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                if name in self._error_hooks:
+                    self._error_hooks[name](e)
+                self.invalidate(name)
+
+    def begin_invocation(self) -> None:
+        """Reset the per-invocation reuse report."""
+        with self._lock:
+            self._invocation = {}
+
+    def invocation_report(self) -> Dict[str, str]:
+        """
+        Report which clients were reused or freshly connected this invocation.
+
+        Returns:
+            Dict[str, str]: Client name mapped to 'reused' or 'connected'
+        """
+        with self._lock:
+            return dict(self._invocation)
+
+    def constructions(self, name: Optional[str] = None) -> Any:
+        """
+        Number of times a client has been built in this container.
+
+        Args:
+            name (Optional[str]): Client name, or None for all clients
+
+        Returns:
+            Any: Count for `name`, or a dict of counts for every client
+        """
+        with self._lock:
+            if name is None:
+                return dict(self._constructions)
+            return self._constructions.get(name, 0)
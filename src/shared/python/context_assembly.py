@@ -0,0 +1,226 @@
+import math
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+# Token budget for the assembled context. Unset, it is what the top `raw_k`
+# matches joined as-is would use, so assembly never shrinks the context
+CONTEXT_TOKEN_BUDGET = int(os.environ["CONTEXT_TOKEN_BUDGET"]) if os.environ.get("CONTEXT_TOKEN_BUDGET") else None
+# Gemini averages about four characters per token for English text
+CHARS_PER_TOKEN = 4
+SEPARATOR = r"\n\n###\n\n"
+
+# Shortest suffix/prefix overlap taken as two windows of the same text;
+# ingestion overlaps windows by 20-30 characters
+MIN_OVERLAP = 12
+# Share of a span's word trigrams already in better spans at which it's dropped
+REDUNDANCY_THRESHOLD = 0.8
+# A span cut to fit the budget must keep at least this many tokens
+MIN_SPAN_TOKENS = 32
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+class Span(NamedTuple):
+    document: str
+    text: str
+    score: float
+
+
+class AssembledContext(NamedTuple):
+    text: str
+    segments: int
+    tokens: int
+    raw_tokens: int
+    candidates: int
+    merged: int
+    dropped: int
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate token count of `text`, without a tokenizer round trip.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def document_key(vector_id: str) -> str:
+    """
+    Document a chunk id belongs to, for ids of the form '{key}_{i}' or '{key}#{hash}'.
+    """
+    if '#' in vector_id:
+        return vector_id.split('#', 1)[0]
+    return vector_id.rsplit('_', 1)[0]
+
+
+def _overlap(a: str, b: str) -> int:
+    """
+    Length of the longest suffix of `a` that is a prefix of `b`, or 0 below MIN_OVERLAP.
+    """
+    if len(a) < MIN_OVERLAP or len(b) < MIN_OVERLAP:
+        return 0
+    probe = b[:MIN_OVERLAP]
+    pos = a.find(probe)
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(probe, pos + 1)
+    return 0
+
+
+def section_label(text: str) -> str:
+    """
+    Trailing ' - {title} {header}' label that ingestion adds to paragraph chunks.
+
+    Returns the text after the last ' - ', or '' if there is none.
+    """
+    _, dash, label = text.rpartition(' - ')
+    return label if dash else ''
+
+
+def _merge_pair(group: List[Span]):
+    labels = [section_label(span.text) for span in group]
+    for i, a in enumerate(group):
+        for j, b in enumerate(group):
+            # Paragraphs of one section share their label, which can look
+            # like an overlap when the next paragraph opens with the header
+            if i != j and not (labels[i] and labels[i] == labels[j]):
+                k = _overlap(a.text, b.text)
+                if k:
+                    return i, j, k
+    return None
+
+
+def merge_windows(spans: List[Span]) -> List[Span]:
+    """
+    Join spans of the same document that overlap end-to-start into one span.
+
+    A merged span keeps the best score of its windows. Merging repeats
+    until no two spans of a document overlap, so a run of consecutive
+    windows collapses into a single span. Spans ending in the same
+    section label are distinct paragraphs and are never merged.
+    """
+    by_document: Dict[str, List[Span]] = {}
+    for span in spans:
+        by_document.setdefault(span.document, []).append(span)
+
+    merged = []
+    for document, group in by_document.items():
+        pair = _merge_pair(group)
+        while pair is not None:
+            i, j, k = pair
+            a, b = group[i], group[j]
+            group = [s for n, s in enumerate(group) if n not in (i, j)]
+            group.append(Span(document, a.text + b.text[k:], max(a.score, b.score)))
+            pair = _merge_pair(group)
+        merged.extend(group)
+    return merged
+
+
+def _trigrams(text: str) -> Set[Tuple[str, ...]]:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < 3:
+        return {tuple(words)} if words else set()
+    return set(zip(words, words[1:], words[2:]))
+
+
+def drop_redundant(spans: List[Span], threshold: float = REDUNDANCY_THRESHOLD) -> List[Span]:
+    """
+    Drop spans whose text is already covered by higher-scoring spans.
+
+    Spans are visited best first. One is dropped when at least `threshold`
+    of its word trigrams occur in the spans kept so far, so a lowercased
+    window goes after its source paragraph, or after the two paragraphs it
+    straddles. A span that covers kept spans the same way replaces them
+    at the position and score of the best one. Returns the kept spans,
+    best first.
+    """
+    kept: List[Tuple[Span, Set[Tuple[str, ...]]]] = []
+    covered: Set[Tuple[str, ...]] = set()
+    for span in sorted(spans, key=lambda s: s.score, reverse=True):
+        grams = _trigrams(span.text)
+        if grams and len(grams & covered) / len(grams) >= threshold:
+            continue
+        inside = [i for i, (_, other) in enumerate(kept) if other and len(other & grams) / len(other) >= threshold]
+        if inside:
+            best = kept[inside[0]][0]
+            kept[inside[0]] = (Span(span.document, span.text, best.score), grams)
+            kept = [entry for i, entry in enumerate(kept) if i not in inside[1:]]
+            covered = set().union(*(other for _, other in kept))
+        else:
+            kept.append((span, grams))
+            covered |= grams
+    return [span for span, _ in kept]
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    """
+    Cut `text` to at most `max_chars`, at the last sentence end or space if there is one.
+    """
+    cut = text[:max_chars]
+    end = max(cut.rfind('. '), cut.rfind('.\n'))
+    if end > max_chars // 2:
+        return cut[:end + 1]
+    space = cut.rfind(' ')
+    return cut[:space] if space > 0 else cut
+
+
+def assemble_context(
+    matches: List[dict],
+    max_tokens: Optional[int] = CONTEXT_TOKEN_BUDGET,
+    raw_k: int = 5,
+    separator: str = SEPARATOR
+) -> AssembledContext:
+    """
+    Build a prompt context from over-fetched matches within a token budget.
+
+    Overlapping windows of the same document are merged back into one
+    span, spans repeated by a better one are dropped, and the rest are
+    packed best first. A span that doesn't fit is cut at a sentence
+    boundary to fill the budget when at least MIN_SPAN_TOKENS remain (or
+    nothing has been packed yet), and skipped for shorter spans otherwise.
+
+    Args:
+        matches (List[dict]): Matches best first, with 'id', 'score' and {'text': ...} 'metadata'
+        max_tokens (Optional[int]): Token budget for the context, or None
+            for `raw_tokens`, the size of the unassembled context
+        raw_k (int): Number of top matches the unassembled context would have
+            joined, used for `raw_tokens`
+        separator (str): Text placed between spans
+
+    Returns:
+        AssembledContext: The context text and token counts before and after
+    """
+    texts = [m['metadata']['text'] for m in matches]
+    raw_tokens = estimate_tokens(separator.join(texts[:raw_k]))
+    if max_tokens is None:
+        max_tokens = raw_tokens
+
+    spans = [Span(document_key(m['id']), text, float(m['score'])) for m, text in zip(matches, texts)]
+    merged = merge_windows(spans)
+    kept = drop_redundant(merged)
+
+    separator_tokens = estimate_tokens(separator)
+    parts = []
+    used = 0
+    for span in kept:
+        cost = estimate_tokens(span.text) + (separator_tokens if parts else 0)
+        if used + cost <= max_tokens:
+            parts.append(span.text)
+            used += cost
+            continue
+        remaining = max_tokens - used - (separator_tokens if parts else 0)
+        if not parts or remaining >= MIN_SPAN_TOKENS:
+            parts.append(_truncate(span.text, remaining * CHARS_PER_TOKEN))
+            break
+
+    text = separator.join(parts)
+    return AssembledContext(
+        text=text,
+        segments=len(parts),
+        tokens=estimate_tokens(text),
+        raw_tokens=raw_tokens,
+        candidates=len(matches),
+        merged=len(spans) - len(merged),
+        dropped=len(merged) - len(kept)
+    )
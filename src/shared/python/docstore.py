@@ -0,0 +1,215 @@
+import hashlib
+import mmap
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from util import create_log
+
+logger = create_log('docstore', os.environ.get("LOG_LEVEL"))
+
+TEXT_FILE = 'texts.bin'
+INDEX_FILE = 'index.npz'
+# Hash of the ingested chunks, read by inference as the index version
+VERSION_FILE = 'version'
+# Index version a downloaded copy of an S3 store was fetched for
+SOURCE_VERSION_FILE = 'source_version'
+
+
+def pack_strings(strings: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encode strings as one UTF-8 byte array plus n + 1 offsets into it.
+    """
+    encoded = [s.encode() for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    """
+    Decode every string packed by `pack_strings`.
+    """
+    data = blob.tobytes()
+    return [data[offsets[i]:offsets[i + 1]].decode() for i in range(len(offsets) - 1)]
+
+
+class DocStore:
+    """
+    Read-only chunk texts keyed by vector id, for resolving id-only vector matches.
+
+    The texts are one UTF-8 blob in `<path>/texts.bin`, memory-mapped so
+    only the pages of texts actually read are loaded, and `<path>/index.npz`
+    holds the ids and each text's byte offsets. `<path>/version` holds a
+    hash of every id and text, which changes whenever a re-ingest changes
+    the corpus. Write a store with `write`.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        with np.load(self.path / INDEX_FILE) as saved:
+            self.ids = unpack_strings(saved['id_blob'], saved['id_offsets'])
+            self.offsets = saved['offsets']
+        self._rows = {vector_id: row for row, vector_id in enumerate(self.ids)}
+        # mmap can't map an empty file. The map keeps its own handle, so a
+        # store dropped after a re-ingest holds no open file
+        size = int(self.offsets[-1]) if len(self.offsets) else 0
+        with open(self.path / TEXT_FILE, 'rb') as f:
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    @staticmethod
+    def write(path: str, chunks: Iterable[Tuple[str, str]]) -> int:
+        """
+        Write a store holding `chunks`, replacing any existing one.
+
+        Args:
+            path (str): Store directory
+            chunks (Iterable[Tuple[str, str]]): (vector id, text) pairs
+
+        Returns:
+            int: Number of chunks written
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        ids, texts = [], []
+        for vector_id, text in dict(chunks).items():
+            ids.append(vector_id)
+            texts.append(text)
+        blob, offsets = pack_strings(texts)
+        id_blob, id_offsets = pack_strings(ids)
+
+        # The index names the blob's size, so the blob is replaced first
+        tmp = path / (TEXT_FILE + '.tmp')
+        blob.tofile(tmp)
+        tmp.replace(path / TEXT_FILE)
+        tmp = path / 'index.tmp.npz'
+        np.savez(tmp, offsets=offsets, id_blob=id_blob, id_offsets=id_offsets)
+        tmp.replace(path / INDEX_FILE)
+        tmp = path / (VERSION_FILE + '.tmp')
+        tmp.write_text(content_version(zip(ids, texts)))
+        tmp.replace(path / VERSION_FILE)
+        return len(ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, vector_id: str) -> bool:
+        return vector_id in self._rows
+
+    def get(self, vector_id: str) -> Optional[str]:
+        row = self._rows.get(vector_id)
+        if row is None:
+            return None
+        return self._blob[self.offsets[row]:self.offsets[row + 1]].decode()
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, str]:
+        """
+        Texts of the given ids; ids not in the store are left out.
+
+        Args:
+            ids (Iterable[str]): Vector ids
+
+        Returns:
+            Dict[str, str]: Id to text
+        """
+        blob, offsets, rows = self._blob, self.offsets, self._rows
+        found = {}
+        for vector_id in ids:
+            row = rows.get(vector_id)
+            if row is not None:
+                found[vector_id] = blob[offsets[row]:offsets[row + 1]].decode()
+        return found
+
+    def size_bytes(self) -> int:
+        return (self.path / TEXT_FILE).stat().st_size + (self.path / INDEX_FILE).stat().st_size
+
+    def close(self) -> None:
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+
+
+def content_version(chunks: Iterable[Tuple[str, str]]) -> str:
+    """
+    Version of a corpus: a hash over its (vector id, text) pairs, independent of order.
+
+    Args:
+        chunks (Iterable[Tuple[str, str]]): (vector id, text) pairs
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    for vector_id, text in sorted(chunks):
+        for part in (vector_id, text):
+            encoded = part.encode()
+            digest.update(len(encoded).to_bytes(8, 'little'))
+            digest.update(encoded)
+    return digest.hexdigest()[:16]
+
+
+def upload_docstore(path: str, uri: str) -> None:
+    """
+    Copy a store directory to s3://bucket/prefix.
+
+    Args:
+        path (str): Store directory
+        uri (str): Destination prefix
+    """
+    from cache import upload_s3_file
+    # The version goes last so readers never see it ahead of the texts
+    for name in (TEXT_FILE, INDEX_FILE, VERSION_FILE):
+        upload_s3_file(str(Path(path) / name), f"{uri.rstrip('/')}/{name}")
+
+
+def docstore_from_env(version=None) -> Optional[DocStore]:
+    """
+    Open the store at DOCSTORE_PATH, or None if it isn't configured.
+
+    An s3://bucket/prefix path is downloaded to DOCSTORE_CACHE (default
+    /tmp/docstore), and downloaded again when `version` differs from the
+    version the local copy was downloaded for.
+
+    Args:
+        version: Current index version, e.g. from `index_version_from_env`
+
+    Returns:
+        Optional[DocStore]: The opened store
+    """
+    path = os.environ.get('DOCSTORE_PATH')
+    if not path:
+        return None
+    if path.startswith('s3://'):
+        from cache import fetch_s3_copy
+        local = os.environ.get('DOCSTORE_CACHE', '/tmp/docstore')
+        objects = [(f"{path.rstrip('/')}/{name}", os.path.join(local, name)) for name in (TEXT_FILE, INDEX_FILE, VERSION_FILE)]
+        if fetch_s3_copy(objects, os.path.join(local, SOURCE_VERSION_FILE), version):
+            logger.info(f"Downloaded docstore for index version {version} to {local}")
+        path = local
+    store = DocStore(path)
+    logger.info(f"Opened docstore with {len(store)} chunks at {path}")
+    return store
+
+
+def index_version_from_env() -> Optional[str]:
+    """
+    Read the index version written by ingestion, or None if there isn't one.
+
+    The version is read from INDEX_VERSION_PATH, a local file or s3://
+    object, defaulting to the version file next to DOCSTORE_PATH.
+
+    Returns:
+        Optional[str]: The version
+    """
+    path = os.environ.get('INDEX_VERSION_PATH')
+    if not path and os.environ.get('DOCSTORE_PATH'):
+        path = f"{os.environ['DOCSTORE_PATH'].rstrip('/')}/{VERSION_FILE}"
+    if not path:
+        return None
+    if path.startswith('s3://'):
+        from cache import read_s3_text
+        version = read_s3_text(path)
+    else:
+        version = Path(path).read_text() if os.path.exists(path) else None
+    return version.strip() if version else None
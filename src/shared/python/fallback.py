@@ -0,0 +1,393 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from util import create_log
+
+logger = create_log('fallback', os.environ.get("LOG_LEVEL"))
+
+SEQUENTIAL = 'sequential'
+HEDGED = 'hedged'
+RACE = 'race'
+MODES = (SEQUENTIAL, HEDGED, RACE)
+
+
+class CircuitBreaker:
+    """
+    Per-model circuit breaker.
+
+    After `failure_threshold` consecutive failures the breaker opens and the
+    model is skipped for `reset_timeout` seconds. After that a single
+    caller is let through as a trial (half-open) while the others keep
+    skipping the model; success closes the breaker, failure re-opens it.
+    A trial that never reports back, e.g. because its call was abandoned,
+    is given up after another `reset_timeout` and the next caller becomes
+    the trial.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self) -> bool:
+        """
+        Whether a call may go to the model; in half-open, claims the trial.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            if self.trial_at is not None and now - self.trial_at < self.reset_timeout:
+                return False
+            self.trial_at = now
+            return True
+
+    def release(self) -> None:
+        """Give up a claimed trial without a result, e.g. when the call never ran."""
+        with self._lock:
+            self.trial_at = None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.trial_at = None
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """
+    Rolling window of observed latencies for one model.
+    """
+
+    def __init__(self, window: int = 100, min_samples: int = 5):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        Latency at percentile `p` (0-1), or None until enough samples exist.
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class FallbackResult:
+    """
+    Outcome of a FallbackPolicy call: the text, the model that produced it
+    and the per-request log of policy decisions and latencies.
+    """
+
+    def __init__(self, text: str, model: Optional[str], decisions: List[Dict[str, Any]]):
+        self.text = text
+        self.model = model
+        self.decisions = decisions
+
+    @property
+    def fallbacks(self) -> int:
+        return max(0, sum(1 for d in self.decisions if d['event'] == 'start') - 1)
+
+    def latencies(self) -> Dict[str, float]:
+        return {d['model']: d['latency'] for d in self.decisions if 'latency' in d}
+
+
+class FallbackPolicy:
+    """
+    Runs a prompt against an ordered list of models.
+
+    Modes:
+        sequential: try each model in turn until one gives an acceptable answer
+        hedged: start the next model if the current one hasn't answered by its
+            `hedge_percentile` latency (or `hedge_delay` until enough samples exist)
+        race: start every model at once and take the first acceptable answer
+
+    Models whose circuit breaker is open are skipped. A failing or rejected
+    answer starts the next model immediately, and a failing model's name
+    and error are passed to `on_error`, e.g. to rebuild its client.
+
+    Each `generate` call runs its models on its own threads. Calls that
+    lose a race or a hedge are abandoned: a running request can't be
+    cancelled, so it keeps its thread (and connection) until the model
+    answers, and the answer is discarded. `abandoned` counts those still
+    running; once it reaches `max_abandoned`, races and hedges are not
+    started and models are tried one at a time until some finish.
+
+    With a `deadline`, each model is sent the time left as its request
+    timeout and no model is started once it has passed; calls still running
+    then are abandoned and end by the deadline. Errors after the deadline
+    don't count against a model's circuit breaker.
+    """
+
+    def __init__(
+        self,
+        model_names: List[str],
+        get_model: Callable[[str], Any],
+        mode: str = HEDGED,
+        hedge_percentile: float = 0.9,
+        hedge_delay: float = 3.0,
+        is_acceptable: Optional[Callable[[str], bool]] = None,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30,
+        on_error: Optional[Callable[[str, Exception], Any]] = None,
+        max_abandoned: int = 8
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Unknown fallback mode '{mode}', expected one of {MODES}")
+
+        self.model_names = list(model_names)
+        self.get_model = get_model
+        self.mode = mode
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.is_acceptable = is_acceptable or (lambda text: bool(text))
+        self.on_error = on_error
+        self.breakers = {name: CircuitBreaker(failure_threshold, reset_timeout) for name in self.model_names}
+        self.latency = {name: LatencyTracker() for name in self.model_names}
+        self.max_abandoned = max_abandoned
+        self.abandoned = 0
+        self._lock = threading.Lock()
+
+    def _deadline(self, name: str) -> float:
+        observed = self.latency[name].percentile(self.hedge_percentile)
+        return observed if observed is not None else self.hedge_delay
+
+    def _call(self, name: str, prompt: str, deadline: Optional[float] = None) -> str:
+        if deadline is None:
+            return self.get_model(name).generate_content(prompt).text
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Deadline passed before {name} was called")
+        return self.get_model(name).generate_content(prompt, request_options={'timeout': remaining}).text
+
+    def _can_hedge(self) -> bool:
+        return self.abandoned < self.max_abandoned
+
+    def _abandon(self, future) -> None:
+        with self._lock:
+            self.abandoned += 1
+        future.add_done_callback(self._release)
+
+    def _release(self, future) -> None:
+        with self._lock:
+            self.abandoned -= 1
+
+    def generate(self, prompt: str, deadline: Optional[float] = None) -> FallbackResult:
+        """
+        Generate an answer for `prompt` following the policy.
+
+        Args:
+            prompt (str): Full prompt sent to each model
+            deadline (Optional[float]): time.monotonic() value by which to give up
+
+        Returns:
+            FallbackResult: Winning text and the decision log. If no model
+            gives an acceptable answer, the last rejected text is returned.
+
+        Raises:
+            TimeoutError: If no model answered before `deadline`
+            Exception: The last model error, if every model failed
+        """
+        started = time.monotonic()
+        decisions: List[Dict[str, Any]] = []
+        queue = []
+        for name in self.model_names:
+            if self.breakers[name].allow():
+                queue.append(name)
+            else:
+                decisions.append({'model': name, 'event': 'skip', 'reason': 'circuit open'})
+
+        pending: Dict[Any, tuple] = {}
+        last_error: Optional[Exception] = None
+        rejected: Optional[FallbackResult] = None
+        executor = ThreadPoolExecutor(max_workers=max(1, len(queue)))
+
+        def expired():
+            return deadline is not None and time.monotonic() >= deadline
+
+        def launch():
+            name = queue.pop(0)
+            decisions.append({'model': name, 'event': 'start', 'at': round(time.monotonic() - started, 4)})
+            pending[executor.submit(self._call, name, prompt, deadline)] = (name, time.monotonic())
+
+        try:
+            if queue and not expired():
+                launch()
+            while self.mode == RACE and queue and self._can_hedge() and not expired():
+                launch()
+
+            while pending:
+                timeout = None
+                if self.mode == HEDGED and queue and self._can_hedge():
+                    newest, launched_at = max(pending.values(), key=lambda p: p[1])
+                    timeout = max(0.0, launched_at + self._deadline(newest) - time.monotonic())
+                if deadline is not None:
+                    remaining = max(0.0, deadline - time.monotonic())
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done and expired():
+                    for late in pending:
+                        self._abandon(late)
+                        decisions.append({'model': pending[late][0], 'event': 'abandon'})
+                    self._log(FallbackResult('', None, decisions), started)
+                    raise TimeoutError("No model answered before the deadline")
+                if not done:
+                    decisions.append({'model': queue[0], 'event': 'hedge', 'at': round(time.monotonic() - started, 4)})
+                    launch()
+                    continue
+
+                for future in done:
+                    name, launched_at = pending.pop(future)
+                    latency = round(time.monotonic() - launched_at, 4)
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        if not expired():
+                            self._failed(name, e)
+                        else:
+                            self.breakers[name].release()
+                        decisions.append({'model': name, 'event': 'error', 'latency': latency, 'error': str(e)})
+                        last_error = e
+                    else:
+                        self.breakers[name].record_success()
+                        self.latency[name].record(latency)
+                        if self.is_acceptable(text):
+                            decisions.append({'model': name, 'event': 'win', 'latency': latency})
+                            for loser in pending:
+                                self._abandon(loser)
+                                decisions.append({'model': pending[loser][0], 'event': 'abandon'})
+                            result = FallbackResult(text, name, decisions)
+                            self._log(result, started)
+                            return result
+                        decisions.append({'model': name, 'event': 'reject', 'latency': latency})
+                        rejected = FallbackResult(text, name, decisions)
+
+                    if queue and not pending and not expired():
+                        launch()
+
+            if rejected is not None:
+                self._log(rejected, started)
+                return rejected
+            self._log(FallbackResult('', None, decisions), started)
+            if last_error is not None:
+                raise last_error
+            if queue:
+                raise TimeoutError("Deadline passed before a model was called")
+            raise RuntimeError("No generation model available, all circuits are open")
+        finally:
+            # Models allowed through but never started give back their trial
+            for name in queue:
+                self.breakers[name].release()
+            # Abandoned calls finish on their own threads, which then exit
+            executor.shutdown(wait=False)
+
+    def stream(self, prompt: str, decisions: Optional[List[Dict[str, Any]]] = None) -> Iterator[str]:
+        """
+        Stream an answer for `prompt`, falling back only before the first chunk.
+
+        Streaming can't take back text already sent, so models are tried in
+        order until one yields its first chunk; that model then streams the
+        rest of the answer. Open circuits are skipped as in `generate`. A
+        model only counts as a success once its stream is complete; an error
+        part way through counts against its breaker and is raised.
+
+        Args:
+            prompt (str): Full prompt sent to each model
+            decisions (Optional[List[Dict[str, Any]]]): List the decision log is appended to
+
+        Yields:
+            str: Text chunks as they arrive
+
+        Raises:
+            Exception: The last model error, if no model produced a chunk,
+                or the streaming model's error after its first chunk
+        """
+        started = time.monotonic()
+        decisions = decisions if decisions is not None else []
+        last_error: Optional[Exception] = None
+
+        for name in self.model_names:
+            if not self.breakers[name].allow():
+                decisions.append({'model': name, 'event': 'skip', 'reason': 'circuit open'})
+                continue
+
+            launched_at = time.monotonic()
+            decisions.append({'model': name, 'event': 'start', 'at': round(launched_at - started, 4)})
+            try:
+                chunks = iter(self.get_model(name).generate_content(prompt, stream=True))
+                first = next(chunks).text
+            except Exception as e:
+                self._failed(name, e)
+                decisions.append({'model': name, 'event': 'error', 'latency': round(time.monotonic() - launched_at, 4), 'error': str(e)})
+                last_error = e
+                continue
+
+            decisions.append({'model': name, 'event': 'first_chunk', 'latency': round(time.monotonic() - launched_at, 4)})
+            try:
+                yield first
+                for chunk in chunks:
+                    yield chunk.text
+            except GeneratorExit:
+                # The caller stopped reading; the stream says nothing about the model
+                self.breakers[name].release()
+                raise
+            except Exception as e:
+                self._failed(name, e)
+                decisions.append({'model': name, 'event': 'error', 'latency': round(time.monotonic() - launched_at, 4), 'error': str(e)})
+                self._log(FallbackResult('', name, decisions), started)
+                raise
+
+            self.breakers[name].record_success()
+            self.latency[name].record(round(time.monotonic() - launched_at, 4))
+            self._log(FallbackResult('', name, decisions), started)
+            return
+
+        self._log(FallbackResult('', None, decisions), started)
+        if last_error is not None:
+            raise last_error
+        raise RuntimeError("No generation model available, all circuits are open")
+
+    def _failed(self, name: str, error: Exception) -> None:
+        self.breakers[name].record_failure()
+        if self.on_error is not None:
+            try:
+                self.on_error(name, error)
+            except Exception as e:
+                logger.warning("Error hook for %s failed: %s", name, e)
+
+    def _log(self, result: FallbackResult, started: float) -> None:
+        logger.info(
+            "Fallback %s: model=%s total=%.3fs decisions=%s",
+            self.mode, result.model, time.monotonic() - started, result.decisions
+        )
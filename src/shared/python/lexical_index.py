@@ -0,0 +1,292 @@
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from docstore import pack_strings, unpack_strings
+from util import create_log
+
+logger = create_log('lexical_index', os.environ.get("LOG_LEVEL"))
+
+# Words joined by '.' or '-' stay one token ("r.31", "b-17") and are also
+# indexed by their parts; single letters other than digits are dropped
+TOKEN_PATTERN = re.compile(r'[^\W_]+(?:[.\-][^\W_]+)*')
+PART_PATTERN = re.compile(r'[^\W_]+')
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'did', 'do', 'does', 'for', 'from', 'had', 'has',
+    'have', 'how', 'in', 'is', 'it', 'its', 'of', 'on', 'or', 'that', 'the', 'their', 'this', 'to',
+    'was', 'were', 'what', 'when', 'where', 'which', 'who', 'whom', 'why', 'with'
+))
+
+# Rank constant of reciprocal rank fusion
+RRF_K = 60
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased index terms of `text`, without stopwords.
+
+    Args:
+        text (str): Chunk or question text
+
+    Returns:
+        List[str]: Terms in order of occurrence, repeated as they occur
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS or (len(token) == 1 and not token.isdigit()):
+            continue
+        terms.append(token)
+        if '.' in token or '-' in token:
+            terms.extend(part for part in PART_PATTERN.findall(token) if len(part) > 1 or part.isdigit())
+    return terms
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index held in flat numpy arrays.
+
+    Postings are stored CSR-style: the documents containing term t are
+    `doc_ids[offsets[t]:offsets[t + 1]]`, with their term frequencies at the
+    same positions in `freqs`. Chunk ids and texts are kept as one UTF-8
+    blob each with offsets, so the whole index saves to a single `.npz`
+    file without pickling and a chunk's text is only decoded when it's
+    returned.
+    """
+
+    def __init__(
+        self,
+        terms: List[str],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        freqs: np.ndarray,
+        doc_lengths: np.ndarray,
+        ids: List[str],
+        text_blob: np.ndarray,
+        text_offsets: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75
+    ):
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.freqs = freqs
+        self.doc_lengths = doc_lengths
+        self.ids = ids
+        self.text_blob = text_blob
+        self.text_offsets = text_offsets
+        self.k1 = k1
+        self.b = b
+
+        count = len(ids)
+        average = float(doc_lengths.mean()) if count else 0.0
+        df = np.diff(offsets).astype(np.float64)
+        self.idf = np.log1p((count - df + 0.5) / (df + 0.5)).astype(np.float32)
+        # Weight of a term the corpus doesn't contain, used for confidence
+        self.max_idf = math.log1p((count + 0.5) / 0.5)
+        self._length_norm = (k1 * (1 - b + b * doc_lengths / average) if average else np.full(count, k1)).astype(np.float32)
+
+    @classmethod
+    def build(cls, ids: Sequence[str], texts: Sequence[str], k1: float = 1.2, b: float = 0.75) -> 'BM25Index':
+        """
+        Index chunks, e.g. the `get_docs` output of every document.
+
+        Args:
+            ids (Sequence[str]): Chunk ids, one per text
+            texts (Sequence[str]): Chunk texts
+            k1 (float): Term frequency saturation
+            b (float): Document length normalisation
+
+        Returns:
+            BM25Index: The built index
+        """
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        for doc, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[doc] = sum(counts.values())
+            for term, tf in counts.items():
+                docs, tfs = postings.setdefault(term, ([], []))
+                docs.append(doc)
+                tfs.append(tf)
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(postings[term][0]) for term in terms], out=offsets[1:])
+        doc_ids = np.fromiter((d for term in terms for d in postings[term][0]), dtype=np.int32, count=offsets[-1])
+        freqs = np.fromiter((min(tf, 65535) for term in terms for tf in postings[term][1]), dtype=np.uint16, count=offsets[-1])
+        text_blob, text_offsets = pack_strings(texts)
+        return cls(terms, offsets, doc_ids, freqs, doc_lengths, list(ids), text_blob, text_offsets, k1, b)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def text(self, row: int) -> str:
+        return self.text_blob[self.text_offsets[row]:self.text_offsets[row + 1]].tobytes().decode()
+
+    def scores(self, terms: Iterable[str]) -> np.ndarray:
+        """
+        BM25 score of every chunk for a set of query terms.
+
+        Args:
+            terms (Iterable[str]): Query terms, repeats are ignored
+
+        Returns:
+            np.ndarray: float32 scores, one per chunk
+        """
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(terms):
+            t = self.terms.get(term)
+            if t is None:
+                continue
+            start, end = self.offsets[t], self.offsets[t + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.freqs[start:end].astype(np.float32)
+            scores[docs] += self.idf[t] * tf * (self.k1 + 1) / (tf + self._length_norm[docs])
+        return scores
+
+    def query(self, text: str, top_k: int = 5, include_metadata: bool = True) -> Any:
+        """
+        Best matching chunks for a question.
+
+        The result has the vector store's `matches` shape plus two signals
+        for deciding whether the lexical result can be trusted on its own:
+        `confidence`, the top score relative to that of an average-length
+        chunk containing every question term once (terms missing from the
+        corpus count at full weight, and repeats can take it above 1), and
+        `margin`, the ratio of the top score to the runner-up.
+
+        Args:
+            text (str): Question text
+            top_k (int): Number of matches to return
+            include_metadata (bool): Include {'text': ...} metadata
+
+        Returns:
+            Any: Object with `matches`, `confidence` and `margin`
+        """
+        terms = set(tokenize(text))
+        scores = self.scores(terms)
+        candidates = np.flatnonzero(scores)
+        if not len(candidates):
+            return SimpleNamespace(matches=[], confidence=0.0, margin=0.0)
+
+        k = min(top_k, len(candidates))
+        top = candidates[np.argpartition(scores[candidates], len(candidates) - k)[len(candidates) - k:]]
+        top = top[np.argsort(scores[top])[::-1]]
+
+        upper = sum(float(self.idf[self.terms[t]]) if t in self.terms else self.max_idf for t in terms)
+        best = float(scores[top[0]])
+        second = float(np.partition(scores[candidates], -2)[-2]) if len(candidates) > 1 else 0.0
+        return SimpleNamespace(
+            matches=[
+                {
+                    'id': self.ids[row],
+                    'score': float(scores[row]),
+                    'metadata': {'text': self.text(row)} if include_metadata else None
+                }
+                for row in top
+            ],
+            confidence=best / upper if upper else 0.0,
+            margin=best / second if second else float('inf')
+        )
+
+    def save(self, path: str) -> None:
+        """
+        Write the index to a single `.npz` file, replacing it atomically.
+
+        Args:
+            path (str): Destination file
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        term_blob, term_offsets = pack_strings(sorted(self.terms, key=self.terms.get))
+        id_blob, id_offsets = pack_strings(self.ids)
+        tmp = path.with_name(path.name + '.tmp.npz')
+        np.savez(
+            tmp,
+            term_blob=term_blob, term_offsets=term_offsets,
+            offsets=self.offsets, doc_ids=self.doc_ids, freqs=self.freqs, doc_lengths=self.doc_lengths,
+            id_blob=id_blob, id_offsets=id_offsets,
+            text_blob=self.text_blob, text_offsets=self.text_offsets,
+            params=np.array([self.k1, self.b])
+        )
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25Index':
+        """
+        Read an index written by `save`.
+
+        Args:
+            path (str): Index file
+
+        Returns:
+            BM25Index: The loaded index
+        """
+        with np.load(path) as saved:
+            k1, b = saved['params'].tolist()
+            return cls(
+                unpack_strings(saved['term_blob'], saved['term_offsets']),
+                saved['offsets'], saved['doc_ids'], saved['freqs'], saved['doc_lengths'],
+                unpack_strings(saved['id_blob'], saved['id_offsets']),
+                saved['text_blob'], saved['text_offsets'],
+                k1, b
+            )
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[dict]], top_k: int = 5, k: int = RRF_K) -> List[dict]:
+    """
+    Merge ranked match lists by reciprocal rank fusion.
+
+    Each match scores sum(1 / (k + rank)) over the lists it appears in.
+    Matches are identified by their text, since the lexical index and the
+    vector store may id the same chunk differently.
+
+    Args:
+        rankings (Iterable[List[dict]]): Match lists, best first, with 'metadata'
+        top_k (int): Number of fused matches to return
+        k (int): Rank constant damping the weight of the top ranks
+
+    Returns:
+        List[dict]: Fused matches, best first, with the fused score as 'score'
+    """
+    fused: Dict[str, dict] = {}
+    for ranking in rankings:
+        for rank, match in enumerate(ranking, start=1):
+            metadata = match['metadata'] or {}
+            entry = fused.setdefault(metadata.get('text', match['id']), {'id': match['id'], 'score': 0.0, 'metadata': metadata})
+            entry['score'] += 1 / (k + rank)
+    return sorted(fused.values(), key=lambda m: m['score'], reverse=True)[:top_k]
+
+
+def lexical_index_from_env(version=None) -> Optional[BM25Index]:
+    """
+    Load the BM25 index at LEXICAL_INDEX_PATH, or None if it isn't configured.
+
+    An s3://bucket/key path is downloaded to LEXICAL_INDEX_CACHE (default
+    /tmp/lexical_index.npz), and downloaded again when `version` differs
+    from the version the local copy was downloaded for.
+
+    Args:
+        version: Current index version, e.g. from `docstore.index_version_from_env`
+
+    Returns:
+        Optional[BM25Index]: The loaded index
+    """
+    path = os.environ.get('LEXICAL_INDEX_PATH')
+    if not path:
+        return None
+    if path.startswith('s3://'):
+        from cache import fetch_s3_copy
+        local = os.environ.get('LEXICAL_INDEX_CACHE', '/tmp/lexical_index.npz')
+        if fetch_s3_copy([(path, local)], f'{local}.version', version):
+            logger.info(f"Downloaded lexical index for index version {version} to {local}")
+        path = local
+    index = BM25Index.load(path)
+    logger.info(f"Loaded lexical index with {len(index)} chunks and {len(index.terms)} terms from {path}")
+    return index
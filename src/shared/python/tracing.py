@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from util import create_log
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "RAG/Inference")
+
+# EMF documents must be the whole log line, so this logger has no prefix
+metrics_logger = create_log('metrics', 'info', fmt='%(message)s')
+metrics_logger.propagate = False
+
+
+class Lazy:
+    """
+    Log argument that is only computed when the record is formatted, e.g.
+    logger.debug("Event: %s", Lazy(json.dumps, event)).
+    """
+
+    __slots__ = ('fn', 'args')
+
+    def __init__(self, fn: Callable[..., Any], *args):
+        self.fn = fn
+        self.args = args
+
+    def __str__(self) -> str:
+        return str(self.fn(*self.args))
+
+    __repr__ = __str__
+
+
+class _NullSpan:
+    """Span used outside a trace; entering and leaving it does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    Times a block and adds the elapsed milliseconds to the trace metric `{name}_ms`.
+    """
+
+    __slots__ = ('trace', 'name', 'started')
+
+    def __init__(self, trace: 'Trace', name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.trace.add_time(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Trace:
+    """
+    Metrics and properties collected for one request.
+
+    Batch requests answer their questions on worker threads that share the
+    request's trace, so every update and the final snapshot take `_lock`.
+    """
+
+    def __init__(self, properties: Dict[str, Any]):
+        self.started = time.perf_counter()
+        self.metrics: Dict[str, float] = {}
+        self.properties = properties
+        self._lock = threading.Lock()
+
+    def add_time(self, name: str, seconds: float) -> None:
+        key = f'{name}_ms'
+        with self._lock:
+            self.metrics[key] = self.metrics.get(key, 0.0) + seconds * 1000
+
+    def set(self, name: str, value: float) -> None:
+        with self._lock:
+            self.metrics[name] = value
+
+    def property(self, name: str, value: Any) -> None:
+        with self._lock:
+            self.properties[name] = value
+
+    def snapshot(self) -> Tuple[Dict[str, float], Dict[str, Any]]:
+        """Copies of the metrics and properties recorded so far."""
+        with self._lock:
+            return dict(self.metrics), dict(self.properties)
+
+
+class Tracer:
+    """
+    Per-request stage timings emitted as CloudWatch Embedded Metric Format.
+
+    `begin` starts a trace for the current request and `finish` writes it
+    as one EMF JSON line, which CloudWatch turns into metrics without any
+    API calls. The trace lives in a context variable, so concurrent
+    requests on different threads keep separate traces. Outside a trace,
+    or with METRICS_ENABLED=false, `span` returns a shared no-op object and
+    the other calls return immediately.
+    """
+
+    def __init__(self, service: str, enabled: bool = METRICS_ENABLED, namespace: str = METRICS_NAMESPACE):
+        self.service = service
+        self.enabled = enabled
+        self.namespace = namespace
+        self.cold_start = True
+        self._current: ContextVar[Optional[Trace]] = ContextVar(f'trace_{service}', default=None)
+
+    def begin(self, **properties) -> None:
+        """
+        Start a trace for the current request.
+
+        Args:
+            **properties: Values logged with the metrics, e.g. a request id
+        """
+        if not self.enabled:
+            return
+        trace = Trace(properties)
+        trace.set('cold_start', 1 if self.cold_start else 0)
+        self.cold_start = False
+        self._current.set(trace)
+
+    def span(self, name: str):
+        """
+        Context manager timing a stage of the current request.
+
+        Args:
+            name (str): Stage name, recorded as the metric `{name}_ms`
+        """
+        trace = self._current.get()
+        return Span(trace, name) if trace is not None else NULL_SPAN
+
+    def set(self, name: str, value: float) -> None:
+        """Record a numeric metric for the current request."""
+        trace = self._current.get()
+        if trace is not None:
+            trace.set(name, value)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        """Add an externally measured duration to the metric `{name}_ms`."""
+        trace = self._current.get()
+        if trace is not None:
+            trace.add_time(name, seconds)
+
+    def property(self, name: str, value: Any) -> None:
+        """Record a non-metric value logged alongside the metrics."""
+        trace = self._current.get()
+        if trace is not None:
+            trace.property(name, value)
+
+    def finish(self) -> Optional[Dict[str, Any]]:
+        """
+        End the current trace and write it as an EMF log line.
+
+        Returns:
+            Optional[Dict[str, Any]]: The EMF document, or None without a trace
+        """
+        trace = self._current.get()
+        if trace is None:
+            return None
+        self._current.set(None)
+        trace.add_time('total', time.perf_counter() - trace.started)
+
+        # Workers of a batch that ran past its deadline may still be recording
+        recorded, properties = trace.snapshot()
+        metrics = {name: round(value, 3) for name, value in recorded.items()}
+        document = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [['Service']],
+                    'Metrics': [
+                        {'Name': name, 'Unit': 'Milliseconds' if name.endswith('_ms') else 'Count'}
+                        for name in metrics
+                    ]
+                }]
+            },
+            'Service': self.service,
+            **properties,
+            **metrics
+        }
+        metrics_logger.info(json.dumps(document, default=str))
+        return document
@@ -1,8 +1,10 @@
 import json
-import boto3
 import base64
 import logging
-from botocore.exceptions import ClientError
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
 
 levels = {
     'debug': logging.DEBUG,
@@ -12,7 +14,7 @@ levels = {
     'critical': logging.CRITICAL
 }
 
-def create_log(module, log_level='warning'):
+def create_log(module, log_level='warning', fmt='%(asctime)s | %(name)s | %(levelname)s: %(message)s'):
 
     logger = logging.getLogger(module)
 
@@ -25,13 +27,166 @@ def create_log(module, log_level='warning'):
         logger.setLevel(levels['warning'])
         consoleLog.setLevel(levels['warning'])
 
-    formatter = logging.Formatter('%(asctime)s | %(name)s | %(levelname)s: %(message)s')  # noqa: E501
+    formatter = logging.Formatter(fmt)
     consoleLog.setFormatter(formatter)
 
     logger.addHandler(consoleLog)
     return logger
 
-def get_secret(secret_name: str, region_name: str = "us-east-1") -> dict:
+logger = create_log('secrets', os.environ.get("LOG_LEVEL"))
+
+AUTH_FAILURE_STATUSES = {401, 403}
+AUTH_FAILURE_ERRORS = {'UnauthorizedException', 'PermissionDenied', 'Unauthenticated'}
+# Gemini rejects a revoked key with a 400 carrying this reason
+AUTH_FAILURE_REASONS = ('API_KEY_INVALID',)
+
+class SecretProvider:
+    """
+    Lazily resolved, in-memory cache of Secrets Manager values.
+
+    Every secret the provider knows about is fetched together in a single
+    BatchGetSecretValue call (following NextToken if the response is paged)
+    the first time any of them is used, and kept for `ttl` seconds. Only
+    the secret asked for has to be fetched; others that fail are logged
+    and retried on their next `get`. The boto3 client is created once and
+    reused.
+    """
+
+    def __init__(self, secret_names: Iterable[str] = (), region_name: str = "us-east-1", ttl: float = 900):
+        self.region_name = region_name
+        self.ttl = ttl
+        self.fetches = 0
+        self._names = list(dict.fromkeys(secret_names))
+        self._values: Dict[str, object] = {}
+        self._expires: Dict[str, float] = {}
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            # boto3 takes over 100ms to import, so it's left out of the cold start
+            import boto3
+            session = boto3.session.Session()
+            self._client = session.client(
+                service_name='secretsmanager',
+                region_name=self.region_name
+            )
+        return self._client
+
+    @staticmethod
+    def _decode(name: str, entry: dict) -> object:
+        if 'SecretString' in entry:
+            secret = json.loads(entry['SecretString'])
+        else:
+            # Handle binary secrets
+            secret = json.loads(base64.b64decode(entry['SecretBinary']))
+        if name not in secret:
+            raise KeyError(f"Secret '{name}' has no '{name}' key")
+        return secret[name]
+
+    def _fetch(self, names: List[str], required: str) -> None:
+        client = self._get_client()
+        self.fetches += 1
+        entries, errors = [], {}
+        request = {'SecretIdList': names}
+        while True:
+            response = client.batch_get_secret_value(**request)
+            entries.extend(response.get('SecretValues', []))
+            errors.update((error.get('SecretId'), error) for error in response.get('Errors', []))
+            if not response.get('NextToken'):
+                break
+            request['NextToken'] = response['NextToken']
+
+        expires = time.monotonic() + self.ttl
+        for entry in entries:
+            name = entry['Name']
+            self._values[name] = self._decode(name, entry)
+            self._expires[name] = expires
+
+        for name, error in errors.items():
+            if name != required:
+                logger.warning("Secret '%s' could not be fetched: %s %s", name, error.get('ErrorCode'), error.get('Message'))
+        if required in errors:
+            from botocore.exceptions import ClientError
+            error = errors[required]
+            raise ClientError(
+                {'Error': {'Code': error.get('ErrorCode'), 'Message': f"{required}: {error.get('Message')}"}},
+                'BatchGetSecretValue'
+            )
+        if required not in {entry['Name'] for entry in entries}:
+            raise KeyError(f"Secret '{required}' was not returned by Secrets Manager")
+
+    def get(self, secret_name: str) -> object:
+        """
+        Return a secret value, fetching every stale secret in one call if needed.
+
+        Args:
+            secret_name: Name of the secret
+
+        Returns:
+            object: Decrypted secret value
+        """
+        with self._lock:
+            if secret_name not in self._names:
+                self._names.append(secret_name)
+
+            now = time.monotonic()
+            if self._expires.get(secret_name, 0) <= now:
+                stale = [n for n in self._names if self._expires.get(n, 0) <= now]
+                self._fetch(stale, secret_name)
+
+            return self._values[secret_name]
+
+    def invalidate(self, secret_name: Optional[str] = None) -> None:
+        """
+        Expire one secret, or all of them, so the next `get` refetches.
+
+        Args:
+            secret_name: Name of the secret, or None for every secret
+        """
+        with self._lock:
+            if secret_name is None:
+                self._expires.clear()
+            else:
+                self._expires.pop(secret_name, None)
+
+    def refresh_on_auth_failure(self, error: Exception) -> bool:
+        """
+        Expire cached secrets when `error` looks like a rejected credential.
+
+        Args:
+            error: Exception raised by a client using one of the secrets
+
+        Returns:
+            bool: True if the error was an auth failure and secrets were expired
+        """
+        status = getattr(error, 'status', None) or getattr(error, 'code', None)
+        if status in AUTH_FAILURE_STATUSES or type(error).__name__ in AUTH_FAILURE_ERRORS \
+                or any(reason in str(error) for reason in AUTH_FAILURE_REASONS):
+            self.invalidate()
+            return True
+        return False
+
+
+_providers: Dict[str, SecretProvider] = {}
+
+
+def get_secret_provider(region_name: str = "us-east-1") -> SecretProvider:
+    """
+    Return the process-wide secret provider for a region.
+
+    Args:
+        region_name: AWS region where the secrets are stored
+
+    Returns:
+        SecretProvider: Shared provider instance
+    """
+    if region_name not in _providers:
+        _providers[region_name] = SecretProvider(region_name=region_name)
+    return _providers[region_name]
+
+
+def get_secret(secret_name: str, region_name: str = "us-east-1") -> object:
     """
     Retrieve a secret from AWS Secrets Manager
     
@@ -40,32 +195,6 @@ def get_secret(secret_name: str, region_name: str = "us-east-1") -> dict:
         region_name: AWS region where the secret is stored
     
     Returns:
-        dict: Decrypted secret value
+        object: Decrypted secret value, usually a string
     """
-    
-    # Create a Secrets Manager client
-    try:
-        session = boto3.session.Session()
-        client = session.client(
-            service_name='secretsmanager',
-            region_name=region_name
-        )
-    
-        # Get the secret value
-        response = client.get_secret_value(
-            SecretId=secret_name
-        )
-        
-        # Decode and return the secret
-        if 'SecretString' in response:
-            secret = json.loads(response['SecretString'])
-            response  = secret[secret_name]
-        else:
-            # Handle binary secrets
-            binary_secret = base64.b64decode(response['SecretBinary'])
-            response =  binary_secret[secret_name]
-        
-        return response    
-    
-    except ClientError as e:
-        raise e
+    return get_secret_provider(region_name).get(secret_name)
@@ -0,0 +1,540 @@
+import json
+import os
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from util import create_log
+
+logger = create_log('vector_store', os.environ.get("LOG_LEVEL"))
+
+Vector = Tuple[str, List[float], Optional[dict]]
+
+
+class VectorStore:
+    """
+    Interface shared by the vector index backends.
+
+    `upsert` takes (id, values, metadata) tuples and `query` returns an
+    object whose `matches` are dict-like with 'id', 'score' and 'metadata',
+    matching the Pinecone client.
+    """
+
+    def upsert(self, vectors: List[Vector]) -> None:
+        raise NotImplementedError
+
+    def query(self, vector: List[float], top_k: int = 5, include_metadata: bool = False) -> Any:
+        raise NotImplementedError
+
+    def delete(self, ids: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def describe_index_stats(self) -> Any:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """Persist pending writes, for backends that buffer them."""
+
+
+class PineconeStore(VectorStore):
+    """
+    VectorStore backed by a Pinecone index handle.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def upsert(self, vectors: List[Vector]) -> None:
+        self.index.upsert(vectors)
+
+    def query(self, vector: List[float], top_k: int = 5, include_metadata: bool = False) -> Any:
+        return self.index.query(vector=vector, top_k=top_k, include_metadata=include_metadata)
+
+    def delete(self, ids: Iterable[str]) -> None:
+        self.index.delete(ids=list(ids))
+
+    def describe_index_stats(self) -> Any:
+        return self.index.describe_index_stats()
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Exact in-process vector search over a memory-mapped float32 matrix.
+
+    Vectors live in `<path>/vectors.f32`, one row per id, and ids plus
+    metadata in `<path>/meta.json`. Queries score every row with a single
+    matrix-vector dot product and select the top k with argpartition, so
+    results match the 'dotproduct' metric of the Pinecone index.
+
+    Writes (`upsert`, `delete`, `flush`) hold a lock, so several threads
+    can write at once, e.g. ingestion's concurrent upserts. Queries don't
+    take it and shouldn't overlap with writes.
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, path: str, dimension: Optional[int] = None, read_only: bool = False):
+        self.path = Path(path)
+        self.read_only = read_only
+        self.dimension = dimension
+        self.ids: List[str] = []
+        self.metadata: List[Optional[dict]] = []
+        self._rows: Dict[str, int] = {}
+        self._matrix = None
+        self._dirty = False
+        # Reentrant so subclasses can hold it around the base class's writes
+        self._lock = threading.RLock()
+
+        meta_file = self.path / 'meta.json'
+        if meta_file.exists():
+            with open(meta_file, 'r') as f:
+                meta = json.load(f)
+            self.dimension = meta['dimension']
+            self.ids = meta['ids']
+            self.metadata = meta['metadata']
+            self._rows = {vector_id: row for row, vector_id in enumerate(self.ids)}
+            self._open(meta['capacity'])
+        elif not read_only:
+            self.path.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def _vector_file(self) -> Path:
+        return self.path / 'vectors.f32'
+
+    def _open(self, capacity: int) -> None:
+        mode = 'r' if self.read_only else 'r+'
+        self._matrix = np.memmap(self._vector_file, dtype=np.float32, mode=mode, shape=(capacity, self.dimension))
+
+    def _reserve(self, needed: int) -> None:
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(self.INITIAL_CAPACITY, capacity)
+        while new_capacity < needed:
+            new_capacity *= 2
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self._vector_file, 'ab') as f:
+            f.truncate(new_capacity * self.dimension * 4)
+        self._open(new_capacity)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def vectors(self) -> np.ndarray:
+        """Read-only view of the stored vectors, one row per id."""
+        if self._matrix is None:
+            return np.zeros((0, self.dimension or 0), dtype=np.float32)
+        return self._matrix[:len(self.ids)]
+
+    def upsert(self, vectors: List[Vector]) -> None:
+        if self.read_only:
+            raise PermissionError(f"Vector store at {self.path} is read-only")
+        if not vectors:
+            return
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = len(vectors[0][1])
+
+            new = sum(1 for vector_id, _, _ in vectors if vector_id not in self._rows)
+            self._reserve(len(self.ids) + new)
+            for vector_id, values, metadata in vectors:
+                row = self._rows.get(vector_id)
+                if row is None:
+                    row = len(self.ids)
+                    self._rows[vector_id] = row
+                    self.ids.append(vector_id)
+                    self.metadata.append(metadata)
+                else:
+                    self.metadata[row] = metadata
+                self._matrix[row] = values
+            self._dirty = True
+
+    def delete(self, ids: Iterable[str]) -> None:
+        if self.read_only:
+            raise PermissionError(f"Vector store at {self.path} is read-only")
+        with self._lock:
+            for vector_id in ids:
+                row = self._rows.pop(vector_id, None)
+                if row is None:
+                    continue
+                # Move the last row into the gap to keep rows contiguous
+                last = len(self.ids) - 1
+                if row != last:
+                    self._move_row(last, row)
+                self.ids.pop()
+                self.metadata.pop()
+            self._dirty = True
+
+    def _move_row(self, source: int, target: int) -> None:
+        self._matrix[target] = self._matrix[source]
+        self.ids[target] = self.ids[source]
+        self.metadata[target] = self.metadata[source]
+        self._rows[self.ids[target]] = target
+
+    def query(self, vector: List[float], top_k: int = 5, include_metadata: bool = False) -> Any:
+        query = np.asarray(vector, dtype=np.float32).reshape(-1)
+        count = len(self.ids)
+        if not count:
+            return SimpleNamespace(matches=[])
+
+        scores = self._matrix[:count] @ query
+        k = min(top_k, count)
+        top = np.argpartition(scores, count - k)[count - k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return SimpleNamespace(matches=[
+            {
+                'id': self.ids[row],
+                'score': float(scores[row]),
+                'metadata': self.metadata[row] if include_metadata else None
+            }
+            for row in top
+        ])
+
+    def describe_index_stats(self) -> Any:
+        return SimpleNamespace(total_vector_count=len(self.ids), dimension=self.dimension)
+
+    def flush(self) -> None:
+        with self._lock:
+            if self.read_only or not self._dirty:
+                return
+            if self._matrix is not None:
+                self._matrix.flush()
+            self._save_extra()
+            tmp = self.path / 'meta.json.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({
+                    'dimension': self.dimension,
+                    'capacity': 0 if self._matrix is None else self._matrix.shape[0],
+                    'ids': self.ids,
+                    'metadata': self.metadata
+                }, f)
+            tmp.replace(self.path / 'meta.json')
+            self._dirty = False
+
+    def _save_extra(self) -> None:
+        """Persist backend-specific state before the metadata file is replaced."""
+
+
+class IVFVectorStore(LocalVectorStore):
+    """
+    Approximate search over a LocalVectorStore using an IVF-flat index.
+
+    Vectors are partitioned into `nlist` lists by k-means over their
+    dot-product similarity to the list centroids. A query scores the
+    centroids, then searches only the vectors in the `nprobe` best lists.
+    New vectors are assigned to their nearest centroid as they are
+    inserted, deletes follow the underlying store, and the centroids and
+    assignments are saved to `<path>/ivf.npz` on flush.
+
+    Until the index has been trained, queries fall back to exact search.
+    `flush` trains it automatically once `auto_train_min` vectors are
+    stored; `train` can also be called directly to rebuild the lists.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        kmeans_iterations: int = 10,
+        train_size: int = 50000,
+        auto_train_min: int = 10000,
+        read_only: bool = False
+    ):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.kmeans_iterations = kmeans_iterations
+        self.train_size = train_size
+        self.auto_train_min = auto_train_min
+        self.centroids: Optional[np.ndarray] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._lists = None
+        super().__init__(path, read_only=read_only)
+
+        ivf_file = self.path / 'ivf.npz'
+        if ivf_file.exists():
+            saved = np.load(ivf_file)
+            self.centroids = saved['centroids']
+            self.nlist = len(self.centroids)
+            self._assignments = saved['assignments'].copy()
+        self._reserve_assignments()
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return (vectors @ self.centroids.T).argmax(axis=1).astype(np.int32)
+
+    def train(self, nlist: Optional[int] = None, seed: int = 0) -> None:
+        """
+        Build the centroids with k-means and assign every stored vector.
+
+        Args:
+            nlist (Optional[int]): Number of lists, defaults to 4 * sqrt(n)
+            seed (int): Seed for centroid initialisation and sampling
+        """
+        with self._lock:
+            vectors = self.vectors()
+            count = len(vectors)
+            self.nlist = nlist or self.nlist or max(1, int(4 * np.sqrt(count)))
+            if count < self.nlist:
+                raise ValueError(f"Need at least {self.nlist} vectors to train {self.nlist} lists, have {count}")
+
+            rng = np.random.default_rng(seed)
+            sample = vectors[rng.choice(count, size=min(count, self.train_size), replace=False)]
+            centroids = sample[rng.choice(len(sample), size=self.nlist, replace=False)].copy()
+            for _ in range(self.kmeans_iterations):
+                labels = (sample @ centroids.T).argmax(axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, sample)
+                counts = np.bincount(labels, minlength=self.nlist)
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+                # Re-seed empty lists from random samples
+                centroids[~filled] = sample[rng.choice(len(sample), size=int((~filled).sum()))]
+
+            self.centroids = centroids.astype(np.float32)
+            self._assignments = np.empty(count, dtype=np.int32)
+            for start in range(0, count, 65536):
+                self._assignments[start:start + 65536] = self._assign(np.asarray(vectors[start:start + 65536]))
+            self._lists = None
+            self._dirty = True
+            logger.info(f"Trained IVF index with {self.nlist} lists over {count} vectors")
+
+    def _reserve_assignments(self) -> None:
+        if len(self._assignments) < len(self.ids):
+            grown = np.zeros(max(len(self.ids), 2 * len(self._assignments)), dtype=np.int32)
+            grown[:len(self._assignments)] = self._assignments
+            self._assignments = grown
+
+    def upsert(self, vectors: List[Vector]) -> None:
+        with self._lock:
+            super().upsert(vectors)
+            self._reserve_assignments()
+            if self.trained:
+                rows = np.fromiter((self._rows[vector_id] for vector_id, _, _ in vectors), dtype=np.int64)
+                self._assignments[rows] = self._assign(np.asarray(self._matrix[rows]))
+            self._lists = None
+
+    def delete(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            super().delete(ids)
+            self._lists = None
+
+    def _move_row(self, source: int, target: int) -> None:
+        super()._move_row(source, target)
+        self._assignments[target] = self._assignments[source]
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            assignments = self._assignments[:len(self.ids)]
+            order = np.argsort(assignments, kind='stable')
+            offsets = np.searchsorted(assignments[order], np.arange(self.nlist + 1))
+            self._lists = (order, offsets)
+        return self._lists
+
+    def query(self, vector: List[float], top_k: int = 5, include_metadata: bool = False, nprobe: Optional[int] = None) -> Any:
+        if not self.trained or not self.ids:
+            return super().query(vector, top_k, include_metadata)
+
+        query = np.asarray(vector, dtype=np.float32).reshape(-1)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probes = np.argpartition(self.centroids @ query, self.nlist - nprobe)[self.nlist - nprobe:]
+        order, offsets = self._inverted_lists()
+        rows = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probes])
+        if not len(rows):
+            return SimpleNamespace(matches=[])
+
+        rows.sort()
+        scores = self._matrix[rows] @ query
+        k = min(top_k, len(rows))
+        top = np.argpartition(scores, len(rows) - k)[len(rows) - k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return SimpleNamespace(matches=[
+            {
+                'id': self.ids[rows[i]],
+                'score': float(scores[i]),
+                'metadata': self.metadata[rows[i]] if include_metadata else None
+            }
+            for i in top
+        ])
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self.read_only and not self.trained and len(self.ids) >= self.auto_train_min:
+                self.train()
+            super().flush()
+
+    def _save_extra(self) -> None:
+        if self.trained:
+            tmp = self.path / 'ivf.tmp.npz'
+            np.savez(tmp, centroids=self.centroids, assignments=self._assignments[:len(self.ids)])
+            tmp.replace(self.path / 'ivf.npz')
+
+
+class QuantizedVectorStore(LocalVectorStore):
+    """
+    Local exact store that searches compact codes and re-scores in full precision.
+
+    Alongside the float32 matrix, every vector is kept as int8 (scalar
+    quantized with a per-dimension scale) or float16 codes, which are loaded
+    into memory. A query scores all codes, keeps the best
+    `top_k * rescore_factor` candidates and re-scores only those rows
+    against the float32 vectors, which stay on disk behind the memory map.
+
+    Codes are rebuilt from the float32 vectors after writes, and saved to
+    `<path>/codes.<codec>` and `<path>/quant.npz` on flush.
+    """
+
+    CODECS = {'int8': np.int8, 'float16': np.float16}
+    BLOCK_ROWS = 1024
+
+    def __init__(self, path: str, codec: str = 'int8', rescore_factor: int = 4, read_only: bool = False):
+        if codec not in self.CODECS:
+            raise ValueError(f"Unknown codec '{codec}', expected one of {tuple(self.CODECS)}")
+        self.codec = codec
+        self.rescore_factor = rescore_factor
+        self._codes: Optional[np.ndarray] = None
+        self._scale: Optional[np.ndarray] = None
+        super().__init__(path, read_only=read_only)
+
+        quant_file = self.path / 'quant.npz'
+        if quant_file.exists():
+            saved = np.load(quant_file)
+            if str(saved['codec']) == codec and int(saved['count']) == len(self.ids):
+                self._scale = saved['scale']
+                self._codes = np.fromfile(self._code_file, dtype=self.CODECS[codec]).reshape(len(self.ids), self.dimension)
+
+    @property
+    def _code_file(self) -> Path:
+        return self.path / f'codes.{self.codec}'
+
+    def _blocks(self):
+        vectors = self.vectors()
+        for start in range(0, len(vectors), self.BLOCK_ROWS):
+            yield start, np.asarray(vectors[start:start + self.BLOCK_ROWS])
+
+    def _build_codes(self) -> None:
+        count = len(self.ids)
+        if self.codec == 'int8':
+            max_abs = np.zeros(self.dimension, dtype=np.float32)
+            for _, block in self._blocks():
+                np.maximum(max_abs, np.abs(block).max(axis=0), out=max_abs)
+            self._scale = np.where(max_abs > 0, max_abs / 127, 1).astype(np.float32)
+        else:
+            self._scale = np.ones(self.dimension, dtype=np.float32)
+
+        codes = np.empty((count, self.dimension), dtype=self.CODECS[self.codec])
+        for start, block in self._blocks():
+            if self.codec == 'int8':
+                codes[start:start + len(block)] = np.clip(np.rint(block / self._scale), -127, 127)
+            else:
+                codes[start:start + len(block)] = block
+        self._codes = codes
+
+    def upsert(self, vectors: List[Vector]) -> None:
+        with self._lock:
+            super().upsert(vectors)
+            self._codes = None
+
+    def delete(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            super().delete(ids)
+            self._codes = None
+
+    def query(self, vector: List[float], top_k: int = 5, include_metadata: bool = False) -> Any:
+        query = np.asarray(vector, dtype=np.float32).reshape(-1)
+        count = len(self.ids)
+        if not count:
+            return SimpleNamespace(matches=[])
+        if self._codes is None:
+            self._build_codes()
+
+        # Approximate scores over the codes, block by block to bound memory
+        scaled = query * self._scale
+        approx = np.empty(count, dtype=np.float32)
+        for start in range(0, count, self.BLOCK_ROWS):
+            block = self._codes[start:start + self.BLOCK_ROWS]
+            approx[start:start + len(block)] = block.astype(np.float32) @ scaled
+
+        n_candidates = min(count, top_k * self.rescore_factor)
+        candidates = np.sort(np.argpartition(approx, count - n_candidates)[count - n_candidates:])
+
+        # Re-score the candidates against the full-precision vectors
+        scores = self._matrix[candidates] @ query
+        k = min(top_k, len(candidates))
+        top = np.argpartition(scores, len(candidates) - k)[len(candidates) - k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return SimpleNamespace(matches=[
+            {
+                'id': self.ids[candidates[i]],
+                'score': float(scores[i]),
+                'metadata': self.metadata[candidates[i]] if include_metadata else None
+            }
+            for i in top
+        ])
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """
+        Bytes held in memory for search versus kept on disk for re-scoring.
+        """
+        count = len(self.ids)
+        return {
+            'codes_bytes': count * (self.dimension or 0) * np.dtype(self.CODECS[self.codec]).itemsize,
+            'full_precision_bytes': count * (self.dimension or 0) * 4
+        }
+
+    def _save_extra(self) -> None:
+        if not self.ids:
+            return
+        if self._codes is None:
+            self._build_codes()
+        self._codes.tofile(self._code_file)
+        tmp = self.path / 'quant.tmp.npz'
+        np.savez(tmp, codec=self.codec, count=len(self.ids), scale=self._scale)
+        tmp.replace(self.path / 'quant.npz')
+
+
+def vector_store_from_env(pinecone_index: Callable[[], Any], read_only: bool = False) -> VectorStore:
+    """
+    Open the vector store backend selected by the VECTOR_STORE environment variable.
+
+    VECTOR_STORE is 'pinecone' (default), 'local' for exact local search,
+    'ivf' for approximate local search or 'quantized' for search over
+    int8/float16 codes with full-precision re-scoring. Local stores live at
+    LOCAL_VECTOR_STORE_PATH; IVF_NPROBE sets the IVF search width and
+    VECTOR_CODEC / RESCORE_FACTOR configure the quantized store.
+
+    Args:
+        pinecone_index (Callable[[], Any]): Returns a Pinecone index handle, only
+            called for the Pinecone backend
+        read_only (bool): Open the local store without write access
+
+    Returns:
+        VectorStore: The selected backend
+    """
+    backend = os.environ.get('VECTOR_STORE', 'pinecone')
+    if backend == 'pinecone':
+        return PineconeStore(pinecone_index())
+    path = os.environ.get('LOCAL_VECTOR_STORE_PATH', '.local/vector_store')
+    if backend == 'local':
+        logger.info(f"Using local vector store at {path}")
+        return LocalVectorStore(path, read_only=read_only)
+    if backend == 'ivf':
+        logger.info(f"Using local IVF vector store at {path}")
+        return IVFVectorStore(path, nprobe=int(os.environ.get('IVF_NPROBE', 8)), read_only=read_only)
+    if backend == 'quantized':
+        codec = os.environ.get('VECTOR_CODEC', 'int8')
+        logger.info(f"Using local {codec} quantized vector store at {path}")
+        return QuantizedVectorStore(
+            path,
+            codec=codec,
+            rescore_factor=int(os.environ.get('RESCORE_FACTOR', 4)),
+            read_only=read_only)
+    raise ValueError(f"Unknown VECTOR_STORE backend '{backend}', expected 'pinecone', 'local', 'ivf' or 'quantized'")
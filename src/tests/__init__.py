@@ -0,0 +1,49 @@
+"""
+Unit tests, run from the repository root with
+    python -m unittest discover -s src -p "*test_*.py"
+
+Service clients are replaced by the local stand-ins in POC/fakes.py, so
+no test needs network access or API keys.
+"""
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+# EMF lines would be interleaved with the test report
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+for _path in (REPO_ROOT / 'src' / 'shared' / 'python', REPO_ROOT / 'POC'):
+    if str(_path) not in sys.path:
+        sys.path.append(str(_path))
+
+
+def load_module(name, path):
+    """
+    Import the file at `path` as a fresh module called `name`, for modules
+    whose names clash across directories (main.py, inference.py).
+    """
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_lambda_inference(index=None, embedder=None, llm=None):
+    """
+    Fresh copy of the Lambda's inference module with its service clients
+    replaced by stand-ins (zero-latency fakes unless given).
+    """
+    from fakes import FakeEmbedder, FakeGemini, FakeIndex, FakeLLM
+
+    module = load_module('lambda_inference', REPO_ROOT / 'src' / 'Inference' / 'inference.py')
+    index = index if index is not None else FakeIndex(latency=0.0)
+    embedder = embedder if embedder is not None else FakeEmbedder(latency=0.0)
+    llm = llm if llm is not None else FakeLLM(latency=0.0, chunk_latency=0.0)
+    module.clients.register('vector_store', lambda: index)
+    module.clients.register('gemini', lambda: FakeGemini(embedder))
+    for name in module.GENERATION_MODELS:
+        module.clients.register(name, lambda: llm)
+    return module
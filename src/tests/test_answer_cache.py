@@ -0,0 +1,122 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from tests import load_lambda_inference
+
+from cache import SemanticAnswerCache
+from docstore import VERSION_FILE, DocStore, content_version, index_version_from_env
+
+
+def unit(*values, dimension=8):
+    vector = np.zeros(dimension, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector.tolist()
+
+
+class SemanticAnswerCacheTest(unittest.TestCase):
+
+    def test_near_duplicate_hits_and_distant_question_misses(self):
+        cache = SemanticAnswerCache(dimension=8, max_size=4, threshold=0.95)
+        cache.store(unit(1.0, 0.0), 'first', index_version='v1')
+
+        self.assertEqual(cache.lookup(unit(1.0, 0.1), index_version='v1'), 'first')
+        self.assertIsNone(cache.lookup(unit(0.0, 1.0), index_version='v1'))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_index_version_change_drops_every_answer(self):
+        cache = SemanticAnswerCache(dimension=8, max_size=4)
+        cache.store(unit(1.0), 'stale', index_version='v1')
+
+        self.assertIsNone(cache.lookup(unit(1.0), index_version='v2'))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.index_version, 'v2')
+
+    def test_least_recently_used_answer_is_evicted(self):
+        cache = SemanticAnswerCache(dimension=8, max_size=2)
+        cache.store(unit(1.0), 'a')
+        cache.store(unit(0.0, 1.0), 'b')
+        cache.lookup(unit(1.0))
+        cache.store(unit(0.0, 0.0, 1.0), 'c')
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.lookup(unit(1.0)), 'a')
+        self.assertIsNone(cache.lookup(unit(0.0, 1.0)))
+        self.assertEqual(cache.lookup(unit(0.0, 0.0, 1.0)), 'c')
+
+    def test_storage_grows_with_the_answers(self):
+        cache = SemanticAnswerCache(dimension=8, max_size=10000)
+        self.assertEqual(cache._vectors.nbytes, 0)
+
+        rng = np.random.default_rng(0)
+        for i in range(100):
+            cache.store(rng.standard_normal(8).tolist(), str(i))
+
+        self.assertEqual(len(cache), 100)
+        self.assertEqual(len(cache._vectors), 2 * SemanticAnswerCache.INITIAL_CAPACITY)
+        self.assertEqual(len(cache._answers), len(cache._vectors))
+
+    def test_large_cache_finds_near_duplicates_through_the_sketches(self):
+        rng = np.random.default_rng(0)
+        keys = rng.standard_normal((20, 256), dtype=np.float32)[rng.integers(0, 20, 1000)]
+        keys += 0.3 * rng.standard_normal(keys.shape, dtype=np.float32)
+        cache = SemanticAnswerCache(dimension=256, max_size=1000)
+        cache.EXACT_ROWS, cache.CANDIDATES = 0, 64
+        for i, key in enumerate(keys):
+            cache.store(key, str(i))
+
+        rows = rng.integers(0, len(keys), 50)
+        questions = keys[rows] + 0.02 * rng.standard_normal((50, 256), dtype=np.float32)
+        self.assertEqual([cache.lookup(q) for q in questions], [str(row) for row in rows])
+        self.assertIsNone(cache.lookup(rng.standard_normal(256)))
+
+        cache.store(rng.standard_normal(256), 'new')
+        self.assertEqual(cache.lookup(keys[rows[-1]]), str(rows[-1]))
+
+
+class IndexVersionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = self.directory.name
+
+    def test_version_changes_with_the_text_but_not_the_order(self):
+        chunks = [('doc#1', 'alpha'), ('doc#2', 'beta')]
+        self.assertEqual(content_version(chunks), content_version(reversed(chunks)))
+        self.assertNotEqual(content_version(chunks), content_version([('doc#1', 'alpha'), ('doc#2', 'gamma')]))
+
+    def test_docstore_writes_the_version_next_to_the_texts(self):
+        chunks = [('doc#1', 'alpha'), ('doc#2', 'beta')]
+        DocStore.write(self.path, chunks)
+
+        with mock.patch.dict(os.environ, {'DOCSTORE_PATH': self.path}):
+            self.assertEqual(index_version_from_env(), content_version(chunks))
+        with open(os.path.join(self.path, VERSION_FILE)) as f:
+            self.assertEqual(f.read(), content_version(chunks))
+
+    def test_reingest_with_the_same_chunk_count_invalidates_answers(self):
+        DocStore.write(self.path, [('doc_0', 'The R.31 was built by Renard.')])
+        inference = load_lambda_inference()
+        question = {'body': json.dumps({'question': 'Who built the R.31?'})}
+        env = {'DOCSTORE_PATH': self.path, 'INDEX_VERSION': ''}
+
+        with mock.patch.dict(os.environ, env), mock.patch.object(inference, 'INDEX_VERSION_TTL', 0):
+            first = inference.get_index_version()
+            inference.lambda_handler(question, None)
+            self.assertEqual(len(inference.clients.get('answer_cache')), 1)
+
+            DocStore.write(self.path, [('doc_0', 'The R.31 was built by Renard Constructions.')])
+            self.assertNotEqual(inference.get_index_version(), first)
+            inference.lambda_handler(question, None)
+
+        self.assertEqual(inference.clients.get('answer_cache').index_version, inference._index_version['value'])
+        self.assertEqual(inference.clients.get('answer_cache').hits, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from tests import load_lambda_inference
+
+import tracing
+from fakes import FakeLLM
+
+QUESTIONS = [f'What happened to the Renard R.31 in {1930 + i}?' for i in range(6)]
+
+
+class AnswerQuestionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.inference = load_lambda_inference()
+
+    def test_worker_spans_are_recorded_on_the_request_trace(self):
+        tracer = self.inference.tracer
+        tracer.enabled = True
+        tracer.begin(request_id='batch')
+        self.inference.answer_questions(QUESTIONS)
+        with self.assertLogs(tracing.metrics_logger):
+            document = tracer.finish()
+
+        self.assertIn('vector_query_ms', document)
+        self.assertEqual(document['batch_size'], len(QUESTIONS))
+
+    def test_times_from_concurrent_workers_add_up(self):
+        trace = tracing.Trace({})
+
+        def record(_):
+            for _ in range(2000):
+                trace.add_time('vector_query', 0.001)
+
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(record, range(8)))
+
+        self.assertAlmostEqual(trace.metrics['vector_query_ms'], 8 * 2000, places=3)
+
+    def test_results_keep_the_question_order(self):
+        llm = FakeLLM(latency=0.02, jitter=0.02, chunk_latency=0.0)
+        inference = load_lambda_inference(llm=llm)
+        questions = QUESTIONS[:2] + ['', 42] + QUESTIONS[2:]
+
+        response = inference.lambda_handler({'body': json.dumps({'questions': questions})}, None)
+
+        results = json.loads(response['body'])['results']
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual([result['question'] for result in results], questions)
+        self.assertEqual(['error' in result for result in results], [False, False, True, True, False, False, False, False])
+
+    def test_oversized_batch_is_rejected(self):
+        questions = ['Why?'] * (self.inference.MAX_BATCH_QUESTIONS + 1)
+
+        response = self.inference.lambda_handler({'body': json.dumps({'questions': questions})}, None)
+
+        self.assertEqual(response['statusCode'], 413)
+        self.assertEqual(self.inference.clients.get('vector_store').calls, 0)
+
+    def test_work_past_the_deadline_stops(self):
+        llm = FakeLLM(latency=0.4, chunk_latency=0.0)
+        inference = load_lambda_inference(llm=llm)
+        inference.BATCH_GENERATION_CONCURRENCY = 2
+        # Every question logs its timeout
+        inference.logger.disabled = True
+        self.addCleanup(setattr, inference.logger, 'disabled', False)
+        started = time.monotonic()
+
+        results = inference.answer_questions(QUESTIONS, deadline=started + 0.2)
+
+        self.assertLess(time.monotonic() - started, 0.35)
+        self.assertTrue(all('error' in result for result in results))
+        # Without the deadline the slots would free at 0.4s and start two more calls
+        time.sleep(max(0.0, started + 0.7 - time.monotonic()))
+        self.assertEqual(llm.calls, 2)
+        self.assertEqual(inference.generation_policy.abandoned, 0)
+        self.assertTrue(all(breaker.state == 'closed' for breaker in inference.generation_policy.breakers.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import io
+import json
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stderr
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from tests import REPO_ROOT, load_module
+
+from fakes import FakeInferenceEndpoint
+
+cli = load_module('cli', REPO_ROOT / 'src' / 'main.py')
+
+
+class ReadQuestionsTest(unittest.TestCase):
+
+    def read(self, text, name='questions.txt'):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / name
+            path.write_text(text, encoding='utf-8')
+            return cli.read_questions(str(path))
+
+    def test_text_lines_are_numbered_questions(self):
+        items = self.read('# header\nWho built the R.31?\n\n  When did it fly?  \n')
+        self.assertEqual(items, [{'id': 2, 'question': 'Who built the R.31?'}, {'id': 4, 'question': 'When did it fly?'}])
+
+    def test_text_question_starting_with_a_quote_stays_as_written(self):
+        items = self.read('"Fly Me to the Moon" was recorded by whom?\n"Quoted"\n')
+        self.assertEqual([item['question'] for item in items], ['"Fly Me to the Moon" was recorded by whom?', '"Quoted"'])
+
+    def test_jsonl_objects_and_strings(self):
+        lines = [json.dumps({'id': 'r31', 'question': 'Who built the R.31?'}), json.dumps('When did it fly?')]
+        for name in ('questions.jsonl', 'questions.txt'):
+            with self.subTest(name=name):
+                self.assertEqual(self.read('\n'.join(lines), name), [
+                    {'id': 'r31', 'question': 'Who built the R.31?'}, {'id': 2, 'question': 'When did it fly?'}])
+
+    def test_invalid_jsonl_line_fails(self):
+        with self.assertRaises(ValueError):
+            self.read('"When did it fly?"\nWho built it?\n', 'questions.jsonl')
+
+
+class PostQuestionsTest(unittest.TestCase):
+
+    ITEMS = [{'id': i, 'question': f'Question {i}?'} for i in range(3)]
+
+    def test_questions_without_a_result_are_errors(self):
+        response = SimpleNamespace(status_code=200, json=lambda: {'results': [{'answer': 'First.'}]})
+        session = SimpleNamespace(post=lambda url, json, timeout: response)
+
+        records = cli.post_questions(session, 'http://inference', self.ITEMS)
+
+        self.assertEqual([record['id'] for record in records], [0, 1, 2])
+        self.assertEqual(records[0]['answer'], 'First.')
+        self.assertTrue(all('error' in record for record in records[1:]))
+
+    def test_read_timeouts_are_not_retried(self):
+        with FakeInferenceEndpoint(latency=0.5) as endpoint:
+            session = cli.create_session(concurrency=1, retries=2)
+            records = cli.post_questions(session, endpoint.url, self.ITEMS[:1], timeout=0.1)
+            session.close()
+
+        self.assertIn('timed out', records[0]['error'])
+        self.assertEqual(endpoint.requests, 1)
+
+    def serve_statuses(self, statuses):
+        """
+        Endpoint answering with `statuses` in turn, then 200; returns its URL and request log.
+        """
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                received.append(self.path)
+                status = statuses[len(received) - 1] if len(received) <= len(statuses) else 200
+                data = json.dumps({'answer': 'Renard.'} if status == 200 else {'error': f'{status}'}).encode()
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f'http://127.0.0.1:{server.server_port}/inference', received
+
+    def test_only_responses_sent_before_any_work_are_retried(self):
+        for status, retried in ((429, True), (503, True), (502, False), (504, False)):
+            with self.subTest(status=status):
+                url, received = self.serve_statuses([status])
+                session = cli.create_session(concurrency=1, retries=2)
+                records = cli.post_questions(session, url, self.ITEMS[:1])
+                session.close()
+
+                self.assertEqual(len(received), 2 if retried else 1)
+                self.assertEqual(records[0]['status'], 200 if retried else status)
+
+
+class ArgumentsTest(unittest.TestCase):
+
+    def test_counts_below_one_are_rejected(self):
+        for option in ('--concurrency', '--batch-size'):
+            for value in ('0', '-2'):
+                with self.subTest(option=option, value=value):
+                    argv = ['main.py', '--questions', 'questions.txt', option, value]
+                    with mock.patch('sys.argv', argv), redirect_stderr(io.StringIO()) as stderr, \
+                            self.assertRaises(SystemExit) as raised:
+                        cli.main()
+                    self.assertEqual(raised.exception.code, 2)
+                    self.assertIn('must be at least 1', stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
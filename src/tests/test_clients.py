@@ -0,0 +1,131 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+from tests import REPO_ROOT, load_lambda_inference
+
+from clients import CONNECTED, DEFERRED_SDKS, REUSED, ClientPool
+from fakes import FakeIndex
+
+
+class ClientPoolTest(unittest.TestCase):
+
+    def test_client_is_built_once_and_reused(self):
+        pool = ClientPool()
+        built = []
+        pool.register('service', lambda: built.append(object()) or built[-1])
+
+        first = pool.get('service')
+        self.assertIs(pool.get('service'), first)
+        self.assertEqual(len(built), 1)
+        self.assertEqual(pool.invocation_report(), {'service': CONNECTED})
+
+        pool.begin_invocation()
+        pool.get('service')
+        self.assertEqual(pool.invocation_report(), {'service': REUSED})
+
+    def test_failed_call_rebuilds_the_client_once(self):
+        pool = ClientPool()
+        errors = []
+        clients = iter([{'healthy': False}, {'healthy': True}])
+        pool.register('service', lambda: next(clients), on_error=errors.append)
+
+        def use(client):
+            if not client['healthy']:
+                raise ConnectionError('connection reset')
+            return 'ok'
+
+        self.assertEqual(pool.call('service', use), 'ok')
+        self.assertEqual(pool.constructions('service'), 2)
+        self.assertEqual(len(errors), 1)
+
+    def test_unregistered_client_raises(self):
+        with self.assertRaises(KeyError):
+            ClientPool().get('missing')
+
+    def test_peek_does_not_build(self):
+        pool = ClientPool()
+        pool.register('index', object)
+
+        self.assertIsNone(pool.peek('index'))
+        client = pool.get('index')
+        self.assertIs(pool.peek('index'), client)
+        self.assertEqual(pool.constructions('index'), 1)
+
+    def test_slow_build_only_blocks_callers_of_that_client(self):
+        pool = ClientPool()
+        built = []
+        release = threading.Event()
+
+        def slow():
+            release.wait(2)
+            built.append('slow')
+            return 'slow'
+
+        pool.register('slow', slow)
+        pool.register('fast', lambda: 'fast')
+        threads = [threading.Thread(target=pool.get, args=('slow',)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+
+        started = time.monotonic()
+        self.assertEqual(pool.get('fast'), 'fast')
+        self.assertLess(time.monotonic() - started, 0.5)
+
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(built, ['slow'])
+        self.assertEqual(pool.constructions('slow'), 1)
+
+
+class WarmInvocationTest(unittest.TestCase):
+
+    def test_one_construction_across_invocations(self):
+        index = FakeIndex(latency=0.0)
+        inference = load_lambda_inference(index=index)
+        built = []
+        inference.clients.register('vector_store', lambda: built.append(index) or index)
+
+        reports = []
+        for i in range(5):
+            event = {'body': json.dumps({'question': f'Which aircraft is number {i}?'})}
+            response = inference.lambda_handler(event, None)
+            self.assertEqual(response['statusCode'], 200)
+            reports.append(inference.clients.invocation_report())
+
+        self.assertEqual(len(built), 1)
+        self.assertEqual(inference.clients.constructions('vector_store'), 1)
+        self.assertEqual(inference.clients.constructions('gemini'), 1)
+        self.assertEqual(reports[0]['vector_store'], CONNECTED)
+        self.assertTrue(all(report['vector_store'] == REUSED for report in reports[1:]))
+
+
+    def test_cache_stats_are_logged_without_building_the_caches(self):
+        inference = load_lambda_inference()
+
+        self.assertEqual(inference.client_stats('answer_cache'), 'not built')
+        self.assertEqual(inference.clients.constructions('answer_cache'), 0)
+
+        inference.clients.get('answer_cache')
+        self.assertEqual(inference.client_stats('answer_cache')['size'], 0)
+
+
+class ColdStartImportTest(unittest.TestCase):
+
+    def test_handler_import_defers_numpy_and_the_sdks(self):
+        # A fresh interpreter, as sys.modules here already holds numpy
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            str(REPO_ROOT / 'src' / path) for path in ('Inference', 'shared/python')))
+        code = f'import inference, json, sys; print(json.dumps([m for m in {DEFERRED_SDKS!r} if m in sys.modules]))'
+        process = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+
+        self.assertEqual(json.loads(process.stdout), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
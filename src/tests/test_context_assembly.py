@@ -0,0 +1,120 @@
+import unittest
+
+import tests  # noqa: F401, puts the shared modules on sys.path
+
+from context_assembly import (
+    MIN_SPAN_TOKENS, SEPARATOR, Span, assemble_context, document_key, drop_redundant, estimate_tokens, merge_windows,
+    section_label
+)
+
+PARAGRAPH = (
+    'The Renard R.31 was a Belgian reconnaissance aircraft designed by Alfred Renard in the early 1930s. '
+    'It was a parasol wing monoplane with a fixed tailskid undercarriage and an open cockpit for its crew of two. '
+    'Thirty-four were built under licence by SABCA for the Belgian Air Force, which flew them until 1940.'
+)
+OTHER = (
+    'The Australian women\'s national softball team has played at every Olympic softball tournament, '
+    'winning bronze medals in 1996, 2004 and 2020.'
+)
+
+
+def windows(text, size=120, overlap=25):
+    """
+    Overlapping windows of `text`, like the ingestion chunker produces.
+    """
+    return [text[i:i + size] for i in range(0, len(text) - overlap, size - overlap)]
+
+
+def matches(texts, key='renard'):
+    return [{'id': f'{key}_{i}', 'score': 1.0 - i / 100, 'metadata': {'text': text}} for i, text in enumerate(texts)]
+
+
+class MergeWindowsTest(unittest.TestCase):
+
+    def test_consecutive_windows_rebuild_the_paragraph(self):
+        parts = windows(PARAGRAPH)
+        spans = [Span('renard', text, i / 10) for i, text in enumerate(reversed(parts))]
+
+        merged = merge_windows(spans)
+
+        self.assertEqual([span.text for span in merged], [PARAGRAPH])
+        self.assertEqual(merged[0].score, max(span.score for span in spans))
+
+    def test_other_documents_and_short_overlaps_stay_apart(self):
+        first, second = PARAGRAPH[:60], PARAGRAPH[55:120]
+        spans = [Span('renard', first, 1.0), Span('other', PARAGRAPH[40:120], 0.5), Span('renard', second, 0.9)]
+
+        self.assertEqual(len(merge_windows(spans)), 3)
+
+    def test_paragraphs_of_the_same_section_stay_apart(self):
+        label = ' - Renard R.31 Operational history'
+        first = 'The R.31 served with the Belgian Air Force until 1940.' + label
+        second = 'Operational history records show thirty-four were built by SABCA.' + label
+
+        merged = merge_windows([Span('renard', first, 0.9), Span('renard', second, 0.8)])
+
+        self.assertEqual(sorted(span.text for span in merged), [second, first])
+        self.assertEqual(section_label(first), 'Renard R.31 Operational history')
+        self.assertEqual(section_label(PARAGRAPH), '')
+
+    def test_document_keys(self):
+        self.assertEqual(document_key('renard_12'), 'renard')
+        self.assertEqual(document_key('renard_r31#ab12'), 'renard_r31')
+
+
+class DropRedundantTest(unittest.TestCase):
+
+    def test_lowercased_window_goes_after_its_paragraph(self):
+        spans = [Span('renard', PARAGRAPH, 0.9), Span('renard', PARAGRAPH[40:200].lower(), 0.8), Span('softball', OTHER, 0.5)]
+
+        self.assertEqual([span.text for span in drop_redundant(spans)], [PARAGRAPH, OTHER])
+
+    def test_covering_span_replaces_better_scored_windows(self):
+        spans = [Span('renard', PARAGRAPH[:150], 0.9), Span('softball', OTHER, 0.8), Span('renard', PARAGRAPH, 0.7)]
+
+        kept = drop_redundant(spans)
+
+        self.assertEqual([span.text for span in kept], [PARAGRAPH, OTHER])
+        self.assertEqual(kept[0].score, 0.9)
+
+    def test_threshold(self):
+        spans = [Span('renard', PARAGRAPH, 0.9), Span('renard', PARAGRAPH[:150], 0.8)]
+        self.assertEqual(len(drop_redundant(spans, threshold=1.01)), 2)
+
+
+class AssembleContextTest(unittest.TestCase):
+
+    def test_overlapping_windows_cost_fewer_tokens_than_the_raw_join(self):
+        assembled = assemble_context(matches(windows(PARAGRAPH)) + matches([OTHER], key='softball'), raw_k=10)
+
+        self.assertEqual(assembled.text, PARAGRAPH + SEPARATOR + OTHER)
+        self.assertEqual(assembled.segments, 2)
+        self.assertLess(assembled.tokens, assembled.raw_tokens)
+        self.assertEqual(assembled.merged, len(windows(PARAGRAPH)) - 1)
+
+    def test_context_fits_the_budget(self):
+        texts = [f'{PARAGRAPH} Variant {i} {"x" * i}.' for i in range(6)]
+        for budget in (MIN_SPAN_TOKENS, 100, 150, 400):
+            with self.subTest(budget=budget):
+                assembled = assemble_context(matches(texts), max_tokens=budget)
+                self.assertLessEqual(assembled.tokens, budget)
+                self.assertGreater(assembled.segments, 0)
+
+    def test_default_budget_matches_the_unassembled_context(self):
+        texts = [' '.join(f'record{i} entry{j}.' for j in range(30)) for i in range(8)]
+
+        assembled = assemble_context(matches(texts), max_tokens=None, raw_k=5)
+
+        self.assertLessEqual(assembled.tokens, assembled.raw_tokens)
+        self.assertGreater(assembled.tokens, assembled.raw_tokens - MIN_SPAN_TOKENS - estimate_tokens(SEPARATOR))
+
+    def test_span_cut_to_fill_the_budget_ends_at_a_sentence(self):
+        assembled = assemble_context(matches([PARAGRAPH]), max_tokens=60)
+
+        self.assertTrue(PARAGRAPH.startswith(assembled.text))
+        self.assertTrue(assembled.text.endswith('.'))
+        self.assertLessEqual(estimate_tokens(assembled.text), 60)
+
+
+if __name__ == '__main__':
+    unittest.main()
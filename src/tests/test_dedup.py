@@ -0,0 +1,61 @@
+import unittest
+
+import tests  # noqa: F401, puts POC on sys.path
+
+from dedup import dedup_chunks, lsh_params
+
+PARAGRAPH = (
+    'The Renard R.31 was a Belgian reconnaissance aircraft designed by Alfred Renard in the early 1930s. '
+    'It was a parasol wing monoplane with a fixed tailskid undercarriage and an open cockpit for its crew of two. '
+    'Thirty-four were built under licence by SABCA for the Belgian Air Force, which flew them until 1940.'
+)
+OTHER = (
+    'The Australian women\'s national softball team has played at every Olympic softball tournament, '
+    'winning bronze medals in 1996, 2004 and 2020 and a silver medal at the 2004 Athens games behind the United States.'
+)
+
+
+class DedupChunksTest(unittest.TestCase):
+
+    def test_exact_and_near_duplicates_are_dropped_keeping_the_first(self):
+        near = PARAGRAPH.replace('early 1930s', 'late 1920s')
+        kept, report = dedup_chunks([PARAGRAPH, OTHER, PARAGRAPH, near], containment=None)
+
+        self.assertEqual(kept, [PARAGRAPH, OTHER])
+        self.assertEqual((report['chunks'], report['kept'], report['near_duplicates']), (4, 2, 2))
+
+    def test_threshold_is_configurable(self):
+        near = PARAGRAPH.replace('early 1930s', 'late 1920s')
+        kept, _ = dedup_chunks([PARAGRAPH, near], threshold=0.99, containment=None)
+        self.assertEqual(kept, [PARAGRAPH, near])
+
+    def test_windows_inside_kept_paragraphs_are_contained(self):
+        window = PARAGRAPH[40:200].lower()
+        kept, report = dedup_chunks([PARAGRAPH, window, OTHER])
+
+        self.assertEqual(kept, [PARAGRAPH, OTHER])
+        self.assertEqual(report['contained'], 1)
+
+        kept, _ = dedup_chunks([PARAGRAPH, window, OTHER], threshold=0.99, containment=None)
+        self.assertEqual(kept, [PARAGRAPH, window, OTHER])
+
+    def test_report_counts_saved_embedding_requests(self):
+        texts = [PARAGRAPH] * 150 + [OTHER]
+        kept, report = dedup_chunks(texts, embed_batch_size=100)
+
+        self.assertEqual(len(kept), 2)
+        self.assertEqual(report['dropped'], 149)
+        self.assertEqual(report['embed_requests_saved'], 1)
+
+    def test_results_are_deterministic(self):
+        texts = [PARAGRAPH, OTHER, PARAGRAPH[:150], OTHER.upper()]
+        self.assertEqual(dedup_chunks(texts)[0], dedup_chunks(list(texts))[0])
+
+    def test_lsh_bands_put_the_s_curve_near_the_threshold(self):
+        bands, rows = lsh_params(0.8, 128)
+        self.assertEqual(bands * rows, 128)
+        self.assertAlmostEqual((1 / bands) ** (1 / rows), 0.8, delta=0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
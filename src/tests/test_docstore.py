@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from tests import load_lambda_inference
+
+from docstore import DocStore, pack_strings, unpack_strings
+from fakes import FakeS3
+
+CHUNKS = [
+    ('renard_0', 'The Renard R.31 was a Belgian reconnaissance aircraft.'),
+    ('renard_1', ''),
+    ('softball_0', 'Les Australiennes ont gagné le bronze en 1996 — 🥉.'),
+]
+
+
+class PackStringsTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        strings = [text for _, text in CHUNKS] + ['日本語', '']
+        blob, offsets = pack_strings(strings)
+
+        self.assertEqual(unpack_strings(blob, offsets), strings)
+        self.assertEqual(len(offsets), len(strings) + 1)
+        self.assertEqual(int(offsets[-1]), len(blob))
+
+    def test_no_strings(self):
+        blob, offsets = pack_strings([])
+        self.assertEqual(unpack_strings(blob, offsets), [])
+
+
+class DocStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+
+    def open(self, chunks):
+        DocStore.write(self.path, chunks)
+        store = DocStore(self.path)
+        self.addCleanup(store.close)
+        return store
+
+    def test_texts_are_read_back_by_id(self):
+        store = self.open(CHUNKS)
+
+        self.assertEqual(len(store), 3)
+        for vector_id, text in CHUNKS:
+            self.assertEqual(store.get(vector_id), text)
+        self.assertEqual(store.get_many(vector_id for vector_id, _ in CHUNKS), dict(CHUNKS))
+
+    def test_missing_ids(self):
+        store = self.open(CHUNKS)
+
+        self.assertIsNone(store.get('renard_9'))
+        self.assertNotIn('renard_9', store)
+        self.assertEqual(store.get_many(['renard_9', 'renard_0']), {'renard_0': CHUNKS[0][1]})
+
+    def test_empty_store(self):
+        store = self.open([])
+
+        self.assertEqual(len(store), 0)
+        self.assertIsNone(store.get('renard_0'))
+        self.assertEqual(store.get_many(['renard_0']), {})
+
+    def test_rewrite_replaces_the_store(self):
+        DocStore.write(self.path, CHUNKS)
+        store = self.open([('renard_0', 'Replaced.')])
+
+        self.assertEqual(store.get('renard_0'), 'Replaced.')
+        self.assertIsNone(store.get('softball_0'))
+
+
+class ResolveTextsTest(unittest.TestCase):
+
+    def test_ids_missing_from_the_docstore_are_dropped(self):
+        inference = load_lambda_inference()
+        with tempfile.TemporaryDirectory() as directory:
+            DocStore.write(directory, CHUNKS)
+            store = DocStore(directory)
+            matches = [{'id': 'softball_0', 'score': 0.9, 'metadata': None},
+                       {'id': 'gone_0', 'score': 0.8, 'metadata': None},
+                       {'id': 'renard_0', 'score': 0.7, 'metadata': None}]
+
+            with self.assertLogs(inference.logger, 'WARNING'):
+                resolved = inference.resolve_texts(matches, store)
+            store.close()
+
+        self.assertEqual([m['id'] for m in resolved], ['softball_0', 'renard_0'])
+        self.assertEqual(resolved[0]['metadata'], {'text': CHUNKS[2][1]})
+
+
+
+class S3DocStoreTest(unittest.TestCase):
+
+    def test_reingested_store_is_downloaded_again(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        s3 = FakeS3(directory.name, latency=0.0)
+        DocStore.write(s3.path('s3://bucket/docstore'), CHUNKS)
+        env = {'DOCSTORE_PATH': 's3://bucket/docstore', 'DOCSTORE_CACHE': os.path.join(directory.name, 'local'),
+               'INDEX_VERSION': '', 'INDEX_VERSION_PATH': ''}
+        inference = load_lambda_inference()
+
+        with mock.patch.dict(os.environ, env), mock.patch.object(inference, 'INDEX_VERSION_TTL', 0), s3.patch():
+            self.assertIsNone(inference.clients.get('docstore').get('zeppelin_0'))
+            self.assertEqual(s3.downloads, 3)
+
+            # The same version keeps the local copy when the store is reopened
+            inference.clients.invalidate('docstore')
+            inference.clients.get('docstore')
+            self.assertEqual(s3.downloads, 3)
+
+            DocStore.write(s3.path('s3://bucket/docstore'), CHUNKS + [('zeppelin_0', 'The LZ 129 was a German airship.')])
+            inference.get_index_version()
+            store = inference.clients.get('docstore')
+
+        self.assertEqual(store.get('zeppelin_0'), 'The LZ 129 was a German airship.')
+        self.assertEqual(store.get('renard_0'), CHUNKS[0][1])
+        self.assertEqual(s3.downloads, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+import tests  # noqa: F401, puts POC and the shared modules on sys.path
+
+from cache import DiskCache, EmbeddingCache, LRUCache, embedding_key
+from fakes import FakeEmbedder, FakeIndex
+
+
+def vector(seed, dimension=8):
+    return np.random.default_rng(seed).standard_normal(dimension).astype(np.float32).tolist()
+
+
+class DiskCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, 'cache.sqlite')
+
+    def test_bulk_lookup_returns_only_the_stored_keys(self):
+        cache = DiskCache(self.path)
+        cache.put_many([('a', vector(1)), ('b', vector(2))])
+
+        found = cache.get_many(['a', 'missing', 'b', 'a'])
+
+        self.assertEqual(set(found), {'a', 'b'})
+        self.assertEqual(found['a'], vector(1))
+        self.assertEqual(cache.stats(), {'hits': 3, 'misses': 1, 'evictions': 0})
+
+    def test_concurrent_writers_share_one_file(self):
+        cache = DiskCache(self.path)
+        errors = []
+
+        def write(worker):
+            try:
+                for i in range(20):
+                    cache.put_many([(f'{worker}-{i}-{j}', vector(worker * 1000 + i * 10 + j)) for j in range(5)])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(worker,)) for worker in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(DiskCache(self.path).usage()['entries'], 8 * 20 * 5)
+        self.assertEqual(DiskCache(self.path).get('7-19-4'), vector(7 * 1000 + 19 * 10 + 4))
+
+    def test_least_recently_used_entries_are_evicted_past_max_bytes(self):
+        entry_bytes = 8 * 4
+        cache = DiskCache(self.path, max_bytes=3 * entry_bytes)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, vector(ord(key)))
+        cache.get('a')
+        cache.put('d', vector(ord('d')))
+
+        self.assertEqual(set(cache.get_many(['a', 'b', 'c', 'd'])), {'a', 'c', 'd'})
+        self.assertEqual(cache.evictions, 1)
+        self.assertLessEqual(cache.usage()['bytes'], 3 * entry_bytes)
+
+    def test_export_and_import_keep_existing_entries(self):
+        source = DiskCache(self.path)
+        source.put_many([('a', vector(1)), ('b', vector(2))])
+        exported = os.path.join(self.directory, 'export.sqlite')
+        source.export_to(exported)
+
+        target = DiskCache(os.path.join(self.directory, 'target.sqlite'))
+        target.put('a', vector(99))
+        added = target.import_from(exported)
+
+        self.assertEqual(added, 1)
+        self.assertEqual(target.get('a'), vector(99))
+        self.assertEqual(target.get('b'), vector(2))
+
+
+class TieredCacheTest(unittest.TestCase):
+
+    def test_lru_evicts_the_least_recently_used_key(self):
+        cache = LRUCache(max_size=2, ttl=None)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_shared_hits_are_promoted_to_the_local_tier(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shared = DiskCache(os.path.join(directory, 'cache.sqlite'))
+            shared.put(embedding_key('What is the R.31?', 'model'), vector(1))
+            cache = EmbeddingCache(LRUCache(), shared)
+
+            self.assertEqual(cache.get('what is  the R.31?', 'model'), vector(1))
+            self.assertEqual(len(cache.local), 1)
+            calls = []
+            cache.get_or_embed('What is the R.31?', 'model', None, lambda: calls.append(1))
+            self.assertEqual(calls, [])
+            shared.close()
+
+
+class IngestionCacheTest(unittest.TestCase):
+
+    def test_cached_chunks_skip_the_embedding_call(self):
+        from docs_to_embeddings import upload_embeddings
+
+        docs = [f'Chunk number {i} about the Renard R.31.' for i in range(30)]
+        with tempfile.TemporaryDirectory() as directory:
+            cache = DiskCache(os.path.join(directory, 'cache.sqlite'))
+            embedder = FakeEmbedder(latency=0.0)
+            with contextlib.redirect_stdout(io.StringIO()):
+                first = upload_embeddings(docs, 'renard', index=FakeIndex(latency=0.0), embed=embedder,
+                                          cache=cache, embed_batch_size=10)
+                index = FakeIndex(latency=0.0)
+                second = upload_embeddings(docs + ['A new chunk.'], 'renard', index=index, embed=embedder,
+                                           cache=cache, embed_batch_size=10)
+            cache.close()
+
+        self.assertEqual((first['embed_requests'], first['cache_hits']), (3, 0))
+        self.assertEqual((second['embed_requests'], second['cache_hits']), (1, 30))
+        self.assertEqual(embedder.texts, 31)
+        self.assertEqual(len(index.vectors), 31)
+
+
+if __name__ == '__main__':
+    unittest.main()
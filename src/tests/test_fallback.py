@@ -0,0 +1,198 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import tests  # noqa: F401, puts the shared modules on sys.path
+
+from fakes import FakeLLM
+from fallback import HEDGED, RACE, SEQUENTIAL, CircuitBreaker, FallbackPolicy
+
+PROMPT = 'Context: The Renard R.31 was a Belgian reconnaissance aircraft.\n\nQuestion: What was the R.31?'
+
+
+def models(**latencies):
+    """
+    FakeLLMs by name; a latency of None makes the model fail every call.
+    """
+    return {
+        name: FakeLLM(latency=0.0, failure_rate=1.0, chunk_latency=0.0) if latency is None
+        else FakeLLM(latency=latency, chunk_latency=0.0)
+        for name, latency in latencies.items()
+    }
+
+
+def policy_for(llms, **kwargs):
+    return FallbackPolicy(list(llms), llms.__getitem__, **kwargs)
+
+
+def events(result):
+    return [(d['model'], d['event']) for d in result.decisions]
+
+
+class CutOffLLM:
+    """
+    Streams one chunk, then fails.
+    """
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        yield SimpleNamespace(text='The R.31 ')
+        raise ConnectionError('stream reset')
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_half_open_lets_one_trial_through(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+
+        barrier = threading.Barrier(8)
+
+        def allow(_):
+            barrier.wait()
+            return breaker.allow()
+
+        with ThreadPoolExecutor(8) as executor:
+            self.assertEqual(sum(executor.map(allow, range(8))), 1)
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+        self.assertTrue(breaker.allow())
+
+    def test_unfinished_trial_is_given_up(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+
+        breaker.release()
+        self.assertTrue(breaker.allow())
+
+
+class FallbackPolicyTest(unittest.TestCase):
+
+    def test_sequential_falls_back_after_a_failure(self):
+        llms = models(broken=None, primary=0.0, spare=0.0)
+        result = policy_for(llms, mode=SEQUENTIAL).generate(PROMPT)
+
+        self.assertEqual(result.model, 'primary')
+        self.assertIn('Renard', result.text)
+        self.assertEqual(events(result), [
+            ('broken', 'start'), ('broken', 'error'), ('primary', 'start'), ('primary', 'win')])
+        self.assertEqual(llms['spare'].calls, 0)
+
+    def test_hedge_starts_the_next_model_when_the_first_is_slow(self):
+        llms = models(slow=0.5, fast=0.01)
+        started = time.monotonic()
+        result = policy_for(llms, mode=HEDGED, hedge_delay=0.05).generate(PROMPT)
+
+        self.assertLess(time.monotonic() - started, 0.3)
+        self.assertEqual(result.model, 'fast')
+        self.assertIn(('fast', 'hedge'), events(result))
+        self.assertIn(('slow', 'abandon'), events(result))
+
+    def test_race_takes_the_first_answer(self):
+        llms = models(slow=0.3, fast=0.01)
+        result = policy_for(llms, mode=RACE).generate(PROMPT)
+
+        self.assertEqual(result.model, 'fast')
+        self.assertEqual([e for e in events(result) if e[1] == 'start'], [('slow', 'start'), ('fast', 'start')])
+
+    def test_breaker_opens_after_repeated_failures(self):
+        llms = models(broken=None, primary=0.0)
+        policy = policy_for(llms, mode=SEQUENTIAL, failure_threshold=2, reset_timeout=60)
+        errors = []
+        policy.on_error = lambda name, error: errors.append(name)
+
+        for _ in range(3):
+            result = policy.generate(PROMPT)
+
+        self.assertEqual(policy.breakers['broken'].state, 'open')
+        self.assertEqual(llms['broken'].calls, 2)
+        self.assertEqual(errors, ['broken', 'broken'])
+        self.assertEqual(events(result)[0], ('broken', 'skip'))
+
+    def test_every_model_failing_raises_the_last_error(self):
+        with self.assertRaises(RuntimeError):
+            policy_for(models(first=None, second=None), mode=SEQUENTIAL).generate(PROMPT)
+
+    def test_models_not_started_give_back_their_trial(self):
+        llms = models(primary=0.0, spare=0.0)
+        policy = policy_for(llms, mode=SEQUENTIAL, failure_threshold=1, reset_timeout=0.05)
+        policy.breakers['spare'].record_failure()
+        time.sleep(0.06)
+
+        self.assertEqual(policy.generate(PROMPT).model, 'primary')
+        self.assertTrue(policy.breakers['spare'].allow())
+
+    def test_stream_failing_after_the_first_chunk_counts_against_the_model(self):
+        errors = []
+        policy = FallbackPolicy(['cut'], lambda name: CutOffLLM(), failure_threshold=1,
+                                on_error=lambda name, error: errors.append(name))
+        decisions = []
+        chunks = []
+
+        with self.assertRaises(ConnectionError):
+            for chunk in policy.stream(PROMPT, decisions):
+                chunks.append(chunk)
+
+        self.assertEqual(chunks, ['The R.31 '])
+        self.assertEqual(errors, ['cut'])
+        self.assertEqual(policy.breakers['cut'].state, 'open')
+        self.assertEqual([d['event'] for d in decisions], ['start', 'first_chunk', 'error'])
+
+
+class AbandonedCallTest(unittest.TestCase):
+
+    def test_race_losers_do_not_starve_later_calls(self):
+        llms = models(slow_a=0.5, slow_b=0.5, fast=0.02)
+        policy = policy_for(llms, mode=RACE, max_abandoned=100)
+
+        started = time.monotonic()
+        for _ in range(10):
+            self.assertEqual(policy.generate(PROMPT).model, 'fast')
+
+        self.assertLess(time.monotonic() - started, 0.45)
+        self.assertEqual(policy.abandoned, 20)
+
+    def test_abandoned_calls_are_bounded(self):
+        llms = models(slow_a=0.2, slow_b=0.2, fast=0.01)
+        policy = policy_for(llms, mode=RACE, max_abandoned=2)
+
+        self.assertEqual(policy.generate(PROMPT).model, 'fast')
+        self.assertEqual(policy.abandoned, 2)
+        result = policy.generate(PROMPT)
+        self.assertEqual([e for e in events(result) if e[1] == 'start'], [('slow_a', 'start')])
+
+        time.sleep(0.25)
+        self.assertEqual(policy.abandoned, 0)
+
+    def test_calls_running_at_the_deadline_end_with_it(self):
+        llms = models(slow=1.0, spare=1.0)
+        policy = policy_for(llms, mode=HEDGED, hedge_delay=0.05, failure_threshold=1)
+
+        started = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            policy.generate(PROMPT, deadline=started + 0.15)
+
+        self.assertLess(time.monotonic() - started, 0.3)
+        time.sleep(0.1)
+        self.assertEqual(policy.abandoned, 0)
+        self.assertEqual([policy.breakers[name].state for name in llms], ['closed', 'closed'])
+
+    def test_no_model_starts_after_the_deadline(self):
+        llms = models(primary=0.0)
+        with self.assertRaises(TimeoutError):
+            policy_for(llms).generate(PROMPT, deadline=time.monotonic())
+        self.assertEqual(llms['primary'].calls, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+import tests  # noqa: F401, puts POC and the shared modules on sys.path
+
+from fakes import FakeEmbedder, FakeIndex
+
+import docs_to_embeddings
+from docs_to_embeddings import chunk_id, failed_ids, sync_embeddings, upload_embeddings
+
+DOCS = [
+    'The Renard R.31 was a Belgian reconnaissance aircraft.',
+    'It first flew in 1932.',
+    'Thirty-four were built for the Belgian Air Force.',
+]
+
+
+class IncrementalSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = FakeIndex(latency=0.0)
+        self.embedder = FakeEmbedder(latency=0.0)
+        self.manifest = {'chunks': {}}
+
+    def sync(self, docs, key='renard'):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return sync_embeddings(docs, key, self.manifest, index=self.index, embed=self.embedder)
+
+    def test_first_run_embeds_every_chunk(self):
+        stats = self.sync(DOCS)
+
+        self.assertEqual(stats['added'], 3)
+        self.assertEqual(self.embedder.texts, 3)
+        self.assertEqual(set(self.index.vectors), {chunk_id('renard', doc) for doc in DOCS})
+        self.assertEqual(set(self.manifest['chunks']), set(self.index.vectors))
+
+    def test_unchanged_corpus_makes_no_embedding_calls(self):
+        self.sync(DOCS)
+        calls, upserts = self.embedder.calls, self.index.calls
+
+        stats = self.sync(DOCS)
+
+        self.assertEqual(self.embedder.calls, calls)
+        self.assertEqual(self.index.calls, upserts)
+        self.assertEqual(stats, {'added': 0, 'deleted': 0, 'unchanged': 3, 'upload': None})
+
+    def test_only_changed_chunks_are_embedded(self):
+        self.sync(DOCS)
+        texts = self.embedder.texts
+        changed = DOCS[:1] + ['It first flew in 1931.'] + DOCS[2:]
+
+        stats = self.sync(changed)
+
+        self.assertEqual(self.embedder.texts - texts, 1)
+        self.assertEqual((stats['added'], stats['deleted'], stats['unchanged']), (1, 1, 2))
+        self.assertEqual(set(self.index.vectors), {chunk_id('renard', doc) for doc in changed})
+
+    def test_removed_chunks_and_documents_are_deleted(self):
+        self.sync(DOCS)
+        self.sync(['Softball was played at the 2020 Summer Olympics.'], key='softball')
+
+        self.sync(DOCS[:2])
+        self.assertNotIn(chunk_id('renard', DOCS[2]), self.index.vectors)
+        self.assertNotIn(chunk_id('renard', DOCS[2]), self.manifest['chunks'])
+
+        self.sync([], key='softball')
+        self.assertEqual(set(self.index.vectors), {chunk_id('renard', doc) for doc in DOCS[:2]})
+        self.assertEqual({entry['document'] for entry in self.manifest['chunks'].values()}, {'renard'})
+
+    def test_model_change_re_embeds_everything(self):
+        self.sync(DOCS)
+        texts = self.embedder.texts
+        for entry in self.manifest['chunks'].values():
+            entry['model'] = 'models/embedding-001'
+
+        self.sync(DOCS)
+
+        self.assertEqual(self.embedder.texts - texts, 3)
+        self.assertTrue(all(entry['model'] == docs_to_embeddings.EMBEDDING_MODEL
+                            for entry in self.manifest['chunks'].values()))
+
+    def test_failed_chunks_stay_out_of_the_manifest(self):
+        self.embedder.failure_rate = 1.0
+        with mock.patch.object(docs_to_embeddings, 'MAX_ATTEMPTS', 1):
+            stats = self.sync(DOCS, key='renard')
+
+        self.assertEqual(stats['added'], 0)
+        self.assertEqual(self.manifest['chunks'], {})
+
+    def test_failed_ids_name_the_chunks_left_out_of_a_full_upload(self):
+        self.embedder.failure_rate = 1.0
+        with mock.patch.object(docs_to_embeddings, 'MAX_ATTEMPTS', 1), contextlib.redirect_stdout(io.StringIO()):
+            stats = upload_embeddings(DOCS, 'renard', index=self.index, embed=self.embedder, embed_batch_size=2)
+
+        self.assertEqual(failed_ids(stats), {f'renard_{i}' for i in range(len(DOCS))})
+        self.assertEqual(stats['upserted'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
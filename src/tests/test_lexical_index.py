@@ -0,0 +1,143 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from tests import load_lambda_inference
+
+from fakes import FakeEmbedder, FakeS3
+from lexical_index import RRF_K, BM25Index, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    'The Renard R.31 was a Belgian reconnaissance aircraft designed by Alfred Renard.',
+    'The Boeing B-17 Flying Fortress was a four-engined heavy bomber.',
+    'Belgian aircraft of the 1930s included the Renard R.31 and the Fairey Fox.',
+    'Softball was played at the Olympics from 1996 to 2008 and again in 2020.',
+]
+IDS = [f'chunk-{i}' for i in range(len(TEXTS))]
+
+
+def match(chunk_id, text):
+    return {'id': chunk_id, 'score': 1.0, 'metadata': {'text': text}}
+
+
+class TokenizeTest(unittest.TestCase):
+
+    def test_compound_tokens_are_indexed_with_their_parts(self):
+        self.assertEqual(tokenize('What is the R.31 and the B-17?'), ['r.31', '31', 'b-17', '17'])
+
+
+class BM25IndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = BM25Index.build(IDS, TEXTS)
+
+    def test_rare_terms_rank_their_chunk_first(self):
+        result = self.index.query('Who designed the Renard R.31?', top_k=3)
+
+        self.assertEqual([m['id'] for m in result.matches][:2], ['chunk-0', 'chunk-2'])
+        self.assertEqual(result.matches[0]['metadata'], {'text': TEXTS[0]})
+        self.assertGreater(result.margin, 1.0)
+
+    def test_unknown_terms_match_nothing(self):
+        result = self.index.query('zeppelin')
+        self.assertEqual((result.matches, result.confidence, result.margin), ([], 0.0, 0.0))
+
+    def test_single_match_is_confident(self):
+        result = self.index.query('Flying Fortress bomber')
+
+        self.assertEqual([m['id'] for m in result.matches], ['chunk-1'])
+        self.assertEqual(result.margin, float('inf'))
+        self.assertGreater(result.confidence, 0.6)
+
+    def test_saved_index_answers_the_same(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'lexical.npz'
+            self.index.save(path)
+            loaded = BM25Index.load(path)
+
+        question = 'Belgian aircraft of the 1930s'
+        self.assertEqual(loaded.query(question).matches, self.index.query(question).matches)
+        self.assertEqual(loaded.ids, IDS)
+
+
+class ReciprocalRankFusionTest(unittest.TestCase):
+
+    def test_matches_in_both_rankings_come_first(self):
+        lexical = [match('a', 'alpha'), match('b', 'beta')]
+        vector = [match('c', 'gamma'), match('vector-b', 'beta')]
+
+        fused = reciprocal_rank_fusion([lexical, vector], top_k=3)
+
+        self.assertEqual([m['id'] for m in fused], ['b', 'a', 'c'])
+        self.assertAlmostEqual(fused[0]['score'], 2 / (RRF_K + 2))
+        self.assertAlmostEqual(fused[1]['score'], 1 / (RRF_K + 1))
+
+    def test_top_k_limits_the_result(self):
+        ranking = [match(str(i), str(i)) for i in range(10)]
+        self.assertEqual(len(reciprocal_rank_fusion([ranking], top_k=4)), 4)
+
+
+class LexicalFastPathTest(unittest.TestCase):
+
+    def setUp(self):
+        self.embedder = FakeEmbedder(latency=0.0)
+        self.inference = load_lambda_inference(embedder=self.embedder)
+        index = BM25Index.build(IDS, TEXTS)
+        self.inference.clients.register('lexical_index', lambda: index)
+        self.inference.RETRIEVAL_MODE = 'hybrid'
+
+    def test_thresholds(self):
+        confident = self.inference.lexical_is_confident
+        result = SimpleNamespace(matches=[match('a', 'alpha')], confidence=0.7, margin=2.0)
+        self.assertTrue(confident(result))
+        self.assertFalse(confident(SimpleNamespace(matches=result.matches, confidence=0.5, margin=2.0)))
+        self.assertFalse(confident(SimpleNamespace(matches=result.matches, confidence=0.7, margin=1.2)))
+        self.assertFalse(confident(SimpleNamespace(matches=[], confidence=0.7, margin=2.0)))
+
+        self.inference.LEXICAL_FAST_PATH_CONFIDENCE = 0
+        self.assertFalse(confident(result))
+
+    def test_confident_questions_skip_the_embedding(self):
+        self.assertTrue(self.inference.answer_question('Flying Fortress bomber'))
+        self.assertEqual(self.embedder.texts, 0)
+
+        self.assertTrue(self.inference.answer_question('Which aircraft were Belgian?'))
+        self.assertEqual(self.embedder.texts, 1)
+
+
+class S3LexicalIndexTest(unittest.TestCase):
+
+    def test_reingested_index_is_downloaded_again(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        s3 = FakeS3(directory.name, latency=0.0)
+        s3.path('s3://bucket/lexical.npz').parent.mkdir(parents=True)
+        version = Path(directory.name) / 'version'
+
+        def ingest(ids, texts, name):
+            BM25Index.build(ids, texts).save(s3.path('s3://bucket/lexical.npz'))
+            version.write_text(name)
+
+        ingest(IDS, TEXTS, 'v1')
+        env = {'LEXICAL_INDEX_PATH': 's3://bucket/lexical.npz', 'INDEX_VERSION_PATH': str(version),
+               'LEXICAL_INDEX_CACHE': os.path.join(directory.name, 'local', 'lexical.npz'), 'INDEX_VERSION': ''}
+        inference = load_lambda_inference()
+        inference.RETRIEVAL_MODE = 'hybrid'
+
+        with mock.patch.dict(os.environ, env), mock.patch.object(inference, 'INDEX_VERSION_TTL', 0), s3.patch():
+            self.assertEqual(inference.retrieval_mode(), 'hybrid')
+            self.assertEqual(inference.lexical_search('zeppelin airship').matches, [])
+
+            ingest(IDS + ['chunk-4'], TEXTS + ['The LZ 129 Hindenburg was a German zeppelin airship.'], 'v2')
+            inference.retrieval_mode()
+            matches = inference.lexical_search('zeppelin airship').matches
+
+        self.assertEqual([m['id'] for m in matches], ['chunk-4'])
+        self.assertEqual(s3.downloads, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
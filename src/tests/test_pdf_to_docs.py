@@ -0,0 +1,65 @@
+import json
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+import tests  # noqa: F401, puts POC on sys.path
+
+from pdf_to_docs import chunk_text, iter_chunks, write_docs
+
+FIXTURES = Path(__file__).resolve().parent / 'fixtures'
+SUFFIXES = ('_check1.md', '_check2.md', '.json', '.txt')
+
+
+class WriteDocsGoldenTest(unittest.TestCase):
+    """
+    `sections.golden.json` holds write_docs' outputs for `sections.md` from
+    the implementation before the cleaning pipeline was rebuilt; every
+    output must stay byte-identical.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.markdown = (FIXTURES / 'sections.md').read_text(encoding='utf-8')
+        cls.golden = json.loads((FIXTURES / 'sections.golden.json').read_text(encoding='utf-8'))
+
+    def check(self, break_on_ref):
+        with tempfile.TemporaryDirectory() as directory:
+            outfile = str(Path(directory) / 'docs')
+            write_docs(self.markdown, outfile, break_on_ref=break_on_ref)
+            for suffix in SUFFIXES:
+                with self.subTest(suffix=suffix):
+                    written = Path(outfile + suffix).read_bytes()
+                    self.assertEqual(written, self.golden[f'break_on_ref={break_on_ref}/{suffix}'].encode())
+
+    def test_breaking_on_references(self):
+        self.check(True)
+
+    def test_keeping_references(self):
+        self.check(False)
+
+    def test_document_without_headers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            outfile = str(Path(directory) / 'docs')
+            write_docs('Just one short line.', outfile)
+            # With no title, the preamble is held back until the end
+            self.assertEqual(json.loads(Path(outfile + '.json').read_text()), [
+                'Just one short line. -  preamble', ' preamble just one short line.', 'just one short line.'])
+            self.assertEqual(Path(outfile + '.txt').read_text(), 'Just one short line. -  preamble')
+
+
+class IterChunksTest(unittest.TestCase):
+
+    def test_matches_chunking_the_joined_text(self):
+        rng = random.Random(0)
+        words = ['alpha', 'beta.', 'gamma', 'delta', 'x' * 40, 'end.']
+        for _ in range(200):
+            pieces = [' '.join(rng.choice(words) for _ in range(rng.randrange(0, 30))) for _ in range(rng.randrange(0, 8))]
+            max_size = rng.choice([20, 50, 300])
+            overlap = rng.choice([0, 5, 19])
+            self.assertEqual(list(iter_chunks(pieces, max_size, overlap)), chunk_text(''.join(pieces), max_size, overlap))
+
+
+if __name__ == '__main__':
+    unittest.main()
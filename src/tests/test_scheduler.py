@@ -0,0 +1,82 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+import tests  # noqa: F401, puts POC on sys.path
+
+from fakes import FakeService, QuotaExceeded
+from scheduler import Scheduler, TokenBucket, is_rate_limited, retry_after
+
+
+def scheduler_for(bucket, concurrency=8):
+    return Scheduler({'service': bucket}, {'service': concurrency}, progress_interval=None)
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_calls_stay_within_the_quota(self):
+        service = FakeService(latency=0.0, quota=10, period=0.5)
+        scheduler = scheduler_for(TokenBucket(10, period=0.5, burst=2))
+
+        results = scheduler.map('service', lambda _: service._call(), range(20))
+
+        self.assertEqual(results, [None] * 20)
+        self.assertEqual(service.rejected, 0)
+        self.assertEqual(scheduler.rate_limited, 0)
+        self.assertLessEqual(service.peak_window, 10)
+
+    def test_rate_limited_calls_throttle_and_retry(self):
+        service = FakeService(latency=0.0, quota=10, period=0.5)
+        bucket = TokenBucket(100, period=0.5, burst=10)
+        scheduler = scheduler_for(bucket)
+
+        results = scheduler.map('service', lambda _: service._call(), range(25))
+
+        self.assertEqual(results, [None] * 25)
+        self.assertGreater(scheduler.rate_limited, 0)
+        self.assertEqual(scheduler.rate_limited, service.rejected)
+        self.assertLess(bucket.rate, bucket.max_rate)
+        self.assertLessEqual(service.peak_window, 10)
+
+    def test_costs_count_against_the_quota(self):
+        service = FakeService(latency=0.0, quota=12, period=0.5)
+        scheduler = scheduler_for(TokenBucket(12, period=0.5, burst=4))
+
+        results = scheduler.map('service', service._call, [4] * 5, cost=4)
+
+        self.assertEqual(results, [None] * 5)
+        self.assertEqual(service.rejected, 0)
+
+    def test_burst_must_fit_the_quota_and_the_cost(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(5, burst=5)
+        with self.assertRaises(ValueError):
+            asyncio.run(TokenBucket(10, burst=2).acquire(3))
+
+    def test_other_errors_are_retried_then_raised(self):
+        service = FakeService(latency=0.0, failure_rate=1.0)
+        scheduler = Scheduler(max_attempts=1, progress_interval=None)
+
+        results = scheduler.map('service', lambda _: service._call(), range(2))
+
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertEqual(service.calls, 2)
+
+
+class RateLimitDetectionTest(unittest.TestCase):
+
+    def test_quota_errors_are_recognised(self):
+        error = QuotaExceeded(0.25)
+        self.assertTrue(is_rate_limited(error))
+        self.assertEqual(retry_after(error), 0.25)
+        self.assertFalse(is_rate_limited(RuntimeError('boom')))
+
+    def test_retry_after_header(self):
+        error = Exception()
+        error.response = SimpleNamespace(headers={'Retry-After': '3'})
+        self.assertEqual(retry_after(error), 3.0)
+        self.assertIsNone(retry_after(RuntimeError('boom')))
+
+
+if __name__ == '__main__':
+    unittest.main()
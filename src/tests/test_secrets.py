@@ -0,0 +1,197 @@
+import json
+import unittest
+from unittest import mock
+
+from tests import load_lambda_inference
+
+from botocore.exceptions import ClientError
+
+from fakes import FakeGemini, FakeLLM
+from util import SecretProvider
+
+
+class StandInSecretsManager:
+    """
+    Secrets Manager client stand-in answering BatchGetSecretValue from a
+    dict, `page_size` secrets per response.
+    """
+
+    def __init__(self, values, page_size=20):
+        self.values = dict(values)
+        self.page_size = page_size
+        self.requests = []
+
+    def batch_get_secret_value(self, SecretIdList, NextToken=None):
+        self.requests.append(list(SecretIdList))
+        start = int(NextToken or 0)
+        page = SecretIdList[start:start + self.page_size]
+        response = {
+            'SecretValues': [
+                {'Name': name, 'SecretString': json.dumps({name: self.values[name]})}
+                for name in page if name in self.values
+            ],
+            'Errors': [
+                {'SecretId': name, 'ErrorCode': 'ResourceNotFoundException', 'Message': 'not found'}
+                for name in page if name not in self.values
+            ]
+        }
+        if start + self.page_size < len(SecretIdList):
+            response['NextToken'] = str(start + self.page_size)
+        return response
+
+
+class AuthError(Exception):
+    code = 401
+
+
+def provider_with(values, names=('PINECONE_DEV_KEY', 'GEMINI_DEV_KEY'), **kwargs):
+    provider = SecretProvider(names, **kwargs)
+    provider._client = StandInSecretsManager(values)
+    return provider
+
+
+class SecretProviderTest(unittest.TestCase):
+
+    def test_known_secrets_are_fetched_together_once(self):
+        provider = provider_with({'PINECONE_DEV_KEY': 'p1', 'GEMINI_DEV_KEY': 'g1'})
+
+        self.assertEqual(provider.get('GEMINI_DEV_KEY'), 'g1')
+        self.assertEqual(provider.get('PINECONE_DEV_KEY'), 'p1')
+        self.assertEqual(provider.get('GEMINI_DEV_KEY'), 'g1')
+        self.assertEqual(provider._client.requests, [['PINECONE_DEV_KEY', 'GEMINI_DEV_KEY']])
+        self.assertEqual(provider.fetches, 1)
+
+    def test_secrets_are_refetched_after_the_ttl(self):
+        provider = provider_with({'PINECONE_DEV_KEY': 'p1', 'GEMINI_DEV_KEY': 'g1'}, ttl=60)
+        with mock.patch('util.time.monotonic', return_value=1000.0):
+            provider.get('GEMINI_DEV_KEY')
+        provider._client.values['GEMINI_DEV_KEY'] = 'g2'
+        with mock.patch('util.time.monotonic', return_value=1059.0):
+            self.assertEqual(provider.get('GEMINI_DEV_KEY'), 'g1')
+        with mock.patch('util.time.monotonic', return_value=1061.0):
+            self.assertEqual(provider.get('GEMINI_DEV_KEY'), 'g2')
+        self.assertEqual(provider.fetches, 2)
+
+    def test_auth_failure_expires_the_cache(self):
+        provider = provider_with({'PINECONE_DEV_KEY': 'p1', 'GEMINI_DEV_KEY': 'g1'})
+        provider.get('PINECONE_DEV_KEY')
+        provider._client.values['PINECONE_DEV_KEY'] = 'p2'
+
+        self.assertFalse(provider.refresh_on_auth_failure(TimeoutError('read timed out')))
+        self.assertEqual(provider.get('PINECONE_DEV_KEY'), 'p1')
+        self.assertTrue(provider.refresh_on_auth_failure(AuthError('unauthorized')))
+        self.assertEqual(provider.get('PINECONE_DEV_KEY'), 'p2')
+        self.assertTrue(provider.refresh_on_auth_failure(ValueError('400 API key not valid. [reason: "API_KEY_INVALID"]')))
+        provider.get('PINECONE_DEV_KEY')
+        self.assertEqual(provider.fetches, 3)
+
+    def test_missing_secret_raises(self):
+        provider = provider_with({'PINECONE_DEV_KEY': 'p1'})
+        with self.assertRaisesRegex(ClientError, 'GEMINI_DEV_KEY'):
+            provider.get('GEMINI_DEV_KEY')
+
+    def test_other_missing_secrets_do_not_fail_the_request(self):
+        provider = provider_with({'PINECONE_DEV_KEY': 'p1'})
+
+        with self.assertLogs('secrets', 'WARNING'):
+            self.assertEqual(provider.get('PINECONE_DEV_KEY'), 'p1')
+        self.assertEqual(provider.get('PINECONE_DEV_KEY'), 'p1')
+        self.assertEqual(provider.fetches, 1)
+
+    def test_paged_responses_are_followed(self):
+        provider = provider_with({'PINECONE_DEV_KEY': 'p1', 'GEMINI_DEV_KEY': 'g1'})
+        provider._client.page_size = 1
+
+        self.assertEqual(provider.get('GEMINI_DEV_KEY'), 'g1')
+        self.assertEqual(provider.get('PINECONE_DEV_KEY'), 'p1')
+        self.assertEqual(len(provider._client.requests), 2)
+        self.assertEqual(provider.fetches, 1)
+
+    def test_secret_without_its_key_is_reported_by_name(self):
+        provider = provider_with({'PINECONE_DEV_KEY': 'p1'}, names=['PINECONE_DEV_KEY'])
+        provider._client.batch_get_secret_value = lambda SecretIdList: {
+            'SecretValues': [{'Name': 'PINECONE_DEV_KEY', 'SecretString': json.dumps({'other': 'x'})}]}
+
+        with self.assertRaisesRegex(KeyError, 'PINECONE_DEV_KEY'):
+            provider.get('PINECONE_DEV_KEY')
+
+
+class ColdStartTest(unittest.TestCase):
+
+    def test_import_fetches_no_secrets(self):
+        inference = load_lambda_inference()
+        self.assertEqual(inference.secrets.fetches, 0)
+        self.assertIsNone(inference.secrets._client)
+
+    def test_first_use_costs_one_round_trip(self):
+        provider = provider_with({'PINECONE_DEV_KEY': 'p', 'GEMINI_DEV_KEY': 'g'})
+
+        provider.get('PINECONE_DEV_KEY')
+        provider.get('GEMINI_DEV_KEY')
+
+        self.assertEqual(len(provider._client.requests), 1)
+
+
+class KeyedGemini:
+    """
+    Configured-genai stand-in that only works while its key is the current one.
+    """
+
+    def __init__(self, key, current):
+        self.key = key
+        self.current = current
+
+    def _check(self):
+        if self.key != self.current['key']:
+            raise AuthError(f'key {self.key} was revoked')
+
+    def embed_content(self, model, content, task_type=None):
+        self._check()
+        return FakeGemini().embed_content(model, content, task_type)
+
+    def GenerativeModel(self, name):
+        gemini = self
+        llm = FakeLLM(latency=0.0, chunk_latency=0.0)
+
+        class Model:
+            def generate_content(self, prompt, stream=False, **kwargs):
+                gemini._check()
+                return llm.generate_content(prompt, stream=stream)
+        return Model()
+
+
+class KeyRotationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.inference = load_lambda_inference()
+        self.current = {'key': 'g1'}
+        self.manager = StandInSecretsManager({'PINECONE_DEV_KEY': 'p1', 'GEMINI_DEV_KEY': 'g1'})
+        self.inference.secrets._client = self.manager
+        # Keep the real factories' hooks, with the stand-in in place of genai
+        inference = self.inference
+        inference.clients.register(
+            'gemini', lambda: KeyedGemini(inference.secrets.get('GEMINI_DEV_KEY'), self.current))
+        for name in inference.GENERATION_MODELS:
+            inference.clients.register(name, lambda name=name: inference._generative_model(name))
+
+    def rotate(self):
+        self.current['key'] = 'g2'
+        self.manager.values['GEMINI_DEV_KEY'] = 'g2'
+
+    def test_embedding_rebuilds_gemini_with_the_rotated_key(self):
+        self.inference.embed_question('first question')
+        self.rotate()
+        self.inference.embed_question('second question')
+        self.assertEqual(self.inference.clients.get('gemini').key, 'g2')
+        self.assertEqual(self.inference.secrets.fetches, 2)
+
+    def test_generation_rebuilds_models_with_the_rotated_key(self):
+        self.assertTrue(self.inference.generation_policy.generate('Context: one\n\nQuestion: ?').text)
+        self.rotate()
+        result = self.inference.generation_policy.generate('Context: two\n\nQuestion: ?')
+        self.assertTrue(result.text)
+        self.assertEqual(self.inference.clients.get('gemini').key, 'g2')
+
+
+if __name__ == '__main__':
+    unittest.main()
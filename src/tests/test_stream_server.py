@@ -0,0 +1,150 @@
+import http.client
+import io
+import json
+import os
+import sys
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+from unittest import mock
+
+from tests import REPO_ROOT, load_lambda_inference, load_module
+
+from fakes import FakeIndex, FakeLLM
+
+
+class FailsMidStream(FakeLLM):
+    """
+    FakeLLM whose stream breaks after its first chunk.
+    """
+
+    def _stream(self, parts):
+        yield SimpleNamespace(text=parts[0])
+        raise ConnectionError('stream reset by peer')
+
+
+class StreamServerTest(unittest.TestCase):
+
+    def serve(self, index=None, llm=None):
+        inference = load_lambda_inference(index=index, llm=llm)
+        # stream_server imports the Lambda module by its deployed name
+        with mock.patch.dict(sys.modules, {'inference': inference}):
+            module = load_module('stream_server', REPO_ROOT / 'src' / 'Inference' / 'stream_server.py')
+        server = ThreadingHTTPServer(('127.0.0.1', 0), module.StreamingHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.marker = module.STREAM_ERROR_MARKER
+        return server.server_port
+
+    def post(self, port, body):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        self.addCleanup(conn.close)
+        conn.request('POST', '/', body=json.dumps(body), headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        return response, response.read().decode()
+
+    def test_answer_is_streamed_in_chunks(self):
+        index = FakeIndex(latency=0.0)
+        index.upsert([('doc_0', [1.0] * 768, {'text': 'The Renard R.31 was a reconnaissance aircraft.'})])
+        port = self.serve(index=index)
+
+        response, body = self.post(port, {'question': 'What was the R.31?'})
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('Transfer-Encoding'), 'chunked')
+        self.assertIn('Renard', body)
+
+    def test_retrieval_failure_returns_a_server_error(self):
+        port = self.serve(index=FakeIndex(latency=0.0, failure_rate=1.0))
+
+        response, body = self.post(port, {'question': 'What was the R.31?'})
+
+        self.assertEqual(response.status, 500)
+        self.assertIn('injected failure', json.loads(body)['error'])
+
+    def test_generation_failure_before_the_first_chunk_returns_a_server_error(self):
+        port = self.serve(llm=FakeLLM(latency=0.0, chunk_latency=0.0, failure_rate=1.0))
+
+        response, body = self.post(port, {'question': 'What was the R.31?'})
+
+        self.assertEqual(response.status, 500)
+        self.assertIn('error', json.loads(body))
+
+    def test_failure_after_the_first_chunk_ends_the_stream_with_a_marker(self):
+        index = FakeIndex(latency=0.0)
+        index.upsert([('doc_0', [1.0] * 768, {'text': 'The Renard R.31 was a reconnaissance aircraft.'})])
+        port = self.serve(index=index, llm=FailsMidStream(latency=0.0, chunk_latency=0.0))
+
+        response, body = self.post(port, {'question': 'What was the R.31?'})
+
+        self.assertEqual(response.status, 200)
+        answer, marker, error = body.partition(self.marker)
+        self.assertTrue(answer)
+        self.assertEqual(marker, self.marker)
+        self.assertEqual(error, 'stream reset by peer')
+
+    def test_missing_question_is_rejected(self):
+        port = self.serve()
+        response, _ = self.post(port, {})
+        self.assertEqual(response.status, 400)
+
+    def test_body_that_is_not_an_object_is_rejected(self):
+        port = self.serve()
+        for body in (['What was the R.31?'], 'What was the R.31?', None):
+            with self.subTest(body=body):
+                response, text = self.post(port, body)
+                self.assertEqual(response.status, 400)
+                self.assertIn('JSON object', json.loads(text)['error'])
+
+
+class StreamCliTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = load_module('cli', REPO_ROOT / 'src' / 'main.py')
+
+    def stream(self, chunks):
+        response = SimpleNamespace(raise_for_status=lambda: None,
+                                   iter_content=lambda chunk_size, decode_unicode: iter(chunks))
+        output = io.StringIO()
+        with mock.patch.object(self.cli, 'INFERENCE_STREAM_URL', 'https://abc.lambda-url.eu-west-1.on.aws/'), \
+                mock.patch.object(self.cli, 'signed_headers', return_value={}), \
+                mock.patch.object(self.cli.requests, 'post', return_value=response), redirect_stdout(output):
+            answer = self.cli.stream_query('What was the R.31?')
+        return answer, output.getvalue()
+
+    def test_marker_split_across_chunks_is_recognised(self):
+        marker = self.cli.STREAM_ERROR_MARKER
+        for split in range(1, len(marker)):
+            with self.subTest(split=split):
+                chunks = ['The R.31 was', ' Belgian.' + marker[:split], marker[split:] + 'stream ', 'reset']
+                answer, printed = self.stream(chunks)
+
+                self.assertIsNone(answer)
+                self.assertTrue(printed.startswith('The R.31 was Belgian.\n'))
+                self.assertIn('Error while streaming the answer: stream reset', printed)
+                self.assertNotIn('[error]', printed)
+
+    def test_text_like_the_start_of_the_marker_is_kept(self):
+        answer, printed = self.stream(['It flew in 1932.\n', '[1] Source', ' list.\n'])
+
+        self.assertEqual(answer, 'It flew in 1932.\n[1] Source list.\n')
+        self.assertEqual(printed, answer + '\n')
+
+    def test_requests_to_the_function_url_are_signed(self):
+        credentials = {'AWS_ACCESS_KEY_ID': 'AKIDEXAMPLE', 'AWS_SECRET_ACCESS_KEY': 'secret', 'AWS_SESSION_TOKEN': ''}
+        with mock.patch.dict(os.environ, credentials):
+            headers = self.cli.signed_headers('https://abc.lambda-url.eu-west-1.on.aws/', b'{}')
+
+        self.assertIn('/eu-west-1/lambda/aws4_request', headers['Authorization'])
+
+    def test_stream_without_a_url_fails_clearly(self):
+        with mock.patch.object(self.cli, 'INFERENCE_STREAM_URL', None):
+            with self.assertRaisesRegex(ValueError, 'INFERENCE_STREAM_URL'):
+                self.cli.stream_query('What was the R.31?')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+import tests  # noqa: F401, puts the shared modules on sys.path
+
+from vector_store import IVFVectorStore, LocalVectorStore, QuantizedVectorStore
+
+DIMENSION = 16
+
+
+def batches(worker, count=40, size=10):
+    """
+    Disjoint batches of (id, values, metadata) for one writer thread.
+    """
+    rng = np.random.default_rng(worker)
+    for b in range(count):
+        vectors = rng.standard_normal((size, DIMENSION)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        yield [(f'w{worker}-{b}-{i}', vector.tolist(), {'worker': worker}) for i, vector in enumerate(vectors)]
+
+
+class ConcurrentUpsertTest(unittest.TestCase):
+    """
+    Writers grow the store past its initial capacity, which remaps the
+    matrix, while other threads are writing rows.
+    """
+
+    WORKERS = 8
+
+    def upsert_concurrently(self, store, expected=None):
+        expected = dict(expected or {})
+        errors = []
+        start = threading.Barrier(self.WORKERS)
+
+        def write(worker):
+            start.wait()
+            try:
+                for batch in batches(worker):
+                    store.upsert(batch)
+            except Exception as e:
+                errors.append(e)
+
+        for worker in range(self.WORKERS):
+            for batch in batches(worker):
+                expected.update((vector_id, values) for vector_id, values, _ in batch)
+        threads = [threading.Thread(target=write, args=(worker,)) for worker in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        store.flush()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(store), len(expected))
+        self.assertEqual(len(set(store.ids)), len(expected))
+        vectors = store.vectors()
+        for vector_id, row in store._rows.items():
+            self.assertEqual(store.ids[row], vector_id)
+            np.testing.assert_array_equal(vectors[row], np.asarray(expected[vector_id], dtype=np.float32))
+        return expected
+
+    def path(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return directory.name
+
+    def test_local_store(self):
+        path = self.path()
+        expected = self.upsert_concurrently(LocalVectorStore(path))
+        self.assertGreater(len(expected), LocalVectorStore.INITIAL_CAPACITY)
+
+        reopened = LocalVectorStore(path, read_only=True)
+        self.assertEqual(sorted(reopened.ids), sorted(expected))
+
+    def test_ivf_store(self):
+        store = IVFVectorStore(self.path(), nlist=8, auto_train_min=10 ** 9)
+        seed = next(batches(99, count=1, size=64))
+        store.upsert(seed)
+        store.train()
+
+        self.upsert_concurrently(store, {vector_id: values for vector_id, values, _ in seed})
+
+        self.assertEqual(len(store.ids), len(store._assignments[:len(store.ids)]))
+        expected = store._assign(np.asarray(store.vectors()))
+        np.testing.assert_array_equal(store._assignments[:len(store.ids)], expected)
+
+    def test_quantized_store(self):
+        store = QuantizedVectorStore(self.path())
+        expected = self.upsert_concurrently(store)
+
+        vector_id, values = next(iter(expected.items()))
+        self.assertEqual(store.query(values, top_k=1).matches[0]['id'], vector_id)
+
+    def test_concurrent_deletes_keep_rows_contiguous(self):
+        store = LocalVectorStore(self.path())
+        expected = {}
+        for worker in range(self.WORKERS):
+            for batch in batches(worker, count=5):
+                store.upsert(batch)
+                expected.update((vector_id, values) for vector_id, values, _ in batch)
+
+        def delete(worker):
+            store.delete([vector_id for vector_id in expected if vector_id.startswith(f'w{worker}-')])
+
+        threads = [threading.Thread(target=delete, args=(worker,)) for worker in range(0, self.WORKERS, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        kept = {vector_id for vector_id in expected if int(vector_id[1:].split('-')[0]) % 2}
+        self.assertEqual(set(store.ids), kept)
+        vectors = store.vectors()
+        for row, vector_id in enumerate(store.ids):
+            self.assertEqual(store._rows[vector_id], row)
+            np.testing.assert_array_equal(vectors[row], np.asarray(expected[vector_id], dtype=np.float32))
+
+
+if __name__ == '__main__':
+    unittest.main()